@@ -0,0 +1,399 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from importlib.metadata import version
+
+import numpy as np
+
+import mdt_reco
+
+# name -> (setup, unit). setup(inputs) returns (run, n_items), where run is the
+# timed callable and n_items the number of units it processes.
+BENCHMARKS = {}
+
+
+def benchmark(name, unit):
+    def register(setup):
+        BENCHMARKS[name] = (setup, unit)
+        return setup
+
+    return register
+
+
+def makeInputs(config, n_events, seed, tmp_dir):
+    """
+    Synthetic inputs of n_events generated muons, fixed by seed: the events, their
+    columnar batch, the track parameters of every muon and the encoded file.
+    """
+    generator = mdt_reco.gen(config, seed=seed)
+    sim_events = generator.simEvents(n_events)
+    track_params = generator.findTrajectories(B=0, sim_events=sim_events)
+    events = []
+    for A, C in zip(track_params["A"], track_params["C"], strict=True):
+        event = generator.createEvent(A, C)
+        if event is not None:
+            events.append(event)
+    signal = mdt_reco.signal(config)
+    raw_file = os.path.join(tmp_dir, f"events_{n_events}.bin")
+    if os.path.exists(raw_file):
+        os.remove(raw_file)
+    signal.encodeEvents(events, raw_file)
+
+    batch = mdt_reco.eventsToBatch(events)
+    tdc_hist = mdt_reco.hitHistogram.fromConfig(config, "tdc_time")
+    adc_hist = mdt_reco.hitHistogram.fromConfig(config, "adc_time")
+    tdc_hist.fillBatch(batch)
+    adc_hist.fillBatch(batch)
+    return {
+        "config": config,
+        "generator": generator,
+        "signal": signal,
+        "track_params": track_params,
+        "events": events,
+        "batch": batch,
+        "raw_file": raw_file,
+        "words": signal.readWords(raw_file),
+        "tdc_hist": tdc_hist,
+        "adc_hist": adc_hist,
+        "tmp_dir": tmp_dir,
+    }
+
+
+@benchmark("Signal.encodeEvents", "events")
+def encodeEvents(inputs):
+    output_file = os.path.join(inputs["tmp_dir"], "encoded.bin")
+
+    def run():
+        # encodeEvents appends, so every repeat starts from an empty file
+        if os.path.exists(output_file):
+            os.remove(output_file)
+        inputs["signal"].encodeEvents(inputs["events"], output_file)
+
+    return run, len(inputs["events"])
+
+
+@benchmark("Signal.decodeEvents", "events")
+def decodeEvents(inputs):
+    return (
+        lambda: inputs["signal"].decodeEvents(inputs["raw_file"]),
+        len(inputs["events"]),
+    )
+
+
+@benchmark("Signal.encodeWords", "events")
+def encodeWords(inputs):
+    rng = np.random.default_rng(0)
+    return (
+        lambda: inputs["signal"].encodeWords(inputs["batch"], rng=rng),
+        len(inputs["events"]),
+    )
+
+
+@benchmark("Signal.decodeWords", "events")
+def decodeWords(inputs):
+    return (
+        lambda: inputs["signal"].decodeWords(inputs["words"]),
+        len(inputs["events"]),
+    )
+
+
+@benchmark("Chamber", "chambers")
+def buildChamber(inputs):
+    def run():
+        mdt_reco.geo.clearCache()
+        mdt_reco.geo(inputs["config"])
+
+    return run, 1
+
+
+@benchmark("Chamber.getXY", "hits")
+def getXY(inputs):
+    chamber = mdt_reco.geo(inputs["config"])
+    tdc_ids = inputs["batch"]["tdc_id"][: len(inputs["events"])]
+    channels = inputs["batch"]["channel"][: len(inputs["events"])]
+
+    def run():
+        for tdc_id, channel in zip(tdc_ids, channels, strict=True):
+            chamber.getXY(tdc_id, channel)
+
+    return run, len(tdc_ids)
+
+
+@benchmark("Chamber.getTubeIndex", "hits")
+def getTubeIndex(inputs):
+    chamber = mdt_reco.geo(inputs["config"])
+    batch = inputs["batch"]
+    return (
+        lambda: chamber.getTubeIndex(
+            batch["csm_id"], batch["tdc_id"], batch["channel"]
+        ),
+        len(batch["tdc_id"]),
+    )
+
+
+@benchmark("Generator.createEvent", "muons")
+def createEvent(inputs):
+    generator = inputs["generator"]
+    track_params = inputs["track_params"]
+
+    def run():
+        for A, C in zip(track_params["A"], track_params["C"], strict=True):
+            generator.createEvent(A, C)
+
+    return run, len(track_params["A"])
+
+
+@benchmark("TrackFitter.fitCosmic", "events")
+def fitCosmic(inputs):
+    track_fitter = mdt_reco.trackFitter()
+    events = inputs["events"]
+
+    def run():
+        for event in events:
+            track_fitter.fitCosmic(event["x"], event["y"], event["drift_radius"])
+
+    return run, len(events)
+
+
+@benchmark("TrackFitter.fitCosmicBatch", "events")
+def fitCosmicBatch(inputs):
+    track_fitter = mdt_reco.trackFitter()
+    batch = inputs["batch"]
+    return (
+        lambda: track_fitter.fitCosmicBatch(
+            batch["x"], batch["y"], batch["drift_radius"], batch["event_offsets"]
+        ),
+        len(inputs["events"]),
+    )
+
+
+@benchmark("TDCFitter.getHisto", "hits")
+def getHisto(inputs):
+    tdc_fitter = mdt_reco.tdcFitter()
+    batch = inputs["batch"]
+    tdc_ids = np.unique(batch["tdc_id"])
+    time_binning = np.linspace(0, 1000, 201)
+
+    def run():
+        for tdc_id in tdc_ids:
+            tdc_fitter.getHisto(
+                tdc_id, batch["tdc_id"], batch["tdc_time"], time_binning
+            )
+
+    return run, len(batch["tdc_id"])
+
+
+def _channelHistograms(hist, bins):
+    """The non-empty (tdc, channel) histograms of hist rebinned to bins bins."""
+    tdc_fitter = mdt_reco.tdcFitter()
+    edges = np.linspace(hist.bin_edges[0], hist.bin_edges[-1], bins + 1)
+    counts, centers = tdc_fitter.rebinHisto(hist.counts, hist.bin_edges, edges)
+    counts = counts.reshape(-1, bins)
+    return counts[counts.sum(axis=1) > 0], centers
+
+
+def _fitEach(fit, hist, bins):
+    counts, centers = _channelHistograms(hist, bins)
+
+    def run():
+        for channel_counts in counts:
+            fit(channel_counts, centers)
+
+    return run, len(counts)
+
+
+@benchmark("TDCFitter.fitT0", "histograms")
+def fitT0(inputs):
+    return _fitEach(mdt_reco.tdcFitter().fitT0, inputs["tdc_hist"], 50)
+
+
+@benchmark("TDCFitter.fitTMax", "histograms")
+def fitTMax(inputs):
+    return _fitEach(mdt_reco.tdcFitter().fitTMax, inputs["tdc_hist"], 50)
+
+
+@benchmark("TDCFitter.fitADC", "histograms")
+def fitADC(inputs):
+    return _fitEach(mdt_reco.tdcFitter().fitADC, inputs["adc_hist"], 50)
+
+
+@benchmark("RTCalibrator.calibrate", "events")
+def calibrateRT(inputs):
+    calibrator = mdt_reco.rtCalibrator(inputs["config"])
+    return lambda: calibrator.calibrate(inputs["batch"]), len(inputs["events"])
+
+
+def measure(run, repeats):
+    """Best wall time of repeats calls, then the peak traced memory of one more."""
+    times = []
+    # Progress printed by the functions under test is dropped
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(repeats):
+            start = time.perf_counter()
+            run()
+            times.append(time.perf_counter() - start)
+        tracemalloc.start()
+        try:
+            run()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+    return min(times), peak
+
+
+def machineInfo():
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "numpy": version("numpy"),
+        "numba": version("numba"),
+    }
+
+
+def compare(results, baseline, tolerance):
+    """
+    Print every result next to its baseline and return the regressions: a
+    throughput more than tolerance below, or a peak memory more than tolerance
+    above, the baseline.
+    """
+    regressions = []
+    for name, sizes in results["results"].items():
+        for size, result in sizes.items():
+            reference = baseline["results"].get(name, {}).get(size)
+            if reference is None:
+                print(f"{name:28s} {size:>7s} no baseline")
+                continue
+            speed = result["throughput"] / reference["throughput"]
+            memory = (result["peak_memory_mb"] + 1e-3) / (
+                reference["peak_memory_mb"] + 1e-3
+            )
+            flags = []
+            if speed < 1 - tolerance:
+                flags.append("SLOWER")
+            if memory > 1 + tolerance and result["peak_memory_mb"] > 1:
+                flags.append("MORE MEMORY")
+            if flags:
+                regressions.append((name, size, flags))
+            print(
+                f"{name:28s} {size:>7s} throughput x{speed:6.2f} "
+                f"memory x{memory:6.2f} {' '.join(flags)}"
+            )
+    return regressions
+
+
+def main():
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(
+        description="Time the hot paths of mdt_reco on synthetic inputs"
+    )
+    parser.add_argument(
+        "--config",
+        type=str,
+        default="ci_config.yaml",
+        help="Config in ../configs the inputs are generated from",
+    )
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=[1000, 5000],
+        help="Numbers of generated muons",
+    )
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=2025)
+    parser.add_argument(
+        "--only", type=str, nargs="+", help="Run only the benchmarks with these names"
+    )
+    parser.add_argument("--output", type=str, help="Optional JSON output file")
+    parser.add_argument(
+        "--baseline",
+        type=str,
+        default=os.path.join(script_dir, "baseline.json"),
+        help="JSON results to compare against",
+    )
+    parser.add_argument(
+        "--update_baseline",
+        action="store_true",
+        help="Write the results to --baseline instead of comparing",
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.25,
+        help="Relative change counted as a regression",
+    )
+    parser.add_argument(
+        "--check",
+        action="store_true",
+        help="Exit with status 1 when any benchmark regressed",
+    )
+    args = parser.parse_args()
+
+    config_path = os.path.join(script_dir, "../configs", args.config)
+    config = mdt_reco.configParser(config_path)
+    mdt_reco.warmup()
+    names = args.only if args.only is not None else list(BENCHMARKS)
+    unknown = set(names) - set(BENCHMARKS)
+    if unknown:
+        msg = f"Unknown benchmark(s): {', '.join(sorted(unknown))}"
+        raise ValueError(msg)
+
+    results = {
+        "machine": machineInfo(),
+        "config": args.config,
+        "seed": args.seed,
+        "results": {name: {} for name in names},
+    }
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for size in args.sizes:
+            inputs = makeInputs(config, size, args.seed, tmp_dir)
+            for name in names:
+                setup, unit = BENCHMARKS[name]
+                run, n_items = setup(inputs)
+                seconds, peak = measure(run, args.repeats)
+                results["results"][name][str(size)] = {
+                    "seconds": seconds,
+                    "items": n_items,
+                    "unit": unit,
+                    "throughput": n_items / seconds,
+                    "peak_memory_mb": peak / 2**20,
+                }
+                print(
+                    f"{name:28s} {size:7d} {n_items / seconds:12.1f} {unit}/s "
+                    f"{peak / 2**20:8.2f} MB"
+                )
+
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.update_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline written to {args.baseline}")
+        return 0
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}, run with --update_baseline")
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if baseline["machine"] != results["machine"]:
+        print("Baseline was measured on another machine, ratios are indicative only")
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        print(f"{len(regressions)} regression(s) beyond {args.tolerance:.0%}")
+        return 1 if args.check else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
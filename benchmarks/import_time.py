@@ -0,0 +1,69 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+# Each snippet runs in a fresh interpreter and prints its own wall time and peak RSS.
+SNIPPET = """
+import resource, sys, time
+start = time.perf_counter()
+{statement}
+elapsed = time.perf_counter() - start
+rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(elapsed, rss_kb, "matplotlib" in sys.modules)
+"""
+
+STATEMENTS = {
+    "mdt_reco": "import mdt_reco",
+    "mdt_reco+plotting": "import mdt_reco, mdt_reco.Plotting",
+}
+
+
+def measure(statement, repeats):
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(
+        [os.path.join(script_dir, "../src"), env.get("PYTHONPATH", "")]
+    )
+    env.setdefault("MPLBACKEND", "Agg")
+    times = []
+    rss = []
+    for _ in range(repeats):
+        output = subprocess.run(
+            [sys.executable, "-c", SNIPPET.format(statement=statement)],
+            env=env,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.split()
+        times.append(float(output[0]))
+        rss.append(int(output[1]))
+        matplotlib_loaded = output[2] == "True"
+    return {
+        "import_time_s": min(times),
+        "peak_rss_mb": min(rss) / 1024,
+        "matplotlib_loaded": matplotlib_loaded,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure mdt_reco import cost")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--output", type=str, help="Optional JSON output file")
+    args = parser.parse_args()
+
+    results = {name: measure(stmt, args.repeats) for name, stmt in STATEMENTS.items()}
+    for name, result in results.items():
+        print(
+            f"{name:20s} {result['import_time_s'] * 1e3:8.1f} ms "
+            f"{result['peak_rss_mb']:8.1f} MB "
+            f"matplotlib loaded: {result['matplotlib_loaded']}"
+        )
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
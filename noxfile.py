@@ -1,8 +1,20 @@
 import nox
 
+nox.options.sessions = ["tests"]
+
 
 @nox.session()
 def tests(session: nox.Session) -> None:
-    """Run all tests."""
-    print("This is a test stand-in! Go muons!")
+    """Run all tests, passing options through to pytest, e.g. nox -- -k signal."""
+    session.install(".", "pytest")
+    session.run("pytest", *session.posargs)
+
 
+@nox.session()
+def benchmarks(session: nox.Session) -> None:
+    """
+    Time the hot paths and compare them against benchmarks/baseline.json. Not run
+    by default; pass options through, e.g. nox -s benchmarks -- --check.
+    """
+    session.install(".")
+    session.run("python", "benchmarks/hot_paths.py", *session.posargs)
@@ -3,6 +3,7 @@ import os
 import pickle
 
 import mdt_reco
+from mdt_reco import Profiling
 
 
 def main():
@@ -10,12 +11,29 @@ def main():
     parser.add_argument(
         "--config", type=str, required=True, help="Path to the configuration file"
     )
+    parser.add_argument(
+        "--calibration",
+        type=str,
+        help="TDC calibration (.npz from fitTDCs.py) used to fill drift_time",
+    )
+    parser.add_argument(
+        "--run",
+        type=int,
+        help="Run number of the input, checked against the run range of --calibration",
+    )
+    parser.add_argument(
+        "--no_cache",
+        action="store_true",
+        help="Decode again even if the input file and config are unchanged",
+    )
     args = parser.parse_args()
 
     script_dir = os.path.dirname(os.path.abspath(__file__))
     config_path = os.path.join(script_dir, "../configs", args.config)
     config = mdt_reco.configParser(config_path)
+    Profiling.configure(config)
     signal_object = mdt_reco.Signal(config)
+    event_filter = mdt_reco.eventFilter.fromConfig(config)
 
     input_dir = f"{script_dir}/../raw_data"
     file_path = f"{input_dir}/{config['General']['input_file']}.bin"
@@ -23,16 +41,54 @@ def main():
         msg = f"Input file {file_path} does not exist. Please provide a valid file."
         raise FileNotFoundError(msg)
 
-    print(f"Decoding events from {file_path}")
-    events = signal_object.decodeEvents(file_path)
-
     output_dir = f"{script_dir}/../output/{config['General']['run_name']}"
     os.makedirs(output_dir, exist_ok=True)
-    output_file = f"{output_dir}/{config['General']['input_name']}.pkl"
+    output_file = f"{output_dir}/{config['General']['input_file']}.pkl"
+
+    # Checked before the cache lookup so a cached decode is checked as well
+    calibration = None
+    if args.calibration is not None:
+        calibration = mdt_reco.tdcCalibration.load(args.calibration)
+        calibration.checkRun(args.run)
+        # Filtered events lose the file's event numbering the t0 table is sliced in
+        if calibration.event_sliced and event_filter is not None:
+            parser.error(
+                f"{calibration} has a t0 table sliced in event_number, which "
+                "cannot be applied to filtered events"
+            )
+        if calibration.bounded and args.run is None:
+            print(
+                f"Warning: {calibration} is only valid for runs "
+                f"{calibration.run_range}, pass --run to check the input"
+            )
+
+    def decode(events_file):
+        print(f"Decoding events from {file_path}")
+        if event_filter is not None:
+            print(f"Keeping events passing {event_filter}")
+        events = signal_object.decodeEvents(file_path, event_filter)
+        if calibration is not None:
+            calibration.applyEvents(events, event_offset=0)
+            print(f"Applied {calibration}")
+        with open(events_file, "wb") as f:
+            pickle.dump(events, f)
 
-    with open(output_file, "wb") as f:
-        pickle.dump(events, f)
+    cache = mdt_reco.stageCache(
+        f"{script_dir}/../output/cache", enabled=not args.no_cache
+    )
+    input_files = [file_path]
+    if args.calibration is not None:
+        input_files.append(args.calibration)
+    key = cache.key(
+        "decode",
+        config,
+        ["Signal", "Reconstruction", "Filter", "Geometry"],
+        input_files,
+    )
+    cache.cachedFile("decode", key, output_file, decode)
     print(f"Decoded events saved to {output_file}")
+    run_dir = f"{script_dir}/../output/{config['General']['run_name']}"
+    Profiling.finish(f"{run_dir}/profiles/decoder.json")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,51 @@
+import argparse
+import os
+import pickle
+
+import mdt_reco
+from mdt_reco import Profiling
+from mdt_reco.Plotting import renderEvents
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--config", type=str, required=True, help="Path to the configuration file"
+    )
+    parser.add_argument(
+        "--n_events", type=int, default=None, help="Draw only the first n events"
+    )
+    parser.add_argument(
+        "--format", type=str, default="png", help="File format of the displays"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Worker processes, defaults to the number of CPUs",
+    )
+    args = parser.parse_args()
+
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    config_path = os.path.join(script_dir, "../configs", args.config)
+    config = mdt_reco.configParser(config_path)
+    Profiling.configure(config)
+    output_dir = f"{script_dir}/../output/{config['General']['run_name']}"
+    display_dir = os.path.join(output_dir, "figures", "event_displays")
+
+    input_file = f"{output_dir}/{config['General']['input_file']}.pkl"
+    with open(input_file, "rb") as f:
+        events = pickle.load(f)
+    if args.n_events is not None:
+        events = events[: args.n_events]
+
+    renderEvents(
+        events, config, display_dir, file_ext=args.format, workers=args.workers
+    )
+    print(f"Saved {len(events)} event displays to {display_dir}")
+    run_dir = f"{script_dir}/../output/{config['General']['run_name']}"
+    Profiling.finish(f"{run_dir}/profiles/drawEvents.json")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,6 +3,7 @@ import os
 import pickle
 
 import mdt_reco
+from mdt_reco import Profiling
 
 
 def main():
@@ -22,21 +23,36 @@ def main():
         required=True,
         help="Output file name for encoded events",
     )
+    parser.add_argument(
+        "--no_cache",
+        action="store_true",
+        help="Encode again even if the input file and config are unchanged",
+    )
     args = parser.parse_args()
 
     script_dir = os.path.dirname(os.path.abspath(__file__))
     config_path = os.path.join(script_dir, "../configs", args.config)
     config = mdt_reco.configParser(config_path)
+    Profiling.configure(config)
     signal_object = mdt_reco.Signal(config)
 
-    with open(args.input_name, "rb") as f:
-        events = pickle.load(f)
-
     output_dir = f"{script_dir}/../raw_data"
     os.makedirs(output_dir, exist_ok=True)
     output_file = f"{output_dir}/{args.output_name}.bin"
-    signal_object.encodeEvents(events, output_file)
+
+    def encode(binary_file):
+        with open(args.input_name, "rb") as f:
+            events = pickle.load(f)
+        signal_object.encodeEvents(events, binary_file)
+
+    cache = mdt_reco.stageCache(
+        f"{script_dir}/../output/cache", enabled=not args.no_cache
+    )
+    key = cache.key("encode", config, ["Signal"], [args.input_name])
+    cache.cachedFile("encode", key, output_file, encode)
     print(f"Encoded events saved to {output_file}")
+    run_dir = f"{script_dir}/../output/{config['General']['run_name']}"
+    Profiling.finish(f"{run_dir}/profiles/encoder.json")
 
 
 if __name__ == "__main__":
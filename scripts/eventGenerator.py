@@ -3,6 +3,7 @@ import os
 import pickle
 
 import mdt_reco
+from mdt_reco import Profiling
 
 
 def main():
@@ -11,35 +12,56 @@ def main():
         "--config", "-c", required=True, help="Path to config YAML file"
     )
     parser.add_argument("--seed", type=int, help="Random seed for reproducibility")
+    parser.add_argument(
+        "--no_cache",
+        action="store_true",
+        help="Generate again even if the seed and config are unchanged",
+    )
     args = parser.parse_args()
 
     script_dir = os.path.dirname(os.path.abspath(__file__))
     config_path = os.path.join(script_dir, "../configs", args.config)
     config = mdt_reco.configParser(config_path)
+    Profiling.configure(config)
 
-    generator = mdt_reco.gen(config, seed=args.seed)
+    def generate():
+        generator = mdt_reco.gen(config, seed=args.seed)
 
-    sim_events = generator.simEvents(config["Simulator"]["nevents"])
-    track_params = generator.findTrajectories(B=0, sim_events=sim_events)
+        sim_events = generator.simEvents(config["Simulator"]["nevents"])
+        track_params = generator.findTrajectories(B=0, sim_events=sim_events)
 
-    events = []
-    event_params = []
-    for A, C in zip(track_params["A"], track_params["C"], strict=False):
-        event = generator.createEvent(A, C)
-        if event is not None:
-            events.append(event)
-            event_params.append({"A": A, "C": C})
+        events = []
+        event_params = []
+        for A, C in zip(track_params["A"], track_params["C"], strict=False):
+            event = generator.createEvent(A, C)
+            if event is not None:
+                events.append(event)
+                event_params.append({"A": A, "C": C})
+        # Pickled here so a cache hit writes the same bytes and the keys of the
+        # stages reading them stay the same (Event pickles a set, whose order
+        # changes from one process to the next)
+        return pickle.dumps(events), pickle.dumps(event_params), len(events)
+
+    # Without a seed every run is a new sample, so only seeded runs are cached
+    cache = mdt_reco.stageCache(
+        f"{script_dir}/../output/cache",
+        enabled=args.seed is not None and not args.no_cache,
+    )
+    key = cache.key("generate", config, ["Simulator", "Geometry"], seed=args.seed)
+    events, event_params, n_events = cache.cached("generate", key, generate)
 
     output_dir = f"{script_dir}/../output/{config['General']['run_name']}"
     os.makedirs(output_dir, exist_ok=True)
     with open(
         f"{output_dir}/sim_events_{config['Simulator']['nevents']}.pkl", "wb"
     ) as f:
-        pickle.dump(events, f)
+        f.write(events)
 
     with open(f"{output_dir}/track_params.pkl", "wb") as f:
-        pickle.dump(event_params, f)
-    print(f"Generated {len(events)} events and saved to {output_dir}")
+        f.write(event_params)
+    print(f"Generated {n_events} events and saved to {output_dir}")
+    run_dir = f"{script_dir}/../output/{config['General']['run_name']}"
+    Profiling.finish(f"{run_dir}/profiles/eventGenerator.json")
 
 
 if __name__ == "__main__":
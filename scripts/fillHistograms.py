@@ -0,0 +1,69 @@
+import argparse
+import os
+import pickle
+
+import mdt_reco
+from mdt_reco import Profiling
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Fill mergeable TDC and ADC histograms from decoded events"
+    )
+    parser.add_argument(
+        "--config", type=str, required=True, help="Path to the configuration file"
+    )
+    parser.add_argument(
+        "--input_files",
+        type=str,
+        nargs="+",
+        required=True,
+        help="Pickled event files to histogram",
+    )
+    parser.add_argument(
+        "--output_name",
+        type=str,
+        required=True,
+        help="Prefix of the output histogram files",
+    )
+    parser.add_argument(
+        "--no_cache",
+        action="store_true",
+        help="Fill again even if the input files and config are unchanged",
+    )
+    args = parser.parse_args()
+
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    config_path = os.path.join(script_dir, "../configs", args.config)
+    config = mdt_reco.configParser(config_path)
+    Profiling.configure(config)
+
+    def fillHistograms():
+        tdc_hist = mdt_reco.hitHistogram.fromConfig(config, "tdc_time")
+        adc_hist = mdt_reco.hitHistogram.fromConfig(config, "adc_time")
+        for input_file in args.input_files:
+            with open(input_file, "rb") as f:
+                events = pickle.load(f)
+            tdc_hist.fillEvents(events)
+            adc_hist.fillEvents(events)
+            del events  # Free memory
+        return tdc_hist, adc_hist
+
+    cache = mdt_reco.stageCache(
+        f"{script_dir}/../output/cache", enabled=not args.no_cache
+    )
+    key = cache.key("histograms", config, ["TDCFitting"], args.input_files)
+    tdc_hist, adc_hist = cache.cached("histograms", key, fillHistograms)
+
+    output_dir = f"{script_dir}/../output/{config['General']['run_name']}/histograms"
+    os.makedirs(output_dir, exist_ok=True)
+    output_prefix = f"{output_dir}/{args.output_name}"
+    tdc_hist.save(f"{output_prefix}_tdc_time.npz")
+    adc_hist.save(f"{output_prefix}_adc_time.npz")
+    print(f"Histograms of {tdc_hist.entries} hits saved to {output_prefix}_*.npz")
+    run_dir = f"{script_dir}/../output/{config['General']['run_name']}"
+    Profiling.finish(f"{run_dir}/profiles/fillHistograms.json")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,6 +5,7 @@ import pickle
 import numpy as np
 
 import mdt_reco
+from mdt_reco import Profiling
 
 # import matplotlib.pyplot as plt
 # import mplhep as hep
@@ -16,106 +17,138 @@ def gaussian(x, A, mu, sigma):
     return A * np.exp(-0.5 * ((x - mu) / sigma) ** 2)
 
 
-# NEEDS TO BE REFACTORED
-def main():  # noqa: PLR0915
+def main():
     parser = argparse.ArgumentParser()
     parser.add_argument(
         "--config", type=str, required=True, help="Path to the configuration file"
     )
+    parser.add_argument(
+        "--histograms",
+        type=str,
+        nargs="+",
+        help="Histogram file prefixes written by fillHistograms.py to merge "
+        "instead of reading the events file",
+    )
+    parser.add_argument(
+        "--time_slices",
+        type=int,
+        help="Also fit t0 in this many slices of the event number to follow t0 "
+        "drifting during the run",
+    )
+    parser.add_argument(
+        "--bootstrap",
+        type=int,
+        help="Estimate t0/tmax uncertainties from this many Poisson resamplings "
+        "of the tdc_bins channel histograms",
+    )
+    parser.add_argument(
+        "--calibration_version",
+        type=int,
+        default=1,
+        help="Version number stored with the calibration",
+    )
+    parser.add_argument(
+        "--run_range",
+        type=int,
+        nargs=2,
+        default=(None, None),
+        metavar=("FIRST_RUN", "LAST_RUN"),
+        help="Runs the calibration is valid for (inclusive)",
+    )
+    parser.add_argument(
+        "--no_cache",
+        action="store_true",
+        help="Fit again even if the inputs, options and config are unchanged",
+    )
     args = parser.parse_args()
+    if args.histograms and args.time_slices is not None:
+        parser.error(
+            "--time_slices slices the events file, it cannot be combined with "
+            "--histograms"
+        )
 
     script_dir = os.path.dirname(os.path.abspath(__file__))
     config_path = os.path.join(script_dir, "../configs", args.config)
     config = mdt_reco.configParser(config_path)
-    max_iter = config["TDCFitting"]["max_iterations"]
-
-    tdcFitter = mdt_reco.tdcFitter()
-    input_file = f"{script_dir}/../output/{config['General']['run_name']}/{config['General']['input_file']}.pkl"
-    with open(input_file, "rb") as f:
-        events = pickle.load(f)
-
-    tdc_ids, tdc_times, adc_times, tdc_channels = tdcFitter.getTDCInfo(events)
-    del events  # Free memory
-    active_tdcs = np.unique(tdc_ids)
-
-    adc_max = config["TDCFitting"]["adc_max"]
-    adc_min = config["TDCFitting"]["adc_min"]
-    adc_bins = config["TDCFitting"]["adc_bins"]
-    adc_range = np.linspace(adc_min, adc_max, adc_bins + 1)
-    tdc_max = config["TDCFitting"]["tdc_max"]
-    tdc_min = config["TDCFitting"]["tdc_min"]
-    tdc_bins = config["TDCFitting"]["tdc_bins"]
-    tdc_range = np.linspace(tdc_min, tdc_max, tdc_bins + 1)
-    active_tdcs = np.unique(tdc_ids)
-
-    tdc_history = {}
-    tdc_histos = {}
-    adc_histos = {}
-    for tdc_id in active_tdcs:
-        tdc_history[tdc_id] = {}
-        tdc_histos[tdc_id] = {}
-        adc_histos[tdc_id] = {}
-
-        tdc_history[tdc_id]["All_Channels"] = {"t0": 0, "tmax": 0}
-        tdc_histos[tdc_id]["All_Channels"] = tdcFitter.getHisto(
-            tdc_id, tdc_ids, tdc_times, tdc_range
-        )
-        adc_histos[tdc_id]["All_Channels"] = tdcFitter.getHisto(
-            tdc_id, tdc_ids, adc_times, adc_range
-        )
-        active_channels = np.unique(tdc_channels[tdc_ids == tdc_id])
-
-        for channel in active_channels:
-            tdc_history[tdc_id][channel] = {"t0": 0, "tmax": 0}
-            tdc_histos[tdc_id][channel] = tdcFitter.getHisto(
-                tdc_id, tdc_ids, tdc_times, tdc_range, channel, tdc_channels
-            )
-            adc_histos[tdc_id][channel] = tdcFitter.getHisto(
-                tdc_id, tdc_ids, adc_times, adc_range, channel, tdc_channels
-            )
-
-    # PLOT HISTOS HERE
-
-    # CALCUATE TDC CALIBRATION
-    for i in range(max_iter):
-        tdc_histos = {}
-        tdc_range = np.linspace(tdc_min, tdc_max, 51 + int(50 * i / max_iter))
-        for tdc_id in active_tdcs:
-            tdc_histos[tdc_id] = {}
-            tdc_histos[tdc_id]["All_Channels"] = tdcFitter.getHisto(
-                tdc_id, tdc_ids, tdc_times, tdc_range
-            )
-
-            bin_centers = tdc_histos[tdc_id]["All_Channels"][1]
-            counts = tdc_histos[tdc_id]["All_Channels"][0]
-            t0 = tdcFitter.fitT0(counts, bin_centers, n_steps=1000)
-            tmax = tdcFitter.fitTMax(counts, bin_centers, n_steps=1000)
-
-            tdc_history[tdc_id]["All_Channels"]["t0"] += t0
-            tdc_history[tdc_id]["All_Channels"]["tmax"] += tmax
-
-            active_channels = np.unique(tdc_channels[tdc_ids == tdc_id])
-            for channel in active_channels:
-                tdc_histos[tdc_id][channel] = tdcFitter.getHisto(
-                    tdc_id, tdc_ids, tdc_times, tdc_range, channel, tdc_channels
-                )
-                bin_centers = tdc_histos[tdc_id][channel][1]
-                counts = tdc_histos[tdc_id][channel][0]
-
-                t0 = tdcFitter.fitT0(counts, bin_centers, n_steps=1000)
-                tmax = tdcFitter.fitTMax(counts, bin_centers, n_steps=1000)
-
-                tdc_history[tdc_id][channel]["t0"] += t0
-                tdc_history[tdc_id][channel]["tmax"] += tmax
+    Profiling.configure(config)
+    cache = mdt_reco.stageCache(
+        f"{script_dir}/../output/cache", enabled=not args.no_cache
+    )
 
-    for _tdc_id, channels in tdc_history.items():
-        for _channel, values in channels.items():
-            values["t0"] /= max_iter
-            values["tmax"] /= max_iter
+    if args.histograms:
+        input_files = [
+            f"{prefix}_{key}.npz"
+            for prefix in args.histograms
+            for key in ("tdc_time", "adc_time")
+        ]
+    else:
+        input_files = [
+            f"{script_dir}/../output/{config['General']['run_name']}/{config['General']['input_file']}.pkl"
+        ]
+    key = cache.key(
+        "tdc_calibration",
+        config,
+        ["TDCFitting", "Geometry"],
+        input_files,
+        time_slices=args.time_slices,
+        bootstrap=args.bootstrap,
+        calibration_version=args.calibration_version,
+        run_range=list(args.run_range),
+    )
+    tdc_history, calibration = cache.cached(
+        "tdc_calibration",
+        key,
+        lambda: mdt_reco.fitTDCCalibration(
+            config,
+            *loadHistograms(config, args, input_files, cache),
+            version=args.calibration_version,
+            run_range=args.run_range,
+            bootstrap=args.bootstrap,
+            chamber_cache_dir=cache.stageDir("chamber") if cache.enabled else None,
+        ),
+    )
 
     output_dir = f"{script_dir}/../output/{config['General']['run_name']}"
     os.makedirs(output_dir, exist_ok=True)
     np.save(f"{output_dir}/tdc_calibration.npy", tdc_history)
+    calibration.save(f"{output_dir}/tdc_calibration.npz")
+    print(f"Saved {calibration} to {output_dir}/tdc_calibration.npz")
+    run_dir = f"{script_dir}/../output/{config['General']['run_name']}"
+    Profiling.finish(f"{run_dir}/profiles/fitTDCs.json")
+
+
+def loadHistograms(config, args, input_files, cache):
+    if args.histograms:
+        # Reduce step: merge histograms filled by fillHistograms.py
+        tdc_hist = sum(
+            mdt_reco.hitHistogram.load(f"{prefix}_tdc_time.npz")
+            for prefix in args.histograms
+        )
+        adc_hist = sum(
+            mdt_reco.hitHistogram.load(f"{prefix}_adc_time.npz")
+            for prefix in args.histograms
+        )
+        return tdc_hist, adc_hist
+
+    def fillHistograms():
+        with open(input_files[0], "rb") as f:
+            events = pickle.load(f)
+        tdc_hist = mdt_reco.hitHistogram.fromConfig(config, "tdc_time")
+        adc_hist = mdt_reco.hitHistogram.fromConfig(config, "adc_time")
+        if args.time_slices is not None:
+            # Slices are filled in the same pass, the static histogram is their sum
+            tdc_hist = mdt_reco.hitHistogram(
+                tdc_hist.bin_edges,
+                slice_edges=np.linspace(0, len(events), args.time_slices + 1),
+            )
+        tdc_hist.fillEvents(events)
+        adc_hist.fillEvents(events)
+        return tdc_hist, adc_hist
+
+    # Same key as fillHistograms.py when the histograms are not sliced
+    slicing = {} if args.time_slices is None else {"time_slices": args.time_slices}
+    key = cache.key("histograms", config, ["TDCFitting"], input_files, **slicing)
+    return cache.cached("histograms", key, fillHistograms)
 
 
 if __name__ == "__main__":
@@ -128,7 +161,9 @@ if __name__ == "__main__":
 #         bin_counts = tdc_histos[tdc_id][key][0]
 #         bin_width = bin_centers[1] - bin_centers[0]
 #         bin_widths = bin_width*np.ones_like(bin_centers)
-#         bin_edges = np.concatenate(([bin_centers[0] - bin_width/2], bin_centers + bin_width/2))
+#         bin_edges = np.concatenate(
+#             ([bin_centers[0] - bin_width / 2], bin_centers + bin_width / 2)
+#         )
 #         #plt.bar(bin_centers, bin_counts, bin_widths)
 #         fig, ax = plt.subplots(figsize=(8,8))
 #         if key == "All Channels":
@@ -155,7 +190,9 @@ if __name__ == "__main__":
 #         bin_counts = adc_histos[tdc_id][key][0]
 #         bin_width = bin_centers[1] - bin_centers[0]
 #         bin_widths = bin_width*np.ones_like(bin_centers)
-#         bin_edges = np.concatenate(([bin_centers[0] - bin_width/2], bin_centers + bin_width/2))
+#         bin_edges = np.concatenate(
+#             ([bin_centers[0] - bin_width / 2], bin_centers + bin_width / 2)
+#         )
 #         #plt.bar(bin_centers, bin_counts, bin_widths)
 #         fig, ax = plt.subplots(figsize=(8,8))
 #         if key == "All Channels":
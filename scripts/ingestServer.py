@@ -0,0 +1,118 @@
+import argparse
+import asyncio
+import contextlib
+import os
+
+import numpy as np
+
+import mdt_reco
+from mdt_reco import Profiling
+
+
+def printSummary(summary):
+    dropped = f"{summary['dropped_events']} events dropped"
+    if summary["n_datagrams"]:
+        dropped += (
+            f" ({summary['dropped_datagrams']} of {summary['n_datagrams']} datagrams)"
+        )
+    if summary["overflowed_datagrams"]:
+        dropped += (
+            f", {summary['overflowed_datagrams']} datagrams lost to a full "
+            "socket buffer"
+        )
+    print(
+        f"{summary['n_events']} events ({summary['event_rate']:.1f}/s), "
+        f"{summary['n_bytes'] / 2**20:.1f} MB ({summary['byte_rate'] / 2**20:.2f} MB/s)"
+        f", {summary['pending_batches']} batches pending, {dropped}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Receive Phase2 words over TCP or UDP and decode, histogram "
+        "and optionally fit them as they arrive"
+    )
+    parser.add_argument(
+        "--config", type=str, required=True, help="Path to the configuration file"
+    )
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--protocol", choices=["tcp", "udp"], default="tcp")
+    parser.add_argument(
+        "--workers", type=int, help="Worker processes, all CPUs by default"
+    )
+    parser.add_argument(
+        "--max_pending",
+        type=int,
+        help="Batches in the workers at once before backpressure, 2 per worker "
+        "by default",
+    )
+    parser.add_argument(
+        "--calibration",
+        type=str,
+        help="TDC calibration (.npz from fitTDCs.py), needed to fit tracks",
+    )
+    parser.add_argument(
+        "--rt_function",
+        type=str,
+        help="r(t) (.npz from rtFitter.py), fits tracks together with --calibration",
+    )
+    parser.add_argument("--duration", type=float, help="Stop after this many seconds")
+    parser.add_argument(
+        "--report_interval",
+        type=float,
+        default=5.0,
+        help="Seconds between reports",
+    )
+    args = parser.parse_args()
+
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    config_path = os.path.join(script_dir, "../configs", args.config)
+    config = mdt_reco.configParser(config_path)
+    Profiling.configure(config)
+    calibration = None
+    if args.calibration is not None:
+        calibration = mdt_reco.tdcCalibration.load(args.calibration)
+    rt_function = None
+    if args.rt_function is not None:
+        rt_function = mdt_reco.rtFunction.load(args.rt_function)
+
+    server = mdt_reco.ingestServer(
+        config,
+        host=args.host,
+        port=args.port,
+        protocol=args.protocol,
+        workers=args.workers,
+        max_pending=args.max_pending,
+        calibration=calibration,
+        rt_function=rt_function,
+    )
+    print(
+        f"Warming up the workers, then listening on "
+        f"{args.protocol}://{args.host}:{args.port}"
+    )
+    with contextlib.suppress(KeyboardInterrupt):
+        asyncio.run(
+            server.serve(args.duration, args.report_interval, report=printSummary)
+        )
+    printSummary(server.summary())
+
+    run_dir = f"{script_dir}/../output/{config['General']['run_name']}"
+    output_dir = f"{run_dir}/histograms"
+    os.makedirs(output_dir, exist_ok=True)
+    output_prefix = f"{output_dir}/ingest"
+    server.tdc_hist.save(f"{output_prefix}_tdc_time.npz")
+    server.adc_hist.save(f"{output_prefix}_adc_time.npz")
+    print(f"Histograms saved to {output_prefix}_*.npz")
+    if server.theta:
+        np.savez(
+            f"{run_dir}/ingest_tracks.npz",
+            theta=np.concatenate(server.theta),
+            d=np.concatenate(server.d),
+        )
+        print(f"Track parameters saved to {run_dir}/ingest_tracks.npz")
+    Profiling.finish(f"{run_dir}/profiles/ingestServer.json")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+import argparse
+import os
+import time
+
+import numpy as np
+
+import mdt_reco
+from mdt_reco import Profiling
+
+
+def printSnapshot(snapshot):
+    occupancy = snapshot["occupancy"]
+    active = occupancy > 0
+    idle = "-" if snapshot["idle"] is None else f"{snapshot['idle']:.1f} s"
+    print(
+        f"{snapshot['n_events']} events ({snapshot['event_rate']:.1f}/s), "
+        f"{snapshot['n_hits']} hits, {active.sum()} active channels, "
+        f"mean occupancy {occupancy[active].mean() if active.any() else 0:.4f}, "
+        f"idle {idle}"
+    )
+    fitted = np.flatnonzero(np.isfinite(snapshot["t0"]))
+    if len(fitted) > 0:
+        print(
+            "  t0 [ns]: "
+            + ", ".join(f"TDC {tdc}: {snapshot['t0'][tdc]:.1f}" for tdc in fitted)
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Decode a raw file while it is being written and report t0 "
+        "and occupancy as events arrive"
+    )
+    parser.add_argument(
+        "--config", type=str, required=True, help="Path to the configuration file"
+    )
+    parser.add_argument(
+        "--report_interval",
+        type=float,
+        default=5.0,
+        help="Seconds between reports",
+    )
+    parser.add_argument(
+        "--poll_interval",
+        type=float,
+        default=0.5,
+        help="Seconds between reads once the end of the file is reached",
+    )
+    parser.add_argument(
+        "--flush_after",
+        type=float,
+        help="Decode a buffered incomplete event after this many idle seconds",
+    )
+    parser.add_argument(
+        "--duration",
+        type=float,
+        help="Stop after this many seconds instead of at Ctrl-C",
+    )
+    args = parser.parse_args()
+
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    config_path = os.path.join(script_dir, "../configs", args.config)
+    config = mdt_reco.configParser(config_path)
+    Profiling.configure(config)
+    file_path = f"{script_dir}/../raw_data/{config['General']['input_file']}.bin"
+
+    monitor = mdt_reco.onlineMonitor(
+        config,
+        file_path,
+        poll_interval=args.poll_interval,
+        flush_after=args.flush_after,
+    )
+    print(f"Following {file_path}")
+    start = time.monotonic()
+    with monitor:
+        try:
+            while monitor.running and (
+                args.duration is None or time.monotonic() - start < args.duration
+            ):
+                time.sleep(args.report_interval)
+                printSnapshot(monitor.snapshot())
+        except KeyboardInterrupt:
+            pass
+    snapshot = monitor.snapshot()
+    printSnapshot(snapshot)
+
+    run_dir = f"{script_dir}/../output/{config['General']['run_name']}"
+    output_dir = f"{run_dir}/histograms"
+    os.makedirs(output_dir, exist_ok=True)
+    output_prefix = f"{output_dir}/{config['General']['input_file']}_online"
+    snapshot["tdc_hist"].save(f"{output_prefix}_tdc_time.npz")
+    snapshot["adc_hist"].save(f"{output_prefix}_adc_time.npz")
+    print(f"Histograms saved to {output_prefix}_*.npz")
+    Profiling.finish(f"{run_dir}/profiles/monitor.json")
+
+
+if __name__ == "__main__":
+    main()
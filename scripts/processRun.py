@@ -0,0 +1,106 @@
+import argparse
+import json
+import os
+import pickle
+
+import mdt_reco
+from mdt_reco import Profiling
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Decode and reconstruct a run spread over many raw files"
+    )
+    parser.add_argument(
+        "--config", type=str, required=True, help="Path to the configuration file"
+    )
+    parser.add_argument(
+        "--input_files",
+        type=str,
+        nargs="+",
+        required=True,
+        help="Raw files or glob patterns (quoted), relative to ../raw_data",
+    )
+    parser.add_argument(
+        "--output_name",
+        type=str,
+        help="Name of the merged outputs, General.input_file by default",
+    )
+    parser.add_argument(
+        "--workers", type=int, help="Worker processes, all CPUs by default"
+    )
+    parser.add_argument(
+        "--calibration",
+        type=str,
+        help="TDC calibration (.npz from fitTDCs.py) used to fill drift_time",
+    )
+    parser.add_argument(
+        "--rt_function",
+        type=str,
+        help="r(t) (.npz from rtFitter.py), fits tracks together with --calibration",
+    )
+    parser.add_argument(
+        "--run",
+        type=int,
+        help="Run number of the input, checked against the run range of --calibration",
+    )
+    args = parser.parse_args()
+
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    config_path = os.path.join(script_dir, "../configs", args.config)
+    config = mdt_reco.configParser(config_path)
+    Profiling.configure(config)
+    files = mdt_reco.expandFiles(args.input_files, f"{script_dir}/../raw_data")
+    calibration = None
+    if args.calibration is not None:
+        calibration = mdt_reco.tdcCalibration.load(args.calibration)
+        if calibration.bounded and args.run is None:
+            print(
+                f"Warning: {calibration} is only valid for runs "
+                f"{calibration.run_range}, pass --run to check the input"
+            )
+    rt_function = None
+    if args.rt_function is not None:
+        rt_function = mdt_reco.rtFunction.load(args.rt_function)
+
+    processor = mdt_reco.runProcessor(
+        config, files, args.workers, calibration, rt_function, args.run
+    )
+    print(f"Processing {processor}")
+    results = processor.run()
+    batch = results["batch"]
+    n_events = len(batch["event_offsets"]) - 1
+    print(f"Processed {n_events} events in {results['seconds']:.1f} s")
+
+    output_name = args.output_name or config["General"]["input_file"]
+    run_dir = f"{script_dir}/../output/{config['General']['run_name']}"
+    os.makedirs(f"{run_dir}/histograms", exist_ok=True)
+    events = mdt_reco.batchToEvents(batch)
+    if results["theta"] is not None:
+        for event, theta, d in zip(events, results["theta"], results["d"], strict=True):
+            event["theta"] = theta
+            event["d"] = d
+    with open(f"{run_dir}/{output_name}.pkl", "wb") as f:
+        pickle.dump(events, f)
+    results["tdc_hist"].save(f"{run_dir}/histograms/{output_name}_tdc_time.npz")
+    results["adc_hist"].save(f"{run_dir}/histograms/{output_name}_adc_time.npz")
+    file_offsets = results["file_offsets"]
+    manifest = [
+        {
+            "file": file_path,
+            "bytes": int(size),
+            "first_event": int(file_offsets[index]),
+            "n_events": int(file_offsets[index + 1] - file_offsets[index]),
+        }
+        for index, (file_path, size) in enumerate(
+            zip(processor.files, processor.sizes, strict=True)
+        )
+    ]
+    with open(f"{run_dir}/{output_name}_files.json", "w") as f:
+        json.dump(manifest, f, indent=2)
+    print(f"Merged events saved to {run_dir}/{output_name}.pkl")
+    Profiling.finish(f"{run_dir}/profiles/processRun.json")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+import argparse
+import asyncio
+import os
+
+import mdt_reco
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Stream a raw file to ingestServer.py at a given rate"
+    )
+    parser.add_argument(
+        "--config", type=str, required=True, help="Path to the configuration file"
+    )
+    parser.add_argument(
+        "--input_file",
+        type=str,
+        help="File in ../raw_data without .bin, General.input_file by default",
+    )
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--protocol", choices=["tcp", "udp"], default="tcp")
+    parser.add_argument(
+        "--rate",
+        type=float,
+        help="Words per second to send at, as fast as possible by default",
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=1, help="Number of times to send the file"
+    )
+    args = parser.parse_args()
+
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    config_path = os.path.join(script_dir, "../configs", args.config)
+    config = mdt_reco.configParser(config_path)
+    input_file = args.input_file or config["General"]["input_file"]
+    file_path = f"{script_dir}/../raw_data/{input_file}.bin"
+    if not os.path.exists(file_path):
+        msg = f"Input file {file_path} does not exist. Please provide a valid file."
+        raise FileNotFoundError(msg)
+
+    for _ in range(args.repeat):
+        summary = asyncio.run(
+            mdt_reco.replay(
+                config, file_path, args.host, args.port, args.protocol, args.rate
+            )
+        )
+        print(
+            f"Sent {summary['words']} words in {summary['seconds']:.2f} s "
+            f"({summary['words_per_second']:.0f} words/s)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,405 @@
+import numpy as np
+
+from .Event import eventsToBatch
+from .Geometry import Chamber
+from .Profiling import profiled
+from .TDCFitter import TDCFitter
+
+
+class TDCCalibration:
+    """
+    t0 and tmax of every (csm_id, tdc_id, channel), stored in dense arrays so they
+    can be applied to millions of hits with a single gather.
+
+    The arrays cover every ID the Phase2 format can encode (3 bit CSM, 5 bit TDC and
+    channel). Channels without a calibration are NaN.
+
+    Attributes:
+    -----------
+    t0, tmax : np.ndarray
+    float32 arrays of shape (n_csms, n_tdcs, n_channels) in ns.
+
+    t0_error, tmax_error : np.ndarray
+    Uncertainties on t0 and tmax with the same shape, NaN when not estimated.
+
+    version : int
+    Version of the calibration, incremented by whoever produces a new one.
+
+    run_range : tuple
+    First and last run (inclusive) the calibration is valid for. None leaves that
+    side open.
+
+    slice_centers, t0_table : np.ndarray
+    Optional t0(t) table set by setT0Table, of shape (n_slices, n_csms, n_tdcs,
+    n_channels) sampled at slice_centers in units of slice_key. When present,
+    apply interpolates t0 linearly in each hit's slice_key value.
+    """
+
+    n_csms = 8
+    n_tdcs = 32
+    n_channels = 32
+
+    def __init__(self, version=1, run_range=(None, None)):
+        shape = (self.n_csms, self.n_tdcs, self.n_channels)
+        self.t0 = np.full(shape, np.nan, dtype=np.float32)
+        self.tmax = np.full(shape, np.nan, dtype=np.float32)
+        self.t0_error = np.full(shape, np.nan, dtype=np.float32)
+        self.tmax_error = np.full(shape, np.nan, dtype=np.float32)
+        self.version = version
+        self.run_range = tuple(run_range)
+        self.slice_key = "event_number"
+        self.slice_centers = None
+        self.t0_table = None
+
+    def __repr__(self):
+        return (
+            f"TDCCalibration(version={self.version}, run_range={self.run_range}, "
+            f"channels={int(np.count_nonzero(~np.isnan(self.t0)))})"
+        )
+
+    def setChannels(
+        self, csm_ids, tdc_ids, channels, t0, tmax, t0_error=None, tmax_error=None
+    ):
+        """
+        Set t0 and tmax, and optionally their uncertainties, for the given
+        (csm_id, tdc_id, channel) arrays.
+        """
+        self.t0[csm_ids, tdc_ids, channels] = t0
+        self.tmax[csm_ids, tdc_ids, channels] = tmax
+        if t0_error is not None:
+            self.t0_error[csm_ids, tdc_ids, channels] = t0_error
+        if tmax_error is not None:
+            self.tmax_error[csm_ids, tdc_ids, channels] = tmax_error
+
+    def setT0Table(self, slice_centers, t0_table, slice_key="event_number"):
+        """
+        Set a time dependent t0. Entries of t0_table that are NaN (slices whose fit
+        failed) fall back to the static t0.
+
+        Parameters:
+        -----------
+        slice_centers : np.ndarray
+        Increasing slice positions in units of slice_key.
+
+        t0_table : np.ndarray
+        t0 of shape (n_slices, n_csms, n_tdcs, n_channels).
+
+        slice_key : str
+        The batch key apply reads the per hit slice variable from.
+        """
+        t0_table = np.asarray(t0_table, dtype=np.float32)
+        self.slice_centers = np.asarray(slice_centers, dtype=np.float64)
+        self.t0_table = np.where(np.isnan(t0_table), self.t0, t0_table)
+        self.slice_key = slice_key
+
+    def getT0(self, csm_ids, tdc_ids, channels, slice_values=None):
+        if self.t0_table is None or slice_values is None:
+            return self.t0[csm_ids, tdc_ids, channels]
+        n_slices = len(self.slice_centers)
+        if n_slices == 1:
+            return self.t0_table[0, csm_ids, tdc_ids, channels]
+        # fractional slice index, clamped to the first and last slice
+        position = np.interp(slice_values, self.slice_centers, np.arange(n_slices))
+        lower = np.minimum(position.astype(np.int64), n_slices - 2)
+        fraction = (position - lower).astype(np.float32)
+        t0_lower = self.t0_table[lower, csm_ids, tdc_ids, channels]
+        t0_upper = self.t0_table[lower + 1, csm_ids, tdc_ids, channels]
+        return t0_lower + fraction * (t0_upper - t0_lower)
+
+    def getTMax(self, csm_ids, tdc_ids, channels):
+        return self.tmax[csm_ids, tdc_ids, channels]
+
+    def isValid(self, run):
+        first_run, last_run = self.run_range
+        if first_run is not None and run < first_run:
+            return False
+        return last_run is None or run <= last_run
+
+    @property
+    def event_sliced(self):
+        """True when t0 is a table sliced in event_number, see apply."""
+        return self.t0_table is not None and self.slice_key == "event_number"
+
+    @property
+    def bounded(self):
+        """True when run_range limits the runs the calibration is valid for."""
+        return self.run_range != (None, None)
+
+    def checkRun(self, run):
+        """Raise a ValueError when run is given and outside run_range."""
+        if run is not None and not self.isValid(run):
+            msg = f"Run {run} is outside the run range {self.run_range} of {self}"
+            raise ValueError(msg)
+
+    def apply(self, batch, run=None, event_offset=None):
+        """
+        Fill drift_time = tdc_time - t0 for every hit of a batch. With a t0 table
+        the batch must also hold slice_key, and t0 is interpolated per hit.
+
+        Parameters:
+        -----------
+        batch : dict or Event
+        Anything holding per hit csm_id, tdc_id, channel and tdc_time arrays, such
+        as a columnar batch from eventsToBatch or a single Event.
+
+        run : int
+        Run the hits were taken in. A ValueError is raised when it is outside
+        run_range. None skips the check.
+
+        event_offset : int
+        Added to the batch's event_number to give the run-wide event number a t0
+        table sliced in event_number is indexed with, e.g. the number of events in
+        the files before this one. eventsToBatch and decodeWords number the events
+        from 0 on every call, so such a table raises a ValueError when it is None.
+        Pass 0 for a batch numbered from the start of the run.
+
+        Returns:
+        --------
+        batch : dict or Event
+        The same object, with drift_time set.
+        """
+        self.checkRun(run)
+        slice_values = None
+        if self.t0_table is not None:
+            slice_values = batch[self.slice_key]
+        if self.event_sliced:
+            if event_offset is None:
+                msg = (
+                    f"{self} has a t0 table sliced in event_number, pass the "
+                    "event_offset of the batch within the run"
+                )
+                raise ValueError(msg)
+            slice_values = slice_values + event_offset
+        t0 = self.getT0(
+            batch["csm_id"], batch["tdc_id"], batch["channel"], slice_values
+        )
+        batch["drift_time"] = np.subtract(batch["tdc_time"], t0, dtype=np.float32)
+        return batch
+
+    def applyEvents(self, events, run=None, event_offset=None):
+        """
+        Fill drift_time for a list of Event objects with one vectorized apply over
+        all of their hits. The events are numbered by their position in the list,
+        so event_offset is the run-wide number of the first one. run and
+        event_offset are checked as in apply.
+        """
+        self.checkRun(run)
+        if len(events) == 0:
+            return events
+        batch = self.apply(eventsToBatch(events), event_offset=event_offset)
+        offsets = batch["event_offsets"]
+        drift_time = batch["drift_time"]
+        for i, event in enumerate(events):
+            event["drift_time"] = drift_time[offsets[i] : offsets[i + 1]]
+        return events
+
+    def save(self, file):
+        first_run, last_run = self.run_range
+        table = {}
+        if self.t0_table is not None:
+            table = {
+                "slice_centers": self.slice_centers,
+                "t0_table": self.t0_table,
+                "slice_key": self.slice_key,
+            }
+        np.savez(
+            file,
+            **table,
+            t0=self.t0,
+            tmax=self.tmax,
+            t0_error=self.t0_error,
+            tmax_error=self.tmax_error,
+            version=self.version,
+            run_range=np.array(
+                [
+                    -1 if first_run is None else first_run,
+                    -1 if last_run is None else last_run,
+                ]
+            ),
+        )
+
+    @classmethod
+    def load(cls, file):
+        with np.load(file) as data:
+            run_range = tuple(
+                None if run < 0 else int(run) for run in data["run_range"]
+            )
+            calibration = cls(version=int(data["version"]), run_range=run_range)
+            calibration.t0 = data["t0"]
+            calibration.tmax = data["tmax"]
+            # Calibrations saved before t0/tmax had errors keep the NaN errors
+            # of a new calibration
+            if "t0_error" in data:
+                calibration.t0_error = data["t0_error"]
+                calibration.tmax_error = data["tmax_error"]
+            if "t0_table" in data:
+                calibration.slice_centers = data["slice_centers"]
+                calibration.t0_table = data["t0_table"]
+                calibration.slice_key = str(data["slice_key"])
+        return calibration
+
+
+@profiled("fitTDCCalibration")
+def fitTDCCalibration(
+    config,
+    tdc_hist,
+    adc_hist,
+    version=1,
+    run_range=(None, None),
+    bootstrap=None,
+    chamber_cache_dir=None,
+):
+    """
+    Fit t0 and tmax of every channel from filled TDC and ADC histograms.
+
+    The fine TDC histogram is rebinned max_iterations times with a growing number
+    of bins and the fits averaged. Channels whose own histogram could not be
+    fitted fall back to their TDC.
+
+    Parameters:
+    -----------
+    config : ConfigParser
+    The config giving the TDCFitting and Geometry sections.
+
+    tdc_hist, adc_hist : HitHistogram
+    Histograms of tdc_time and adc_time. A sliced tdc_hist also sets a t0 table
+    with one t0 per slice. Only the channels of the CSM of tdc_hist are set.
+
+    version, run_range :
+    Stored with the calibration, see TDCCalibration.
+
+    bootstrap : int
+    Estimate the t0 and tmax uncertainties from this many Poisson resamplings of
+    the tdc_bins histograms, each fitted on that one binning. Without it the
+    uncertainties stay NaN.
+
+    chamber_cache_dir : str
+    On-disk cache of the chamber, see Chamber.
+
+    Returns:
+    --------
+    tdc_history : dict
+    t0 and tmax per TDC and channel, plus "All_Channels" per TDC.
+
+    calibration : TDCCalibration
+    The calibration of every channel in the chamber.
+    """
+    max_iter = config["TDCFitting"]["max_iterations"]
+    tdcFitter = TDCFitter()
+
+    tdc_sliced = None
+    if tdc_hist.sliced:
+        tdc_sliced = tdc_hist
+        tdc_hist = tdc_sliced.integrated()
+
+    tdc_max = config["TDCFitting"]["tdc_max"]
+    tdc_min = config["TDCFitting"]["tdc_min"]
+    tdc_bins = config["TDCFitting"]["tdc_bins"]
+    tdc_range = np.linspace(tdc_min, tdc_max, tdc_bins + 1)
+
+    channel_hits = tdc_hist.counts.sum(axis=2)
+    active_tdcs = np.nonzero(channel_hits.sum(axis=1))[0]
+    n_tdcs = int(active_tdcs.max()) + 1
+    n_channels = int(np.nonzero(channel_hits.sum(axis=0))[0].max()) + 1
+    fine_cube = tdc_hist.counts[:n_tdcs, :n_channels]
+    fine_range = tdc_hist.bin_edges
+    tdc_cube, tdc_centers = tdcFitter.rebinHisto(fine_cube, fine_range, tdc_range)
+    adc_cube = adc_hist.counts[:n_tdcs, :n_channels]
+    adc_centers = adc_hist.bin_centers
+
+    tdc_history = {}
+    tdc_histos = {}
+    adc_histos = {}
+    active_channels = {}
+    for tdc_id in active_tdcs:
+        tdc_history[tdc_id] = {}
+        tdc_histos[tdc_id] = {}
+        adc_histos[tdc_id] = {}
+
+        tdc_history[tdc_id]["All_Channels"] = {"t0": 0, "tmax": 0}
+        tdc_histos[tdc_id]["All_Channels"] = (
+            tdc_cube[tdc_id].sum(axis=0),
+            tdc_centers,
+        )
+        adc_histos[tdc_id]["All_Channels"] = (
+            adc_cube[tdc_id].sum(axis=0),
+            adc_centers,
+        )
+        active_channels[tdc_id] = np.nonzero(channel_hits[tdc_id])[0]
+
+        for channel in active_channels[tdc_id]:
+            tdc_history[tdc_id][channel] = {"t0": 0, "tmax": 0}
+            tdc_histos[tdc_id][channel] = (tdc_cube[tdc_id, channel], tdc_centers)
+            adc_histos[tdc_id][channel] = (adc_cube[tdc_id, channel], adc_centers)
+
+    # PLOT HISTOS HERE
+
+    # CALCUATE TDC CALIBRATION
+    # The fine histogram is rebinned for every iteration
+    binnings = [
+        np.linspace(tdc_min, tdc_max, 51 + int(50 * i / max_iter))
+        for i in range(max_iter)
+    ]
+    t0, tmax = tdcFitter.fitRebinnedT0TMax(
+        fine_cube, fine_range, binnings, n_steps=1000
+    )
+    t0_all, tmax_all = tdcFitter.fitRebinnedT0TMax(
+        fine_cube.sum(axis=1), fine_range, binnings, n_steps=1000
+    )
+    t0_error = np.full(t0.shape, np.nan)
+    tmax_error = np.full(tmax.shape, np.nan)
+    t0_all_error = np.full(t0_all.shape, np.nan)
+    tmax_all_error = np.full(tmax_all.shape, np.nan)
+    if bootstrap is not None:
+        t0_error, tmax_error = tdcFitter.bootstrapT0TMax(
+            tdc_cube, tdc_centers, n_replicas=bootstrap, n_steps=1000
+        )
+        t0_all_error, tmax_all_error = tdcFitter.bootstrapT0TMax(
+            tdc_cube.sum(axis=1), tdc_centers, n_replicas=bootstrap, n_steps=1000
+        )
+
+    for tdc_id in active_tdcs:
+        tdc_history[tdc_id]["All_Channels"]["t0"] = t0_all[tdc_id]
+        tdc_history[tdc_id]["All_Channels"]["tmax"] = tmax_all[tdc_id]
+        for channel in active_channels[tdc_id]:
+            tdc_history[tdc_id][channel]["t0"] = t0[tdc_id, channel]
+            tdc_history[tdc_id][channel]["tmax"] = tmax[tdc_id, channel]
+
+    # Channels whose own histogram could not be fitted fall back to their TDC
+    fallback = np.isnan(t0)
+    t0 = np.where(fallback, t0_all[:, np.newaxis], t0)
+    t0_error = np.where(fallback, t0_all_error[:, np.newaxis], t0_error)
+    fallback = np.isnan(tmax)
+    tmax = np.where(fallback, tmax_all[:, np.newaxis], tmax)
+    tmax_error = np.where(fallback, tmax_all_error[:, np.newaxis], tmax_error)
+
+    chamber = Chamber(config, cache_dir=chamber_cache_dir)
+    fitted = (chamber["tdc_id"] < n_tdcs) & (chamber["channel"] < n_channels)
+    if tdc_hist.csm_id is not None:
+        fitted &= chamber["csm_id"] == tdc_hist.csm_id
+    tube_tdcs = chamber["tdc_id"][fitted]
+    tube_channels = chamber["channel"][fitted]
+    calibration = TDCCalibration(version=version, run_range=run_range)
+    calibration.setChannels(
+        chamber["csm_id"][fitted],
+        tube_tdcs,
+        tube_channels,
+        t0[tube_tdcs, tube_channels],
+        tmax[tube_tdcs, tube_channels],
+        t0_error[tube_tdcs, tube_channels],
+        tmax_error[tube_tdcs, tube_channels],
+    )
+    if tdc_sliced is not None:
+        slice_range = np.linspace(tdc_min, tdc_max, 51)
+        slice_cube, bin_centers = tdcFitter.rebinHisto(
+            tdc_sliced.counts[:, :n_tdcs, :n_channels], fine_range, slice_range
+        )
+        slice_t0 = tdcFitter.fitT0Batch(slice_cube, bin_centers, n_steps=1000)
+        t0_table = np.full((len(slice_t0), *calibration.t0.shape), np.nan)
+        t0_table[:, chamber["csm_id"][fitted], tube_tdcs, tube_channels] = slice_t0[
+            :, tube_tdcs, tube_channels
+        ]
+        calibration.setT0Table(
+            tdc_sliced.slice_centers, t0_table, slice_key=tdc_sliced.slice_key
+        )
+    return tdc_history, calibration
@@ -1,6 +1,32 @@
+import hashlib
+import json
+
 import yaml
 
 
+def fingerprint(*objects):
+    """
+    sha256 hex digest of JSON serialisable objects, independent of dict order.
+    """
+    contents = json.dumps(objects, sort_keys=True, default=str)
+    return hashlib.sha256(contents.encode()).hexdigest()
+
+
+def fileIdentity(file_path, chunk_size=2**24):
+    """
+    Identity of a file's contents: its size and sha256. Hashing reads the file
+    once, which is far cheaper than any stage that parses it, and unlike a
+    modification time it does not change when an unchanged output is rewritten.
+    """
+    digest = hashlib.sha256()
+    size = 0
+    with open(file_path, "rb") as file:
+        while chunk := file.read(chunk_size):
+            digest.update(chunk)
+            size += len(chunk)
+    return [size, digest.hexdigest()]
+
+
 class ConfigParser:
     def __init__(self, config_file):
         self.config_file = config_file
@@ -23,3 +49,13 @@ class ConfigParser:
     def save_config(self):
         with open(self.config_file, "w") as file:
             yaml.safe_dump(self.config, file)
+
+    def fingerprint(self, *sections):
+        """
+        Stable hash of the given config sections, or of the whole config when none
+        are given. A missing section hashes as empty, so adding an unrelated
+        section does not change the fingerprint of a stage.
+        """
+        if not sections:
+            return fingerprint(self.config)
+        return fingerprint({section: self.get(section) for section in sections})
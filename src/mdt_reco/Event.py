@@ -1,12 +1,9 @@
-import os
+from typing import TYPE_CHECKING
 
-import matplotlib.pyplot as plt
 import numpy as np
-from matplotlib.collections import PatchCollection
-from matplotlib.lines import Line2D
-from matplotlib.patches import Circle
 
-from .Geometry import Chamber
+if TYPE_CHECKING:
+    from .Geometry import Chamber
 
 
 class Event:
@@ -96,7 +93,7 @@ class Event:
 
     def draw(
         self,
-        chamber: Chamber,
+        chamber: "Chamber",
         ax=None,
         title=None,
         save=False,
@@ -104,55 +101,22 @@ class Event:
         file_name=None,
         file_ext=".pdf",
     ):
-        if ax is None:
-            fig, ax = plt.subplots(figsize=(10, 10))
-        chamber.draw(ax=ax)
-        patches = []
-        for hit_id, _ in enumerate(self["x"]):
-            center = (self["x"][hit_id], self["y"][hit_id])
-            radius = chamber.getRadius(self["tdc_id"][hit_id])
-            circle = Circle(
-                center, radius, fill=True, facecolor="lime", ec="black", lw=1
-            )
-            patches.append(circle)
-        collection = PatchCollection(patches, match_original=True)
-        ax.add_collection(collection)
-
-        legend_circle = Line2D(
-            [0],
-            [0],
-            marker="o",
-            color="w",
-            markerfacecolor="lime",
-            markeredgecolor="black",
-            markersize=10,
-            label="Hit",
+        from .Plotting import drawEvent
+
+        drawEvent(
+            self,
+            chamber=chamber,
+            ax=ax,
+            title=title,
+            save=save,
+            file_dir=file_dir,
+            file_name=file_name,
+            file_ext=file_ext,
         )
-        ax.legend(handles=[legend_circle], loc="upper right")
-
-        ax.set_xlabel("x[mm]")
-        ax.set_ylabel("y[mm]")
-        ylims = ax.get_ylim()
-        ax.set_ylim(ylims[0], ylims[1] + 40)
-        if title is not None:
-            ax.set_title(title)
-        if save:
-            if file_dir is None or file_name is None:
-                msg = "file_dir and file_name must be provided when save=True"
-                raise ValueError(msg)
-            if not file_ext.startswith("."):
-                file_ext = "." + file_ext
-            _, ext = os.path.splitext(file_name)
-            if not ext:
-                file_name = file_name + file_ext
-            file_path = os.path.join(file_dir, file_name)
-            plt.savefig(file_path)
-        else:
-            plt.show()
 
     def drawTrack(
         self,
-        chamber: Chamber,
+        chamber: "Chamber",
         ax=None,
         title=None,
         save=False,
@@ -161,22 +125,10 @@ class Event:
         file_ext=".pdf",
         **kwargs,
     ):
-        if ax is None:
-            fig, ax = plt.subplots(figsize=(10, 10))
-        cos_t = np.cos(self["theta"])
-        sin_t = np.sin(self["theta"])
-        tolerance = 1e-5
-        if np.abs(sin_t) > tolerance:
-            # Not vertical
-            x_vals = np.linspace(self["x"].min() - 20, self["x"].max() + 20, 10)
-            y_vals = (self["d"] - x_vals * cos_t) / sin_t
-            ax.plot(x_vals, y_vals, label="Track", **kwargs)
-        else:
-            # Vertical line: x = d / cos(θ)
-            x_line = self["d"] / cos_t
-            y_vals = np.linspace(self["y"].min() - 50, self["y"].max() + 50, 10)
-            ax.plot(np.full_like(y_vals, x_line), y_vals, label="Track", **kwargs)
-        self.draw(
+        from .Plotting import drawTrack
+
+        drawTrack(
+            self,
             chamber=chamber,
             ax=ax,
             title=title,
@@ -184,4 +136,133 @@ class Event:
             file_dir=file_dir,
             file_name=file_name,
             file_ext=file_ext,
+            **kwargs,
         )
+
+
+def eventsToBatch(events):
+    """
+    Concatenate a list of events into one columnar batch.
+
+    Every key whose array has one entry per hit in every event is concatenated.
+    Per event scalars (theta, d) and keys that were never filled are left out.
+    The hits of event i are batch[key][offsets[i]:offsets[i + 1]], with the offsets
+    stored under "event_offsets". "event_number" holds the index of each hit's
+    event in the list.
+
+    Parameters:
+    -----------
+    events : list
+    A list of Event objects.
+
+    Returns:
+    --------
+    batch : dict
+    A dictionary of per hit arrays plus "event_offsets" and "event_number".
+    """
+    hits_per_event = np.array(
+        [len(event["tdc_id"]) for event in events], dtype=np.int64
+    )
+    offsets = np.zeros(len(events) + 1, dtype=np.int64)
+    np.cumsum(hits_per_event, out=offsets[1:])
+    batch = {}
+    if len(events) > 0:
+        for key in events[0]:
+            if all(
+                np.ndim(event[key]) == 1 and len(event[key]) == n_hits
+                for event, n_hits in zip(events, hits_per_event, strict=True)
+            ):
+                batch[key] = np.concatenate([event[key] for event in events])
+    batch["event_offsets"] = offsets
+    batch["event_number"] = np.repeat(np.arange(len(events)), hits_per_event)
+    return batch
+
+
+def batchToEvents(batch):
+    """
+    Split a columnar batch made by eventsToBatch back into a list of Event objects.
+    """
+    offsets = batch["event_offsets"]
+    keys = [key for key in batch if key not in ("event_offsets", "event_number")]
+    events = []
+    for i in range(len(offsets) - 1):
+        event = Event()
+        for key in keys:
+            event[key] = batch[key][offsets[i] : offsets[i + 1]]
+        events.append(event)
+    return events
+
+
+def selectEvents(batch, event_ids):
+    """
+    Gather the hits of a subset of events from a columnar batch.
+
+    Parameters:
+    -----------
+    batch : dict
+    A columnar batch made by eventsToBatch.
+
+    event_ids : np.ndarray
+    Indices of the events to keep, in the order they should appear.
+
+    Returns:
+    --------
+    batch : dict
+    A new batch with its own event_offsets. event_number keeps the original
+    numbers, so hits can be traced back to the full batch.
+    """
+    offsets = batch["event_offsets"]
+    event_ids = np.asarray(event_ids, dtype=np.int64)
+    starts = offsets[event_ids]
+    hits_per_event = offsets[event_ids + 1] - starts
+    new_offsets = np.zeros(len(event_ids) + 1, dtype=np.int64)
+    np.cumsum(hits_per_event, out=new_offsets[1:])
+    # position in the new batch plus the shift from each event's new to old start
+    hit_ids = np.arange(new_offsets[-1]) + np.repeat(
+        starts - new_offsets[:-1], hits_per_event
+    )
+    selected = {key: batch[key][hit_ids] for key in batch if key != "event_offsets"}
+    selected["event_offsets"] = new_offsets
+    return selected
+
+
+def selectHits(batch, hit_mask):
+    """
+    Keep the hits of a columnar batch where hit_mask is True. Every event keeps
+    its place, with event_offsets recomputed for the remaining hits.
+    """
+    kept = np.zeros(len(hit_mask) + 1, dtype=np.int64)
+    np.cumsum(hit_mask, out=kept[1:])
+    selected = {key: batch[key][hit_mask] for key in batch if key != "event_offsets"}
+    selected["event_offsets"] = kept[batch["event_offsets"]]
+    return selected
+
+
+def concatBatches(batches):
+    """
+    Join columnar batches end to end into one, keeping the keys present in every
+    batch. The events are renumbered so event_number counts across the joined
+    batch, in the order of the batches. Joining no batches gives a batch of no
+    events, holding only event_offsets and event_number.
+    """
+    batches = list(batches)
+    if not batches:
+        return {
+            "event_offsets": np.zeros(1, dtype=np.int64),
+            "event_number": np.zeros(0, dtype=np.int64),
+        }
+    keys = [
+        key
+        for key in batches[0]
+        if key not in ("event_offsets", "event_number")
+        and all(key in batch for batch in batches)
+    ]
+    joined = {key: np.concatenate([batch[key] for batch in batches]) for key in keys}
+    hits_per_event = np.concatenate(
+        [np.diff(batch["event_offsets"]) for batch in batches]
+    )
+    offsets = np.zeros(len(hits_per_event) + 1, dtype=np.int64)
+    np.cumsum(hits_per_event, out=offsets[1:])
+    joined["event_offsets"] = offsets
+    joined["event_number"] = np.repeat(np.arange(len(hits_per_event)), hits_per_event)
+    return joined
@@ -2,6 +2,7 @@ import numpy as np
 
 from .Event import Event
 from .Geometry import Chamber
+from .Profiling import addCounts, profiled
 
 
 class Generator:
@@ -52,7 +53,9 @@ class Generator:
 
         return sim_event
 
+    @profiled("Generator.simEvents")
     def simEvents(self, num_events):
+        addCounts("Generator.simEvents", muons=num_events)
         sim_events = []
         for _i in range(num_events):
             sim_events.append(self.simEvent())
@@ -101,6 +104,7 @@ class Generator:
     def driftTime(self, drift_rad):
         return 3.5 * (drift_rad.astype(np.float32)) ** 2  # Drift time in ns
 
+    @profiled("Generator.createEvent")
     def createEvent(self, A, C):
         # Calculate distance from track to all tubes
         drift_rad = np.abs(A * self.Chamber["x"] - self.Chamber["y"] + C) / np.sqrt(
@@ -1,105 +1,105 @@
-import matplotlib.pyplot as plt
+import os
+from typing import ClassVar
+
 import numpy as np
-from matplotlib.collections import PatchCollection
-from matplotlib.patches import Circle
+from numba import get_num_threads, njit, prange
 
+from .ConfigParser import fingerprint
+from .Event import selectHits
 
-class Chamber:
-    def __init__(self, config):
-        self.config = config["Geometry"]
-        self.chamber = {
-            "x": np.array([], dtype=np.float32),
-            "y": np.array([], dtype=np.float32),
-            "csm_id": np.array([], dtype=np.uint8),
-            "tdc_id": np.array([], dtype=np.uint8),
-            "channel": np.array([], dtype=np.uint8),
-            "layer": np.array([], dtype=np.uint8),
-            "ML": np.array([], dtype=np.uint8),
-        }
-        self._radius_container = np.array([], dtype=np.float32)
-        self.buildChamber()
-        self.fillRadiusContainer()
 
-    def __repr__(self):
-        return repr(self.chamber)
+@njit(cache=True)
+def _find_root(parent, i):
+    while parent[i] != i:
+        parent[i] = parent[parent[i]]
+        i = parent[i]
+    return i
 
-    def __getitem__(self, key):
-        if key in self.chamber:
-            return self.chamber[key]
-        msg = f"Key '{key}' not found in Chamber data."
-        raise KeyError(msg)
 
-    def buildChamber(self):
-        for multilayer_id, multilayer_name in enumerate(self.config["multilayers"]):
-            multilayer_config = self.config["multilayers"][multilayer_name]
-            self.buildMultilayer(multilayer_config, multilayer_id)
-            self.addMultilayer(multilayer_config)
-
-        """
-        Numpy appears to be recasting to safer larger types somewhere in the code.
-        This could be occuring when filling or during concatenation. A single instance
-        of chamber will never cause memory overflow. So we can cast types after
-        creation.
-        """
-        self.chamber["x"] = self.chamber["x"].astype(dtype=np.float32)
-        self.chamber["y"] = self.chamber["y"].astype(dtype=np.float32)
-        self.chamber["csm_id"] = self.chamber["csm_id"].astype(dtype=np.uint8)
-        self.chamber["tdc_id"] = self.chamber["tdc_id"].astype(dtype=np.uint8)
-        self.chamber["channel"] = self.chamber["channel"].astype(dtype=np.uint8)
-        self.chamber["layer"] = self.chamber["layer"].astype(dtype=np.uint8)
-        self.chamber["ML"] = self.chamber["ML"].astype(dtype=np.uint8)
-
-    def addMultilayer(self, multilayer_config):
-        if len(self.chamber["y"]) > 0:
-            self.multilayer["y"] += (
-                self.chamber["y"].max()
-                + multilayer_config["radius"]
-                + self.config["multilayer_spacing"]
-            )
-        for key in self.multilayer:
-            self.chamber[key] = np.concatenate(
-                (self.chamber[key], self.multilayer[key])
-            )
+@njit(cache=True)
+def _union(parent, i, j):
+    # the smaller hit index becomes the root, so every root is its cluster's first hit
+    root_i = _find_root(parent, i)
+    root_j = _find_root(parent, j)
+    if root_i < root_j:
+        parent[root_j] = root_i
+    elif root_j < root_i:
+        parent[root_i] = root_j
 
-    def buildMultilayer(self, multilayer_config, multilayer_id):
-        self.multilayer = {
-            "x": np.array([], dtype=np.float32),
-            "y": np.array([], dtype=np.float32),
-            "csm_id": np.array([], dtype=np.int8),
-            "tdc_id": np.array([], dtype=np.int8),
-            "channel": np.array([], dtype=np.int8),
-            "layer": np.array([], dtype=np.int8),
-            "ML": np.array([], dtype=np.int8),
-        }
 
-        for k, activeTDC in enumerate(multilayer_config["activeTDCs"]):
-            if activeTDC:
-                TDC = self.buildTDC(multilayer_config, k)
-                TDC["x"] += k * TDC["x"].max()
-                self.addTDC(TDC)
-        self.multilayer["ML"] = np.full(len(self.multilayer["x"]), multilayer_id)
-
-    def addTDC(self, TDC):
-        for key in TDC:
-            self.multilayer[key] = np.concatenate((self.multilayer[key], TDC[key]))
-
-    def buildTDC(self, multilayer_config, k):
-        tdc_id = multilayer_config["TDC_ids"][k]
-        csm_id = multilayer_config["CSM_ids"][k]
-        if multilayer_config["tdcType"] == "446":
-            TDC = self.buildTDCType446(multilayer_config, tdc_id, csm_id)
-        elif multilayer_config["tdcType"] == "436":
-            TDC = self.buildTDCType436(multilayer_config, tdc_id, csm_id)
-        return TDC
-
-    def buildTDCType446(self, multilayer_config, tdc_id, csm_id):
-        nLayers = 4
-        tubesPerLayer = 6
-        TDC_446 = {
-            "x": np.zeros(24),
-            "y": np.zeros(24),
-            "csm_id": np.full(24, csm_id),
-            "tdc_id": np.full(24, tdc_id),
+@njit(cache=True, parallel=True)
+def _cluster_hits(tube_ids, event_offsets, indptr, indices, n_chunks):
+    n_hits = len(tube_ids)
+    n_events = len(event_offsets) - 1
+    n_tubes = len(indptr) - 1
+    parent = np.arange(n_hits)
+    labels = np.full(n_hits, -1, dtype=np.int32)
+    sizes = np.zeros(n_hits, dtype=np.int32)
+    for chunk in prange(n_chunks):
+        # last hit of the current event on every tube, -1 if none
+        last_hit = np.full(n_tubes, -1, dtype=np.int64)
+        for event in range(
+            chunk * n_events // n_chunks, (chunk + 1) * n_events // n_chunks
+        ):
+            start = event_offsets[event]
+            stop = event_offsets[event + 1]
+            for hit in range(start, stop):
+                tube = tube_ids[hit]
+                if tube < 0:
+                    continue
+                if last_hit[tube] >= 0:
+                    _union(parent, hit, last_hit[tube])
+                last_hit[tube] = hit
+                for k in range(indptr[tube], indptr[tube + 1]):
+                    other = last_hit[indices[k]]
+                    if other >= 0:
+                        _union(parent, hit, other)
+            n_clusters = 0
+            for hit in range(start, stop):
+                if tube_ids[hit] < 0:
+                    continue
+                root = _find_root(parent, hit)
+                if root == hit:
+                    labels[hit] = n_clusters
+                    n_clusters += 1
+                else:
+                    labels[hit] = labels[root]
+                sizes[root] += 1
+            for hit in range(start, stop):
+                tube = tube_ids[hit]
+                if tube < 0:
+                    continue
+                sizes[hit] = sizes[_find_root(parent, hit)]
+                last_hit[tube] = -1
+    return labels, sizes
+
+
+class Chamber:
+    """
+    Tube positions and IDs of a chamber built from the Geometry section of the
+    config.
+
+    The total tube count is known from the config, so the columns are allocated
+    once and every multilayer is filled from a per TDC type template with array
+    operations. Built chambers are cached in memory, keyed by a hash of the
+    Geometry section, so Generator, Signal and the scripts share one build per
+    process; with cache_dir the arrays are also stored on disk. The cached arrays
+    are shared between instances and read only.
+    """
+
+    n_csms = 8
+    n_tdcs = 32
+    n_channels = 32
+    tubes_per_tdc = 24
+    _cache_version = 1
+    _cache: ClassVar[dict] = {}
+    _adjacency_cache: ClassVar[dict] = {}
+    adjacency_kinds = ("in_layer", "cross_layer", "cross_multilayer")
+
+    # channel and x position (in units of tube radius + tube_spacing / 2) of the
+    # 24 tubes of a TDC, 4 layers of 6 tubes
+    _tdc_templates: ClassVar[dict] = {
+        "446": {
             "channel": np.array(
                 [
                     [5, 3, 4, 2, 0, 1],
@@ -108,38 +108,11 @@ class Chamber:
                     [23, 21, 22, 20, 18, 19],
                 ]
             ).flatten(),
-            "layer": np.array(
-                [
-                    [0, 0, 0, 0, 0, 0],
-                    [1, 1, 1, 1, 1, 1],
-                    [2, 2, 2, 2, 2, 2],
-                    [3, 3, 3, 3, 3, 3],
-                ]
-            ).flatten(),
-        }
-        x_shift = multilayer_config["radius"] + multilayer_config["tube_spacing"] / 2
-        for tube_num in range(tubesPerLayer):
-            TDC_446["x"][tube_num] = (2 * tube_num + 2) * x_shift
-            TDC_446["x"][tube_num + 6] = (2 * tube_num + 1) * x_shift
-            TDC_446["x"][tube_num + 12] = TDC_446["x"][tube_num]
-            TDC_446["x"][tube_num + 18] = TDC_446["x"][tube_num + 6]
-        tube_center_distance = 2 * x_shift
-        y_spacing = 0.5 * tube_center_distance * np.sqrt(3)
-        for layer in range(nLayers):
-            TDC_446["y"][tubesPerLayer * layer : tubesPerLayer * (layer + 1)] = (
-                y_spacing * layer + tube_center_distance / 2
-            )
-        # TDC_446['channel'] = TDC_446['channel'] + tdc_id * 100
-        return TDC_446
-
-    def buildTDCType436(self, multilayer_config, tdc_id, csm_id):
-        nLayers = 4
-        tubesPerLayer = 6
-        TDC_436 = {
-            "x": np.zeros(24),
-            "y": np.zeros(24),
-            "csm_id": np.full(24, csm_id),
-            "tdc_id": np.full(24, tdc_id),
+            "x_steps": np.tile(
+                np.concatenate((np.arange(2, 13, 2), np.arange(1, 12, 2))), 2
+            ),
+        },
+        "436": {
             "channel": np.array(
                 [
                     [3, 1, 5, 0, 2, 4],
@@ -148,29 +121,147 @@ class Chamber:
                     [19, 21, 23, 18, 20, 22],
                 ]
             ).flatten(),
-            "layer": np.array(
-                [
-                    [0, 0, 0, 0, 0, 0],
-                    [1, 1, 1, 1, 1, 1],
-                    [2, 2, 2, 2, 2, 2],
-                    [3, 3, 3, 3, 3, 3],
-                ]
-            ).flatten(),
+            "x_steps": np.tile(
+                np.concatenate((np.arange(1, 12, 2), np.arange(2, 13, 2))), 2
+            ),
+        },
+    }
+
+    def __init__(self, config, cache_dir=None):
+        """
+        Parameters:
+        -----------
+        config : ConfigParser
+        The config file giving the chamber under the header Geometry.
+
+        cache_dir : str
+        Directory for chambers cached on disk, only used when given.
+        """
+        self.config = config["Geometry"]
+        key = self.fingerprint(self.config)
+        if key not in self._cache:
+            self._cache[key] = self._loadOrBuild(key, cache_dir)
+        self.chamber, self._radius_container, self._tube_index = self._cache[key]
+
+    def __repr__(self):
+        return repr(self.chamber)
+
+    def __getitem__(self, key):
+        if key in self.chamber:
+            return self.chamber[key]
+        msg = f"Key '{key}' not found in Chamber data."
+        raise KeyError(msg)
+
+    @classmethod
+    def fingerprint(cls, geometry_config):
+        """sha256 of the Geometry section and the version of the build code."""
+        return fingerprint(cls._cache_version, geometry_config)
+
+    @classmethod
+    def clearCache(cls):
+        cls._cache.clear()
+        cls._adjacency_cache.clear()
+
+    def _loadOrBuild(self, key, cache_dir):
+        cache_file = None
+        if cache_dir is not None:
+            cache_file = os.path.join(cache_dir, f"chamber_{key[:16]}.npz")
+            if os.path.exists(cache_file):
+                with np.load(cache_file) as data:
+                    chamber = {name: data[name] for name in data.files}
+                radius_container = chamber.pop("radius_container")
+                return self._freeze(chamber, radius_container)
+        chamber = self.buildChamber()
+        radius_container = self.fillRadiusContainer(chamber)
+        if cache_file is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+            np.savez(cache_file, radius_container=radius_container, **chamber)
+        return self._freeze(chamber, radius_container)
+
+    def _freeze(self, chamber, radius_container):
+        tube_index = np.full((self.n_csms, self.n_tdcs, self.n_channels), -1)
+        tube_index[chamber["csm_id"], chamber["tdc_id"], chamber["channel"]] = (
+            np.arange(len(chamber["x"]))
+        )
+        for array in (*chamber.values(), radius_container, tube_index):
+            array.setflags(write=False)
+        return chamber, radius_container, tube_index
+
+    def buildChamber(self):
+        """
+        Allocate every column for the total tube count and fill it one multilayer
+        at a time. Coordinates are computed in float64 and stored as float32.
+        """
+        multilayers = self.config["multilayers"]
+        n_tubes = self.tubes_per_tdc * sum(
+            int(np.count_nonzero(multilayers[name]["activeTDCs"]))
+            for name in multilayers
+        )
+        x = np.empty(n_tubes, dtype=np.float64)
+        y = np.empty(n_tubes, dtype=np.float64)
+        chamber = {
+            key: np.empty(n_tubes, dtype=np.uint8)
+            for key in ("csm_id", "tdc_id", "channel", "layer", "ML")
         }
+        start = 0
+        for multilayer_id, multilayer_name in enumerate(multilayers):
+            multilayer_config = multilayers[multilayer_name]
+            multilayer = self.buildMultilayer(multilayer_config, multilayer_id)
+            stop = start + len(multilayer["x"])
+            if start > 0:
+                multilayer["y"] += (
+                    y[:start].max()
+                    + multilayer_config["radius"]
+                    + self.config["multilayer_spacing"]
+                )
+            x[start:stop] = multilayer.pop("x")
+            y[start:stop] = multilayer.pop("y")
+            for key in multilayer:
+                chamber[key][start:stop] = multilayer[key]
+            start = stop
+        chamber["x"] = x.astype(np.float32)
+        chamber["y"] = y.astype(np.float32)
+        return chamber
+
+    def buildMultilayer(self, multilayer_config, multilayer_id):
+        """
+        The tubes of every active TDC of a multilayer, with the k-th TDC shifted
+        by k TDC widths in x.
+        """
+        active = np.flatnonzero(multilayer_config["activeTDCs"])
+        TDC = self.buildTDC(multilayer_config)
+        n_tubes = len(active) * self.tubes_per_tdc
+        return {
+            "x": (TDC["x"] + (active * TDC["x"].max())[:, np.newaxis]).ravel(),
+            "y": np.tile(TDC["y"], len(active)),
+            "csm_id": np.repeat(
+                np.asarray(multilayer_config["CSM_ids"])[active], self.tubes_per_tdc
+            ),
+            "tdc_id": np.repeat(
+                np.asarray(multilayer_config["TDC_ids"])[active], self.tubes_per_tdc
+            ),
+            "channel": np.tile(TDC["channel"], len(active)),
+            "layer": np.tile(TDC["layer"], len(active)),
+            "ML": np.full(n_tubes, multilayer_id),
+        }
+
+    def buildTDC(self, multilayer_config):
+        """Positions, channels and layers of the 24 tubes of one TDC."""
+        tdc_type = multilayer_config["tdcType"]
+        if tdc_type not in self._tdc_templates:
+            msg = f"Unknown tdcType '{tdc_type}'"
+            raise ValueError(msg)
+        template = self._tdc_templates[tdc_type]
+        layer = np.repeat(np.arange(4), 6)
         x_shift = multilayer_config["radius"] + multilayer_config["tube_spacing"] / 2
-        for tube_num in range(tubesPerLayer):
-            TDC_436["x"][tube_num] = (2 * tube_num + 1) * x_shift
-            TDC_436["x"][tube_num + 6] = (2 * tube_num + 2) * x_shift
-            TDC_436["x"][tube_num + 12] = TDC_436["x"][tube_num]
-            TDC_436["x"][tube_num + 18] = TDC_436["x"][tube_num + 6]
         tube_center_distance = 2 * x_shift
         y_spacing = 0.5 * tube_center_distance * np.sqrt(3)
-        for layer in range(nLayers):
-            TDC_436["y"][tubesPerLayer * layer : tubesPerLayer * (layer + 1)] = (
-                y_spacing * layer + tube_center_distance / 2
-            )
-        # TDC_436['channel'] = TDC_436['channel'] + tdc_id * 100
-        return TDC_436
+        return {
+            "x": template["x_steps"] * x_shift,
+            "y": y_spacing * layer + tube_center_distance / 2,
+            "channel": template["channel"],
+            "layer": layer,
+        }
 
     def getXY(self, tdc_id, channel):
         x = self["x"][
@@ -181,67 +272,175 @@ class Chamber:
         ]
         return x, y
 
+    def getTubeIndex(self, csm_ids, tdc_ids, channels):
+        """
+        Row of every (csm_id, tdc_id, channel) in the chamber arrays, -1 for IDs
+        that are not part of the chamber. Works on scalars and arrays alike.
+        """
+        return self._tube_index[csm_ids, tdc_ids, channels]
+
+    @property
+    def adjacency(self):
+        """
+        Neighbouring tubes in CSR form, built on first use and cached with the
+        chamber.
+
+        Returns:
+        --------
+        indptr, indices : np.ndarray
+        The neighbours of tube i are indices[indptr[i]:indptr[i + 1]], as rows
+        of the chamber arrays.
+
+        kinds : np.ndarray
+        For every entry of indices, its position in adjacency_kinds.
+        """
+        key = self.fingerprint(self.config)
+        if key not in self._adjacency_cache:
+            self._adjacency_cache[key] = self.buildAdjacency()
+        return self._adjacency_cache[key]
+
+    def buildAdjacency(self, tolerance=0.05):
+        """
+        Find the neighbours of every tube from the tube centers.
+
+        Tubes of a multilayer are neighbours when their centers are at most one
+        tube pitch apart, which in the hexagonal packing gives the two tubes
+        beside a tube in its layer and the up to four touching tubes in the
+        layers above and below. Across the gap between consecutive multilayers,
+        tubes are neighbours when they are at most the smallest center distance
+        across the gap apart. Both distances are taken from the geometry and
+        widened by tolerance.
+        """
+        from scipy.spatial import cKDTree
+
+        xy = np.column_stack((self["x"], self["y"])).astype(np.float64)
+        multilayer = self["ML"]
+        tree = cKDTree(xy)
+        pitch = tree.query(xy, k=2)[0][:, 1].min()
+        pairs = tree.query_pairs(pitch * (1 + tolerance), output_type="ndarray")
+        pairs = pairs[multilayer[pairs[:, 0]] == multilayer[pairs[:, 1]]]
+        for ml in range(int(multilayer.max())):
+            lower = np.flatnonzero(multilayer == ml)
+            upper = np.flatnonzero(multilayer == ml + 1)
+            if len(lower) == 0 or len(upper) == 0:
+                continue
+            lower_tree = cKDTree(xy[lower])
+            upper_tree = cKDTree(xy[upper])
+            gap = upper_tree.query(xy[lower])[0].min()
+            close = lower_tree.sparse_distance_matrix(
+                upper_tree, gap * (1 + tolerance), output_type="ndarray"
+            )
+            pairs = np.concatenate(
+                (pairs, np.column_stack((lower[close["i"]], upper[close["j"]])))
+            )
+
+        rows = np.concatenate((pairs[:, 0], pairs[:, 1]))
+        columns = np.concatenate((pairs[:, 1], pairs[:, 0]))
+        order = np.lexsort((columns, rows))
+        rows = rows[order]
+        columns = columns[order]
+        kinds = np.where(
+            multilayer[rows] != multilayer[columns],
+            2,
+            np.where(self["layer"][rows] == self["layer"][columns], 0, 1),
+        ).astype(np.uint8)
+        indptr = np.zeros(len(xy) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=len(xy)), out=indptr[1:])
+        return indptr, columns.astype(np.int32), kinds
+
+    def getNeighbours(self, tube_index, kinds=None):
+        """
+        Rows of the tubes neighbouring a row of the chamber, optionally only those
+        of the given adjacency_kinds names.
+        """
+        indptr, indices, neighbour_kinds = self.adjacency
+        neighbours = indices[indptr[tube_index] : indptr[tube_index + 1]]
+        if kinds is None:
+            return neighbours
+        wanted = [self.adjacency_kinds.index(kind) for kind in kinds]
+        kind = neighbour_kinds[indptr[tube_index] : indptr[tube_index + 1]]
+        return neighbours[np.isin(kind, wanted)]
+
+    def clusterHits(self, csm_ids, tdc_ids, channels, event_offsets, kinds=None):
+        """
+        Group the hits of every event into connected clusters of neighbouring
+        tubes. Hits on the same tube are always in the same cluster.
+
+        Parameters:
+        -----------
+        csm_ids, tdc_ids, channels : np.ndarray
+        Per hit IDs of all events, concatenated.
+
+        event_offsets : np.ndarray
+        The hits of event i are [event_offsets[i], event_offsets[i + 1]).
+
+        kinds : list
+        Names from adjacency_kinds that connect hits, all of them by default.
+
+        Returns:
+        --------
+        labels : np.ndarray
+        int32 cluster number of every hit within its event, numbered in order of
+        each cluster's first hit. -1 for hits on tubes outside the chamber.
+
+        sizes : np.ndarray
+        int32 number of hits in each hit's cluster, 0 outside the chamber.
+        """
+        indptr, indices, neighbour_kinds = self.adjacency
+        if kinds is not None:
+            wanted = [self.adjacency_kinds.index(kind) for kind in kinds]
+            keep = np.isin(neighbour_kinds, wanted)
+            rows = np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))
+            indptr = np.zeros_like(indptr)
+            np.cumsum(
+                np.bincount(rows[keep], minlength=len(indptr) - 1), out=indptr[1:]
+            )
+            indices = indices[keep]
+        tube_ids = np.asarray(self.getTubeIndex(csm_ids, tdc_ids, channels))
+        event_offsets = np.asarray(event_offsets, dtype=np.int64)
+        n_chunks = max(1, min(len(event_offsets) - 1, 4 * get_num_threads()))
+        return _cluster_hits(tube_ids, event_offsets, indptr, indices, n_chunks)
+
+    def removeIsolatedHits(self, batch, min_cluster_size=2, kinds=None):
+        """
+        Drop the hits of clusters smaller than min_cluster_size, e.g. isolated
+        noise hits, from a columnar batch. Every event keeps its place, possibly
+        with fewer (or no) hits.
+        """
+        _, sizes = self.clusterHits(
+            batch["csm_id"],
+            batch["tdc_id"],
+            batch["channel"],
+            batch["event_offsets"],
+            kinds,
+        )
+        return selectHits(batch, sizes >= min_cluster_size)
+
     def getRadius(self, tdc_id):
         return self._radius_container[tdc_id]
 
-    def fillRadiusContainer(self):
-        max_tdc = np.max(self.chamber["tdc_id"] + 1)
-        self._radius_container = np.zeros(max_tdc, dtype=np.float32)
+    def fillRadiusContainer(self, chamber):
+        max_tdc = np.max(chamber["tdc_id"] + 1)
+        radius_container = np.zeros(max_tdc, dtype=np.float32)
         for multilayer in self.config["multilayers"]:
             for tdc_id in self.config["multilayers"][multilayer]["TDC_ids"]:
-                self._radius_container[tdc_id] = self.config["multilayers"][multilayer][
+                radius_container[tdc_id] = self.config["multilayers"][multilayer][
                     "radius"
                 ]
+        return radius_container
 
     def draw(self, ax=None, key=None):
-        if ax is None:
-            fig, ax = plt.subplots(figsize=(10, 6))
-        xmax = self.chamber["x"].max()
-        xmin = self.chamber["x"].min()
-        ymax = self.chamber["y"].max()
-        ymin = self.chamber["y"].min()
-        Ntubes = len(self.chamber["x"])
-        patches = []
-        for tube in range(Ntubes):
-            ml_num = self.chamber["ML"][tube]
-            radius = self.config["multilayers"][f"multilayer{int(ml_num + 1)}"][
-                "radius"
-            ]
-            center = (self.chamber["x"][tube], self.chamber["y"][tube])
-            if int(self.chamber["tdc_id"][tube] / 2) % 2 == 1:
-                circle = Circle(
-                    center, radius, fill=True, facecolor="lightgrey", ec="black", lw=1
-                )
-            else:
-                circle = Circle(center, radius, fill=False, ec="black", lw=1)
-            if key == "channel":
-                ax.text(
-                    center[0],
-                    center[1],
-                    self.chamber["channel"][tube] % 100,
-                    color="black",
-                    fontsize=10,
-                    ha="center",
-                    va="center",
-                )
-            elif key is not None:
-                ax.text(
-                    center[0],
-                    center[1],
-                    self.chamber[key][tube],
-                    color="black",
-                    fontsize=10,
-                    ha="center",
-                    va="center",
-                )
-            # ax.add_patch(circle)
-            patches.append(circle)
-        collection = PatchCollection(patches, match_original=True)
-        ax.add_collection(collection)
-        ax.set_xlim(xmin - radius * 2, xmax + radius * 2)
-        ax.set_ylim(ymin - radius * 2, ymax + radius * 2)
-
-        ax.set_xlabel("x[mm]")
-        ax.set_ylabel("y[mm]")
-        ax.set_aspect("equal")
-        ax.set_title("Chamber Geometry")
+        from .Plotting import drawChamber
+
+        drawChamber(self, ax=ax, key=key)
+
+
+def warmup():
+    """
+    Compile (or load from the on-disk cache) the hit clustering kernel for the
+    int64 tube rows returned by getTubeIndex.
+    """
+    indptr = np.array([0, 1, 2], dtype=np.int64)
+    indices = np.array([1, 0], dtype=np.int32)
+    tube_ids = np.array([0, 1, -1], dtype=np.int64)
+    _cluster_hits(tube_ids, np.array([0, 3], dtype=np.int64), indptr, indices, 1)
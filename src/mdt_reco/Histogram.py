@@ -0,0 +1,316 @@
+import numpy as np
+
+from .TDCFitter import TDCFitter
+
+
+class HitHistogram:
+    """
+    A mergeable (tdc, channel, bin) histogram of one hit quantity, e.g. tdc_time or
+    adc_time.
+
+    Histograms can be filled chunk by chunk from a stream of events, added together
+    with + across processes or machines, and saved to and loaded from disk, so a
+    calibration can be run as map-reduce over an arbitrarily large run. The TDC and
+    channel axes cover every value the Phase2 format can encode (5 bits each), so
+    any two histograms with the same key and bin edges can be merged.
+
+    There is no CSM axis, which would multiply the memory by 8. A histogram holds
+    the hits of a single CSM instead: filling it with hits of another CSM, or
+    merging histograms of different CSMs, raises a ValueError. Fill one histogram
+    per CSM for a chamber read out by several.
+
+    With slice_edges the histogram gets a leading slice axis, filled in the same
+    pass from a per hit slice variable: the event number (counted across every
+    fillEvents call) or any per hit key such as a trigger time. This is what is
+    needed to follow t0 drifting during a run.
+
+    Attributes:
+    -----------
+    key : str
+    The Event key being histogrammed.
+
+    bin_edges : np.ndarray
+    The bin edges shared by every (tdc, channel) histogram.
+
+    counts : np.ndarray
+    int64 array of shape (n_tdcs, n_channels, n_bins), or
+    (n_slices, n_tdcs, n_channels, n_bins) when sliced.
+
+    slice_edges : np.ndarray
+    Edges of the slices in units of slice_key, or None.
+
+    slice_key : str
+    "event_number" or the Event key the slices are taken from.
+
+    n_events : int
+    Number of events filled through fillEvents and fillBatch.
+
+    csm_id : int
+    The CSM of every hit filled so far, None before the first hit.
+    """
+
+    n_tdcs = 32
+    n_channels = 32
+
+    def __init__(
+        self,
+        bin_edges,
+        key="tdc_time",
+        counts=None,
+        slice_edges=None,
+        slice_key="event_number",
+        n_events=0,
+        csm_id=None,
+    ):
+        self.key = key
+        self.bin_edges = np.asarray(bin_edges, dtype=np.float64)
+        self.slice_key = slice_key
+        self.slice_edges = None
+        shape = (self.n_tdcs, self.n_channels, len(self.bin_edges) - 1)
+        if slice_edges is not None:
+            self.slice_edges = np.asarray(slice_edges, dtype=np.float64)
+            shape = (len(self.slice_edges) - 1, *shape)
+        if counts is None:
+            counts = np.zeros(shape, dtype=np.int64)
+        elif counts.shape != shape:
+            msg = f"Counts of shape {counts.shape} do not match {shape}"
+            raise ValueError(msg)
+        self.counts = counts
+        self.n_events = n_events
+        self.csm_id = csm_id
+        self._fitter = TDCFitter()
+
+    @classmethod
+    def fromConfig(cls, config, key="tdc_time"):
+        """
+        Build an empty histogram with the binning in the TDCFitting section of the
+        config. tdc_time uses fine_bins so the histogram can be rebinned later,
+        adc_time uses adc_bins.
+        """
+        fitting = config["TDCFitting"]
+        if key == "tdc_time":
+            bin_edges = np.linspace(
+                fitting["tdc_min"],
+                fitting["tdc_max"],
+                fitting.get("fine_bins", 3200) + 1,
+            )
+        elif key == "adc_time":
+            bin_edges = np.linspace(
+                fitting["adc_min"], fitting["adc_max"], fitting["adc_bins"] + 1
+            )
+        else:
+            msg = f"No binning configured for key '{key}'"
+            raise KeyError(msg)
+        return cls(bin_edges, key=key)
+
+    def __repr__(self):
+        return (
+            f"HitHistogram(key={self.key!r}, bins={len(self.bin_edges) - 1}, "
+            f"entries={self.entries})"
+        )
+
+    @property
+    def sliced(self):
+        return self.slice_edges is not None
+
+    @property
+    def slice_centers(self):
+        if not self.sliced:
+            return None
+        return (self.slice_edges[:-1] + self.slice_edges[1:]) / 2
+
+    @property
+    def entries(self):
+        return int(self.counts.sum())
+
+    @property
+    def bin_centers(self):
+        return ((self.bin_edges[:-1] + self.bin_edges[1:]) / 2).astype(np.float32)
+
+    def integrated(self):
+        """The histogram summed over slices."""
+        if not self.sliced:
+            return self
+        return HitHistogram(
+            self.bin_edges,
+            self.key,
+            self.counts.sum(axis=0),
+            n_events=self.n_events,
+            csm_id=self.csm_id,
+        )
+
+    def fill(self, tdc_ids, tdc_channels, values, slice_values=None, csm_ids=None):
+        """
+        Add the hits given as flat per hit arrays. A sliced histogram also needs
+        the per hit slice_values. Given the per hit csm_ids, hits of a CSM other
+        than csm_id raise a ValueError before anything is filled.
+        """
+        if len(values) == 0:
+            return
+        if csm_ids is not None:
+            self._checkCsm(np.asarray(csm_ids))
+        slice_ids = None
+        n_slices = None
+        if self.sliced:
+            if slice_values is None:
+                msg = "A sliced histogram needs slice_values"
+                raise ValueError(msg)
+            slice_ids = np.searchsorted(self.slice_edges, slice_values, side="right")
+            slice_ids -= 1
+            slice_ids[slice_values == self.slice_edges[-1]] = len(self.slice_edges) - 2
+            n_slices = len(self.slice_edges) - 1
+        counts, _ = self._fitter.getHistoCube(
+            tdc_ids,
+            tdc_channels,
+            values,
+            self.bin_edges,
+            self.n_tdcs,
+            self.n_channels,
+            slice_ids,
+            n_slices,
+        )
+        self.counts += counts
+
+    def _checkCsm(self, csm_ids):
+        first, last = int(csm_ids.min()), int(csm_ids.max())
+        if first != last:
+            msg = (
+                f"Hits of CSMs {first} to {last} cannot share a {self}, which has "
+                "no CSM axis. Fill one histogram per CSM"
+            )
+            raise ValueError(msg)
+        if self.csm_id is not None and first != self.csm_id:
+            msg = (
+                f"Hits of CSM {first} cannot be filled into {self} of CSM {self.csm_id}"
+            )
+            raise ValueError(msg)
+        self.csm_id = first
+
+    def fillBatch(self, batch):
+        """
+        Add the hits of a columnar batch (see eventsToBatch). A histogram sliced
+        in event_number takes the batch's event_number as is.
+        """
+        slice_values = batch[self.slice_key] if self.sliced else None
+        self.fill(
+            batch["tdc_id"],
+            batch["channel"],
+            batch[self.key],
+            slice_values,
+            batch["csm_id"],
+        )
+        self.n_events += len(batch["event_offsets"]) - 1
+
+    def fillEvents(self, events, chunk_size=10000):
+        """
+        Add the hits of an iterable of events. The iterable is consumed chunk_size
+        events at a time, so only one chunk of hits is held in memory.
+        """
+        chunk = []
+        for event in events:
+            chunk.append(event)
+            if len(chunk) == chunk_size:
+                self._fillChunk(chunk)
+                chunk = []
+        if chunk:
+            self._fillChunk(chunk)
+
+    def _fillChunk(self, events):
+        tdc_ids = np.concatenate([event["tdc_id"] for event in events])
+        tdc_channels = np.concatenate([event["channel"] for event in events])
+        values = np.concatenate([event[self.key] for event in events])
+        csm_ids = np.concatenate([event["csm_id"] for event in events])
+        slice_values = None
+        if self.sliced and self.slice_key == "event_number":
+            hits_per_event = [len(event["tdc_id"]) for event in events]
+            slice_values = np.repeat(
+                np.arange(self.n_events, self.n_events + len(events)), hits_per_event
+            )
+        elif self.sliced:
+            slice_values = np.concatenate([event[self.slice_key] for event in events])
+        self.fill(tdc_ids, tdc_channels, values, slice_values, csm_ids)
+        self.n_events += len(events)
+
+    def _checkCompatible(self, other):
+        if not isinstance(other, HitHistogram):
+            return False
+        if (
+            self.key != other.key
+            or self.slice_key != other.slice_key
+            or not np.array_equal(self.bin_edges, other.bin_edges)
+            or self.sliced != other.sliced
+            or (self.sliced and not np.array_equal(self.slice_edges, other.slice_edges))
+        ):
+            msg = "Cannot merge histograms with different keys, bin or slice edges"
+            raise ValueError(msg)
+        if None not in (self.csm_id, other.csm_id) and self.csm_id != other.csm_id:
+            msg = f"Cannot merge histograms of CSM {self.csm_id} and {other.csm_id}"
+            raise ValueError(msg)
+        return True
+
+    def _copyWith(self, counts, n_events, csm_id):
+        return HitHistogram(
+            self.bin_edges,
+            self.key,
+            counts,
+            self.slice_edges,
+            self.slice_key,
+            n_events,
+            csm_id,
+        )
+
+    def __add__(self, other):
+        if not self._checkCompatible(other):
+            return NotImplemented
+        return self._copyWith(
+            self.counts + other.counts,
+            self.n_events + other.n_events,
+            self.csm_id if other.csm_id is None else other.csm_id,
+        )
+
+    def __radd__(self, other):
+        # Allows sum() over a list of histograms
+        if isinstance(other, int) and other == 0:
+            return self._copyWith(self.counts.copy(), self.n_events, self.csm_id)
+        return self.__add__(other)
+
+    def __iadd__(self, other):
+        if not self._checkCompatible(other):
+            return NotImplemented
+        self.counts += other.counts
+        self.n_events += other.n_events
+        if other.csm_id is not None:
+            self.csm_id = other.csm_id
+        return self
+
+    def save(self, file):
+        optional = {}
+        if self.sliced:
+            optional = {"slice_edges": self.slice_edges, "slice_key": self.slice_key}
+        if self.csm_id is not None:
+            optional["csm_id"] = self.csm_id
+        np.savez_compressed(
+            file,
+            key=self.key,
+            bin_edges=self.bin_edges,
+            counts=self.counts,
+            n_events=self.n_events,
+            **optional,
+        )
+
+    @classmethod
+    def load(cls, file):
+        with np.load(file) as data:
+            slice_edges = data["slice_edges"] if "slice_edges" in data else None
+            slice_key = str(data["slice_key"]) if "slice_key" in data else None
+            n_events = int(data["n_events"]) if "n_events" in data else 0
+            csm_id = int(data["csm_id"]) if "csm_id" in data else None
+            return cls(
+                data["bin_edges"],
+                key=str(data["key"]),
+                counts=data["counts"],
+                slice_edges=slice_edges,
+                slice_key=slice_key or "event_number",
+                n_events=n_events,
+                csm_id=csm_id,
+            )
@@ -0,0 +1,543 @@
+import asyncio
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from .Event import concatBatches
+from .Histogram import HitHistogram
+from .Signal import EventFramer, Signal
+from .TrackFitter import TrackFitter
+
+
+def _processWords(config, words, first_event_number, calibration, rt_function):
+    """
+    Decode the words of complete events and histogram their hits, then, given a
+    TDC calibration and r(t), fit their tracks. Run in a worker process.
+    """
+    batch = Signal(config).decodeWords(words)
+    batch["event_number"] += first_event_number
+    tdc_hist = HitHistogram.fromConfig(config, "tdc_time")
+    adc_hist = HitHistogram.fromConfig(config, "adc_time")
+    tdc_hist.fillBatch(batch)
+    adc_hist.fillBatch(batch)
+    theta = d = None
+    if calibration is not None:
+        calibration.apply(batch, event_offset=0)
+        if rt_function is not None:
+            rt_function.apply(batch)
+            theta, d = TrackFitter().fitCosmicBatch(
+                batch["x"], batch["y"], batch["drift_radius"], batch["event_offsets"]
+            )
+    return {
+        "batch": batch,
+        "tdc_hist": tdc_hist,
+        "adc_hist": adc_hist,
+        "theta": theta,
+        "d": d,
+    }
+
+
+def _initWorker():
+    """Compile or load the Numba kernels before the worker takes a batch."""
+    from . import warmup
+
+    warmup()
+
+
+def _workerReady():
+    return os.getpid()
+
+
+def _socketDrops(sock):
+    """
+    Datagrams the kernel dropped because the receive buffer of a UDP socket was
+    full, read from /proc/net/udp. None where that is not available.
+    """
+    inode = str(os.fstat(sock.fileno()).st_ino)
+    for table in ("/proc/net/udp", "/proc/net/udp6"):
+        try:
+            with open(table) as f:
+                rows = [line.split() for line in f.readlines()[1:]]
+        except OSError:
+            continue
+        for row in rows:
+            if row[9] == inode:
+                return int(row[-1])
+    return None
+
+
+class _Stream:
+    """The framer of one sender and the framed words not handed over yet."""
+
+    def __init__(self, signal):
+        self.framer = EventFramer(signal)
+        self.chunks = []
+        self.n_words = 0
+        self.n_events = 0
+        self.n_datagrams = 0
+        self.since = None
+
+    def add(self, words, first_event_number):
+        if len(words) == 0:
+            return
+        if self.since is None:
+            self.since = time.monotonic()
+        self.chunks.append(words)
+        self.n_words += len(words)
+        self.n_events += self.framer.n_events - first_event_number
+
+    def due(self, batch_words, max_delay):
+        return self.n_words >= batch_words or (
+            self.since is not None and time.monotonic() - self.since >= max_delay
+        )
+
+    def take(self):
+        words = np.concatenate(self.chunks) if self.chunks else np.zeros(0, np.uint64)
+        n_events = self.n_events
+        self.chunks = []
+        self.n_words = 0
+        self.n_events = 0
+        self.n_datagrams = 0
+        self.since = None
+        return words, n_events
+
+
+class _DatagramProtocol(asyncio.DatagramProtocol):
+    def __init__(self, server):
+        self.server = server
+
+    def datagram_received(self, data, addr):
+        self.server._receiveDatagram(data, addr)
+
+
+class IngestServer:
+    """
+    Receives Phase2 words over TCP or UDP, frames them into events with an
+    EventFramer per sender and hands batches of complete events to a pool of
+    worker processes, which decode them, histogram their hits and, given a TDC
+    calibration and r(t), fit their tracks.
+
+    The workers are started, and have compiled or loaded the Numba kernels, before
+    the server listens, so the first batches do not wait for a cold pool.
+
+    Backpressure: at most max_pending batches are in the pool at once. A TCP
+    connection stops being read while the pool is full, so TCP flow control
+    slows the sender down. UDP has no flow control, so a batch framed while the
+    pool is full is dropped and counted in dropped_words, dropped_events and
+    dropped_datagrams. Datagrams the kernel drops before they are read, because
+    the socket's receive buffer is full, are counted in overflowed_datagrams
+    (Linux only, None elsewhere).
+
+    Results are merged in the order the batches were handed over, and events are
+    numbered across every sender in that order, so event_number is unique.
+
+    Attributes:
+    -----------
+    host, port : str, int
+    Where the server listens. Port 0 picks a free port, stored in port by start.
+
+    tdc_hist, adc_hist : HitHistogram
+    The tdc_time and adc_time histograms of every event received.
+
+    n_events, n_hits, n_bytes, n_datagrams, n_batches : int
+    Events and hits decoded, bytes and UDP datagrams received and batches
+    processed so far.
+
+    theta, d : list
+    Per batch track parameters, filled when calibration and rt_function are set.
+
+    batches : list
+    The decoded batches, kept only with keep_batches.
+    """
+
+    def __init__(
+        self,
+        config,
+        host="127.0.0.1",
+        port=0,
+        protocol="tcp",
+        workers=None,
+        max_pending=None,
+        batch_words=2**16,
+        max_delay=0.5,
+        calibration=None,
+        rt_function=None,
+        keep_batches=False,
+    ):
+        """
+        Parameters:
+        -----------
+        config : ConfigParser
+        The run config, with the Signal, Reconstruction and TDCFitting sections.
+
+        protocol : str
+        "tcp" or "udp".
+
+        workers : int
+        Number of worker processes, os.cpu_count() when None.
+
+        max_pending : int
+        Batches in the pool at once, twice the number of workers when None.
+
+        batch_words : int
+        Framed words collected from a sender before they are handed over.
+
+        max_delay : float
+        Seconds after which fewer framed words are handed over anyway, which
+        bounds the latency of a slow stream.
+
+        calibration : TDCCalibration
+        Fills drift_time, needed for track fits.
+
+        rt_function : RTFunction
+        Fills drift_radius. Tracks are fitted when it and calibration are set.
+
+        keep_batches : bool
+        Keep every decoded batch in batches, see batch.
+        """
+        if protocol not in ("tcp", "udp"):
+            msg = f"Protocol must be 'tcp' or 'udp', not {protocol!r}"
+            raise ValueError(msg)
+        self.config = config
+        self.host = host
+        self.port = port
+        self.protocol = protocol
+        self.workers = os.cpu_count() if workers is None else workers
+        self.max_pending = 2 * self.workers if max_pending is None else max_pending
+        self.batch_words = batch_words
+        self.max_delay = max_delay
+        self.calibration = calibration
+        self.rt_function = rt_function
+        self.keep_batches = keep_batches
+        self.tdc_hist = HitHistogram.fromConfig(config, "tdc_time")
+        self.adc_hist = HitHistogram.fromConfig(config, "adc_time")
+        self.n_events = 0
+        self.n_hits = 0
+        self.n_bytes = 0
+        self.n_datagrams = 0
+        self.n_batches = 0
+        self.dropped_words = 0
+        self.dropped_events = 0
+        self.dropped_datagrams = 0
+        self.overflowed_datagrams = None
+        self.theta = []
+        self.d = []
+        self.batches = []
+        self.error = None
+        self._signal = Signal(config)
+        self._next_event = 0
+        self._streams = {}
+        self._handlers = set()
+        self._server = None
+        self._transport = None
+        self._executor = None
+        self._slots = None
+        self._order = None
+        self._tasks = []
+        self._closing = None
+        self._start_time = None
+
+    def __repr__(self):
+        return (
+            f"IngestServer(protocol={self.protocol!r}, host={self.host!r}, "
+            f"port={self.port}, workers={self.workers}, n_events={self.n_events})"
+        )
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc_info):
+        await self.stop()
+
+    async def start(self):
+        """Start the workers, wait until they are warmed up, then listen."""
+        loop = asyncio.get_running_loop()
+        # Workers come from a forkserver rather than a fork of this process, whose
+        # Numba threading layer may already be running threads
+        self._executor = ProcessPoolExecutor(
+            self.workers,
+            mp_context=multiprocessing.get_context("forkserver"),
+            initializer=_initWorker,
+        )
+        # The pool starts a worker per job while none is idle, so one job per
+        # worker starts them all, and each job waits for its initializer
+        await asyncio.gather(
+            *(
+                loop.run_in_executor(self._executor, _workerReady)
+                for _ in range(self.workers)
+            )
+        )
+        self._slots = asyncio.Queue(self.max_pending)
+        self._order = asyncio.Queue()
+        self._closing = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._collect())]
+        if self.protocol == "tcp":
+            self._server = await asyncio.start_server(
+                self._handleConnection, self.host, self.port
+            )
+            self.port = self._server.sockets[0].getsockname()[1]
+        else:
+            self._transport, _ = await loop.create_datagram_endpoint(
+                lambda: _DatagramProtocol(self), local_addr=(self.host, self.port)
+            )
+            self.port = self._transport.get_extra_info("sockname")[1]
+            self._tasks.append(asyncio.create_task(self._flushIdle()))
+        self._start_time = time.monotonic()
+        return self
+
+    async def stop(self):
+        """
+        Stop listening, read open TCP connections until they close or go idle,
+        hand over what every sender left buffered, wait for the batches in the
+        pool and stop the workers. Re-raises the first error a batch raised.
+        """
+        self._closing.set()
+        if self._server is not None:
+            self._server.close()
+            await asyncio.gather(*self._handlers)
+            await self._server.wait_closed()
+        if self._transport is not None:
+            self._updateOverflows()
+            self._transport.close()
+            for stream in self._streams.values():
+                stream.add(*stream.framer.flushWords())
+                await self._submit(stream)
+        for task in self._tasks[1:]:
+            task.cancel()
+        await self._order.put(None)
+        await self._tasks[0]
+        self._executor.shutdown()
+        if self.error is not None:
+            raise self.error
+
+    async def serve(self, duration=None, report_interval=None, report=None):
+        """
+        Run until duration seconds have passed, or until cancelled, calling
+        report(summary) every report_interval seconds.
+        """
+        await self.start()
+        try:
+            start = time.monotonic()
+            while duration is None or time.monotonic() - start < duration:
+                interval = report_interval or 1.0
+                if duration is not None:
+                    interval = min(interval, start + duration - time.monotonic())
+                await asyncio.sleep(max(interval, 0))
+                if report is not None and report_interval is not None:
+                    report(self.summary())
+        finally:
+            await self.stop()
+
+    def summary(self):
+        """Counters and rates of what has been received so far."""
+        elapsed = (
+            0.0 if self._start_time is None else time.monotonic() - self._start_time
+        )
+        if self._transport is not None and not self._transport.is_closing():
+            self._updateOverflows()
+        return {
+            "n_events": self.n_events,
+            "n_hits": self.n_hits,
+            "n_bytes": self.n_bytes,
+            "n_datagrams": self.n_datagrams,
+            "n_batches": self.n_batches,
+            "pending_batches": 0 if self._slots is None else self._slots.qsize(),
+            "dropped_words": self.dropped_words,
+            "dropped_events": self.dropped_events,
+            "dropped_datagrams": self.dropped_datagrams,
+            "overflowed_datagrams": self.overflowed_datagrams,
+            "event_rate": self.n_events / elapsed if elapsed > 0 else 0.0,
+            "byte_rate": self.n_bytes / elapsed if elapsed > 0 else 0.0,
+        }
+
+    def batch(self):
+        """The kept batches as one batch, see keep_batches."""
+        if not self.keep_batches:
+            msg = "Batches are only kept with keep_batches=True"
+            raise RuntimeError(msg)
+        return concatBatches(self.batches)
+
+    async def _handleConnection(self, reader, writer):
+        self._handlers.add(asyncio.current_task())
+        stream = _Stream(self._signal)
+        try:
+            while True:
+                try:
+                    data = await asyncio.wait_for(reader.read(2**16), self.max_delay)
+                except TimeoutError:
+                    data = None
+                # On stop a connection is read until the sender closes it or
+                # sends nothing for max_delay
+                if data == b"" or (data is None and self._closing.is_set()):
+                    break
+                if data:
+                    self.n_bytes += len(data)
+                    stream.add(*stream.framer.frame(data))
+                if stream.due(self.batch_words, self.max_delay):
+                    # Waits while the pool is full, so the socket is not read
+                    await self._submit(stream)
+            stream.add(*stream.framer.flushWords())
+            await self._submit(stream)
+        finally:
+            writer.close()
+            self._handlers.discard(asyncio.current_task())
+
+    def _receiveDatagram(self, data, addr):
+        if self._closing.is_set():
+            return
+        self.n_bytes += len(data)
+        self.n_datagrams += 1
+        stream = self._streams.get(addr)
+        if stream is None:
+            stream = self._streams[addr] = _Stream(self._signal)
+        stream.n_datagrams += 1
+        stream.add(*stream.framer.frame(data))
+        if stream.due(self.batch_words, self.max_delay):
+            self._submitNowait(stream)
+
+    async def _flushIdle(self):
+        while True:
+            await asyncio.sleep(self.max_delay)
+            for stream in self._streams.values():
+                if stream.due(self.batch_words, self.max_delay):
+                    self._submitNowait(stream)
+
+    async def _submit(self, stream):
+        words, n_events = stream.take()
+        if len(words) == 0:
+            return
+        await self._slots.put(None)
+        self._dispatch(words, n_events)
+
+    def _submitNowait(self, stream):
+        n_datagrams = stream.n_datagrams
+        words, n_events = stream.take()
+        if len(words) == 0:
+            return
+        if self._slots.full():
+            self.dropped_words += len(words)
+            self.dropped_events += n_events
+            self.dropped_datagrams += n_datagrams
+            return
+        self._slots.put_nowait(None)
+        self._dispatch(words, n_events)
+
+    def _updateOverflows(self):
+        self.overflowed_datagrams = _socketDrops(
+            self._transport.get_extra_info("socket")
+        )
+
+    def _dispatch(self, words, n_events):
+        first_event_number = self._next_event
+        self._next_event += n_events
+        future = asyncio.get_running_loop().run_in_executor(
+            self._executor,
+            _processWords,
+            self.config,
+            words,
+            first_event_number,
+            self.calibration,
+            self.rt_function,
+        )
+        self._order.put_nowait(future)
+
+    async def _collect(self):
+        while True:
+            future = await self._order.get()
+            if future is None:
+                return
+            try:
+                result = await future
+            except Exception as error:
+                self.error = self.error or error
+                continue
+            finally:
+                self._slots.get_nowait()
+            self._merge(result)
+
+    def _merge(self, result):
+        batch = result["batch"]
+        self.tdc_hist += result["tdc_hist"]
+        self.adc_hist += result["adc_hist"]
+        self.n_events += len(batch["event_offsets"]) - 1
+        self.n_hits += len(batch["tdc_id"])
+        self.n_batches += 1
+        if result["theta"] is not None:
+            self.theta.append(result["theta"])
+            self.d.append(result["d"])
+        if self.keep_batches:
+            self.batches.append(batch)
+
+
+def _readBytes(file):
+    with open(file, "rb") as f:
+        return f.read()
+
+
+async def replay(
+    config, binary_file, host="127.0.0.1", port=9000, protocol="tcp", rate=None
+):
+    """
+    Stream a raw file to an IngestServer, for testing it on one machine.
+
+    Parameters:
+    -----------
+    config : ConfigParser
+    The run config, giving the word size of the Signal DataType.
+
+    binary_file : str
+    The raw file to send.
+
+    rate : float
+    Words per second to send at, as fast as possible when None. Over TCP the
+    sender also waits whenever the server applies backpressure.
+
+    Returns:
+    --------
+    summary : dict
+    Bytes and words sent, seconds taken and the achieved words per second.
+    """
+    word_bytes = Signal(config)._header_length
+    data = await asyncio.to_thread(_readBytes, binary_file)
+    # 1024 words per packet keeps UDP datagrams well below the 64 kB limit
+    packet_bytes = 1024 * word_bytes
+    loop = asyncio.get_running_loop()
+    if protocol == "tcp":
+        _, writer = await asyncio.open_connection(host, port)
+        send = writer.write
+    elif protocol == "udp":
+        transport, _ = await loop.create_datagram_endpoint(
+            asyncio.DatagramProtocol, remote_addr=(host, port)
+        )
+        send = transport.sendto
+    else:
+        msg = f"Protocol must be 'tcp' or 'udp', not {protocol!r}"
+        raise ValueError(msg)
+
+    start = time.monotonic()
+    for offset in range(0, len(data), packet_bytes):
+        send(data[offset : offset + packet_bytes])
+        if protocol == "tcp":
+            await writer.drain()
+        delay = 0.0
+        if rate is not None:
+            sent_words = (offset + packet_bytes) / word_bytes
+            delay = start + sent_words / rate - time.monotonic()
+        # Also yields to the loop between UDP datagrams when there is no rate
+        await asyncio.sleep(max(delay, 0.0))
+    if protocol == "tcp":
+        writer.close()
+        await writer.wait_closed()
+    else:
+        transport.close()
+    seconds = time.monotonic() - start
+    n_words = len(data) // word_bytes
+    return {
+        "bytes": len(data),
+        "words": n_words,
+        "seconds": seconds,
+        "words_per_second": n_words / seconds if seconds > 0 else float("inf"),
+    }
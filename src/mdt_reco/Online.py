@@ -0,0 +1,178 @@
+import copy
+import threading
+import time
+
+import numpy as np
+
+from .Histogram import HitHistogram
+from .Signal import Signal
+from .TDCFitter import TDCFitter
+
+
+class OnlineMonitor:
+    """
+    Decodes a raw file while the DAQ is still writing it and keeps histograms of
+    the hits up to date, for t0 and occupancy monitoring during a run.
+
+    A reader thread follows the file with Signal.follow and fills every
+    accumulator with each batch of complete events, so the caller is free to
+    poll snapshot at its own pace. Events reach the histograms at most
+    poll_interval after they are written.
+
+    Attributes:
+    -----------
+    tdc_hist, adc_hist : HitHistogram
+    The tdc_time and adc_time histograms, binned as in the TDCFitting config.
+
+    accumulators : list
+    Everything filled with each batch: the two histograms plus any extra object
+    with a fillBatch(batch) method.
+
+    n_events, n_hits : int
+    Events and hits decoded so far.
+
+    last_update : float
+    time.monotonic() when events were last filled, or None.
+
+    error : Exception
+    What stopped the reader thread, re-raised by stop, or None.
+    """
+
+    def __init__(
+        self,
+        config,
+        binary_file,
+        accumulators=(),
+        poll_interval=0.5,
+        flush_after=None,
+    ):
+        """
+        Parameters:
+        -----------
+        config : ConfigParser
+        The run config, with the Signal, Reconstruction and TDCFitting sections.
+
+        binary_file : str
+        The raw file being written.
+
+        accumulators : list
+        Extra objects with a fillBatch(batch) method, e.g. sliced histograms.
+
+        poll_interval, flush_after : float
+        See Signal.follow.
+        """
+        self.binary_file = binary_file
+        self.poll_interval = poll_interval
+        self.flush_after = flush_after
+        self.tdc_hist = HitHistogram.fromConfig(config, "tdc_time")
+        self.adc_hist = HitHistogram.fromConfig(config, "adc_time")
+        self.accumulators = [self.tdc_hist, self.adc_hist, *accumulators]
+        fitting = config["TDCFitting"]
+        self._time_binning = np.linspace(
+            fitting["tdc_min"], fitting["tdc_max"], fitting["tdc_bins"] + 1
+        )
+        self.n_events = 0
+        self.n_hits = 0
+        self.last_update = None
+        self.error = None
+        self._signal = Signal(config)
+        self._fitter = TDCFitter()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._start_time = None
+
+    def __repr__(self):
+        return (
+            f"OnlineMonitor(binary_file={self.binary_file!r}, "
+            f"n_events={self.n_events}, running={self.running})"
+        )
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """Start the reader thread."""
+        if self.running:
+            msg = "The monitor is already running"
+            raise RuntimeError(msg)
+        self._stop.clear()
+        self._start_time = time.monotonic()
+        self._thread = threading.Thread(
+            target=self._follow, name="OnlineMonitor", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        """
+        Decode what is left in the file, stop the reader thread and re-raise
+        whatever stopped it early.
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        if self.error is not None:
+            raise self.error
+
+    def _follow(self):
+        try:
+            for batch in self._signal.follow(
+                self.binary_file,
+                poll_interval=self.poll_interval,
+                flush_after=self.flush_after,
+                stop=self._stop,
+            ):
+                with self._lock:
+                    for accumulator in self.accumulators:
+                        accumulator.fillBatch(batch)
+                    self.n_events += len(batch["event_offsets"]) - 1
+                    self.n_hits += len(batch["tdc_id"])
+                    self.last_update = time.monotonic()
+        except Exception as error:
+            self.error = error
+
+    def snapshot(self):
+        """
+        A consistent view of what has been decoded so far.
+
+        Returns:
+        --------
+        snapshot : dict
+        n_events, n_hits, event_rate (events per second since start), idle
+        (seconds since events were last filled, None before the first),
+        occupancy (hits per event of every (tdc, channel)), t0 (per TDC, fitted
+        to the sum of its channels rebinned to tdc_bins, NaN when too sparse)
+        and copies of tdc_hist and adc_hist.
+        """
+        with self._lock:
+            tdc_hist = copy.deepcopy(self.tdc_hist)
+            adc_hist = copy.deepcopy(self.adc_hist)
+            n_events = self.n_events
+            n_hits = self.n_hits
+            last_update = self.last_update
+        now = time.monotonic()
+        elapsed = 0.0 if self._start_time is None else now - self._start_time
+        per_channel = tdc_hist.counts.sum(axis=-1)
+        # fit on the tdc_bins binning of fitTDCCalibration, not the fine bins
+        time_counts, time_centers = self._fitter.rebinHisto(
+            tdc_hist.counts.sum(axis=1), tdc_hist.bin_edges, self._time_binning
+        )
+        t0 = self._fitter.fitT0Batch(time_counts, time_centers, n_steps=1000)
+        return {
+            "n_events": n_events,
+            "n_hits": n_hits,
+            "event_rate": n_events / elapsed if elapsed > 0 else 0.0,
+            "idle": None if last_update is None else now - last_update,
+            "occupancy": per_channel / max(n_events, 1),
+            "t0": np.where(per_channel.sum(axis=1) > 0, t0, np.nan),
+            "tdc_hist": tdc_hist,
+            "adc_hist": adc_hist,
+        }
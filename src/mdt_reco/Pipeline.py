@@ -0,0 +1,419 @@
+import argparse
+import os
+import pickle
+import time
+
+import numpy as np
+
+from .Calibration import fitTDCCalibration
+from .ConfigParser import ConfigParser
+from .Event import batchToEvents, concatBatches, eventsToBatch
+from .Gen import Generator
+from .Histogram import HitHistogram
+from .Profiling import active, addCounts, capture, configure, finish, profiled, stage
+from .RTCalibrator import RTCalibrator
+from .Signal import Signal
+from .TrackFitter import TrackFitter
+
+
+def _runChunk(config, n_events, seed, first_event_id, keep_events, keep_words, profile):
+    """
+    Generate, encode and decode one chunk of muons and histogram its hits. Run in
+    a worker process, so chunks pass through the stages concurrently. profile is
+    None or the memory option of the parent's profiler, whose stages the chunk's
+    report is merged into.
+    """
+    with capture(profile is not None, memory=bool(profile)) as profiler:
+        with stage("Pipeline.chunk"):
+            generator = Generator(config, seed=seed)
+            sim_events = generator.simEvents(n_events)
+            track_params = generator.findTrajectories(B=0, sim_events=sim_events)
+            events = []
+            event_params = []
+            for A, C in zip(track_params["A"], track_params["C"], strict=True):
+                event = generator.createEvent(A, C)
+                if event is not None:
+                    events.append(event)
+                    event_params.append({"A": A, "C": C})
+
+            signal = Signal(config)
+            words = signal.encodeWords(
+                eventsToBatch(events), first_event_id, np.random.default_rng(seed)
+            )
+            batch = signal.decodeWords(words)
+            tdc_hist = HitHistogram.fromConfig(config, "tdc_time")
+            adc_hist = HitHistogram.fromConfig(config, "adc_time")
+            tdc_hist.fillBatch(batch)
+            adc_hist.fillBatch(batch)
+        addCounts("Pipeline.chunk", muons=n_events, events=len(events))
+    return {
+        "batch": batch,
+        "tdc_hist": tdc_hist,
+        "adc_hist": adc_hist,
+        "events": events if keep_events else None,
+        "track_params": event_params if keep_events else None,
+        "bytes": signal.wordsToBytes(words) if keep_words else None,
+        "profile": None if profiler is None else profiler.report(),
+    }
+
+
+class Pipeline:
+    """
+    The full chain generate -> encode -> decode -> TDC calibration -> r(t)
+    calibration -> track fit in one process, passing columnar batches (see
+    eventsToBatch) from stage to stage instead of pickles on disk.
+
+    Generation, encoding, decoding and histogram filling work on independent
+    chunks of muons, so each chunk runs through them in a worker process while
+    the others are at other stages. The calibrations need every hit and run once
+    on the merged batch and histograms.
+
+    Any stage can write a checkpoint with the same file name and format as the
+    script that runs it on its own, so the scripts can pick up from it.
+
+    Attributes:
+    -----------
+    config : ConfigParser
+    The run config.
+
+    checkpoints : set
+    Names of the stages (see Pipeline.stages) that write their output.
+    """
+
+    stages = (
+        "generate",
+        "encode",
+        "decode",
+        "tdc_calibration",
+        "rt_calibration",
+        "tracks",
+    )
+
+    def __init__(
+        self,
+        config,
+        n_events=None,
+        chunk_size=5000,
+        workers=None,
+        seed=None,
+        checkpoints=(),
+        output_dir="output",
+        raw_data_dir="raw_data",
+        autocalibrate=False,
+    ):
+        """
+        Parameters:
+        -----------
+        config : ConfigParser
+        The run config.
+
+        n_events : int
+        Number of muons to generate, defaults to Simulator nevents.
+
+        chunk_size : int
+        Number of muons per chunk.
+
+        workers : int
+        Number of worker processes, defaults to the number of CPUs. 1 runs every
+        chunk in this process.
+
+        seed : int
+        Seed of the whole run. Each chunk gets its own stream spawned from it.
+
+        checkpoints : iterable
+        Stages whose output is written to disk.
+
+        output_dir : str
+        Directory holding one subdirectory per run_name.
+
+        raw_data_dir : str
+        Directory the encode checkpoint is written to.
+
+        autocalibrate : bool
+        Calibrate r(t) with RTCalibrator.autocalibrate instead of a fixed number
+        of iterations.
+        """
+        unknown = set(checkpoints) - set(self.stages)
+        if unknown:
+            msg = f"Unknown pipeline stage(s): {', '.join(sorted(unknown))}"
+            raise ValueError(msg)
+        self.config = config
+        self.n_events = config["Simulator"]["nevents"] if n_events is None else n_events
+        if self.n_events < 1:
+            msg = f"A pipeline run needs at least one muon, got {self.n_events}"
+            raise ValueError(msg)
+        self.chunk_size = chunk_size
+        self.workers = workers
+        self.seed = seed
+        self.checkpoints = set(checkpoints)
+        self.autocalibrate = autocalibrate
+        self.run_dir = os.path.join(output_dir, config["General"]["run_name"])
+        self.raw_data_dir = raw_data_dir
+        self.input_file = config["General"]["input_file"]
+
+    def __repr__(self):
+        return (
+            f"Pipeline(n_events={self.n_events}, chunk_size={self.chunk_size}, "
+            f"checkpoints={sorted(self.checkpoints)})"
+        )
+
+    def _chunks(self):
+        starts = range(0, self.n_events, self.chunk_size)
+        seeds = [
+            int(sequence.generate_state(1)[0])
+            for sequence in np.random.SeedSequence(self.seed).spawn(len(starts))
+        ]
+        keep_events = "generate" in self.checkpoints
+        keep_words = "encode" in self.checkpoints
+        profile = None if active() is None else active().memory
+        return [
+            (
+                self.config,
+                min(self.chunk_size, self.n_events - start),
+                seed,
+                start,
+                keep_events,
+                keep_words,
+                profile,
+            )
+            for start, seed in zip(starts, seeds, strict=True)
+        ]
+
+    def _mapChunks(self, chunks):
+        if self.workers == 1:
+            for chunk in chunks:
+                yield _runChunk(*chunk)
+            return
+
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            yield from executor.map(_runChunk, *zip(*chunks, strict=True))
+
+    @profiled("Pipeline.generate")
+    def generate(self):
+        """
+        Run the chunked stages, generate to decode plus histogram filling.
+
+        Returns:
+        --------
+        batch : dict
+        The decoded hits of every chunk, events numbered across the run.
+
+        tdc_hist, adc_hist : HitHistogram
+        tdc_time and adc_time histograms of every decoded hit.
+        """
+        batches = []
+        tdc_hist = HitHistogram.fromConfig(self.config, "tdc_time")
+        adc_hist = HitHistogram.fromConfig(self.config, "adc_time")
+        events = []
+        track_params = []
+        raw_file = None
+        if "encode" in self.checkpoints:
+            os.makedirs(self.raw_data_dir, exist_ok=True)
+            raw_path = os.path.join(self.raw_data_dir, f"{self.input_file}.bin")
+            raw_file = open(raw_path, "wb")
+        try:
+            # Chunks arrive in order while the later ones are still being processed
+            for result in self._mapChunks(self._chunks()):
+                batches.append(result["batch"])
+                tdc_hist += result["tdc_hist"]
+                adc_hist += result["adc_hist"]
+                if result["events"] is not None:
+                    events.extend(result["events"])
+                    track_params.extend(result["track_params"])
+                if raw_file is not None:
+                    raw_file.write(result["bytes"])
+                if result["profile"] is not None:
+                    active().merge(result["profile"])
+        finally:
+            if raw_file is not None:
+                raw_file.close()
+                print(f"Encoded events saved to {raw_path}")
+
+        if "generate" in self.checkpoints:
+            self._dump(events, f"sim_events_{self.n_events}.pkl")
+            self._dump(track_params, "track_params.pkl")
+        batch = concatBatches(batches)
+        if "decode" in self.checkpoints:
+            self._dump(batchToEvents(batch), f"{self.input_file}.pkl")
+        return batch, tdc_hist, adc_hist
+
+    @profiled("Pipeline.calibrateTDCs")
+    def calibrateTDCs(self, batch, tdc_hist, adc_hist):
+        """Fit the TDC calibration and fill drift_time of the batch with it."""
+        tdc_history, calibration = fitTDCCalibration(self.config, tdc_hist, adc_hist)
+        calibration.apply(batch, event_offset=0)
+        if "tdc_calibration" in self.checkpoints:
+            os.makedirs(self.run_dir, exist_ok=True)
+            np.save(os.path.join(self.run_dir, "tdc_calibration.npy"), tdc_history)
+            calibration.save(os.path.join(self.run_dir, "tdc_calibration.npz"))
+        return calibration
+
+    @profiled("Pipeline.calibrateRT")
+    def calibrateRT(self, batch):
+        """Calibrate r(t) on the drift times of the batch."""
+        calibrator = RTCalibrator(self.config)
+        if self.autocalibrate:
+            rt_function = calibrator.autocalibrate(batch, seed=self.seed)
+            status = "converged" if calibrator.converged else "did not converge"
+            print(
+                f"Autocalibration {status} after {calibrator.n_event_fits} event fits"
+            )
+        else:
+            rt_function = calibrator.calibrate(batch)
+        if "rt_calibration" in self.checkpoints:
+            os.makedirs(self.run_dir, exist_ok=True)
+            rt_function.save(os.path.join(self.run_dir, "rt_function.npz"))
+        return rt_function
+
+    @profiled("Pipeline.fitTracks")
+    def fitTracks(self, batch, rt_function):
+        """
+        Fill drift_radius of the batch from r(t) and fit a track to every event.
+
+        Returns:
+        --------
+        theta, d : np.ndarray
+        Per event track parameters in normal form.
+        """
+        rt_function.apply(batch)
+        theta, d = TrackFitter().fitCosmicBatch(
+            batch["x"], batch["y"], batch["drift_radius"], batch["event_offsets"]
+        )
+        if "tracks" in self.checkpoints:
+            events = batchToEvents(batch)
+            for event, event_theta, event_d in zip(events, theta, d, strict=True):
+                event["theta"] = event_theta
+                event["d"] = event_d
+            self._dump(events, f"{self.input_file}_tracks.pkl")
+        return theta, d
+
+    def run(self):
+        """
+        Run every stage.
+
+        Returns:
+        --------
+        results : dict
+        The decoded batch (with drift_time and drift_radius), the TDC histograms,
+        the TDCCalibration, the RTFunction, the per event theta and d and the
+        wall time of each step in seconds under "timing".
+        """
+        timing = {}
+        start = time.perf_counter()
+        batch, tdc_hist, adc_hist = self.generate()
+        timing["generate"] = time.perf_counter() - start
+        print(
+            f"Generated and decoded {len(batch['event_offsets']) - 1} events "
+            f"from {self.n_events} muons in {timing['generate']:.1f} s"
+        )
+        if len(batch["event_offsets"]) == 1:
+            msg = (
+                f"None of the {self.n_events} muons gave an event with MinHits to "
+                "MaxHits hits, there is nothing to calibrate"
+            )
+            raise RuntimeError(msg)
+
+        start = time.perf_counter()
+        calibration = self.calibrateTDCs(batch, tdc_hist, adc_hist)
+        timing["tdc_calibration"] = time.perf_counter() - start
+        print(f"Fitted {calibration} in {timing['tdc_calibration']:.1f} s")
+
+        start = time.perf_counter()
+        rt_function = self.calibrateRT(batch)
+        timing["rt_calibration"] = time.perf_counter() - start
+        print(f"Calibrated {rt_function} in {timing['rt_calibration']:.1f} s")
+
+        start = time.perf_counter()
+        theta, d = self.fitTracks(batch, rt_function)
+        timing["tracks"] = time.perf_counter() - start
+        print(f"Fitted {len(theta)} tracks in {timing['tracks']:.1f} s")
+        return {
+            "batch": batch,
+            "tdc_hist": tdc_hist,
+            "adc_hist": adc_hist,
+            "calibration": calibration,
+            "rt_function": rt_function,
+            "theta": theta,
+            "d": d,
+            "timing": timing,
+        }
+
+    def _dump(self, value, file_name):
+        os.makedirs(self.run_dir, exist_ok=True)
+        file_path = os.path.join(self.run_dir, file_name)
+        with open(file_path, "wb") as f:
+            pickle.dump(value, f)
+        print(f"Saved {file_path}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Generate, encode, decode and calibrate a run in one process"
+    )
+    parser.add_argument(
+        "--config",
+        type=str,
+        required=True,
+        help="Path to the configuration file, or its name in ./configs",
+    )
+    parser.add_argument(
+        "--n_events",
+        type=int,
+        default=None,
+        help="Number of muons to generate, defaults to Simulator nevents",
+    )
+    parser.add_argument(
+        "--chunk_size", type=int, default=5000, help="Number of muons per chunk"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Worker processes, defaults to the number of CPUs",
+    )
+    parser.add_argument("--seed", type=int, help="Random seed for reproducibility")
+    parser.add_argument(
+        "--checkpoint",
+        nargs="+",
+        default=[],
+        choices=[*Pipeline.stages, "all"],
+        help="Stages whose output is written to disk",
+    )
+    parser.add_argument(
+        "--output_dir", type=str, default="output", help="Directory of the outputs"
+    )
+    parser.add_argument(
+        "--raw_data_dir",
+        type=str,
+        default="raw_data",
+        help="Directory of the encode checkpoint",
+    )
+    parser.add_argument(
+        "--autocalibrate",
+        action="store_true",
+        help="Iterate r(t) until it converges, starting on a subsample of the events",
+    )
+    args = parser.parse_args(argv)
+
+    config_path = args.config
+    if not os.path.exists(config_path):
+        config_path = os.path.join("configs", args.config)
+    config = ConfigParser(config_path)
+    checkpoints = Pipeline.stages if "all" in args.checkpoint else args.checkpoint
+    pipeline = Pipeline(
+        config,
+        n_events=args.n_events,
+        chunk_size=args.chunk_size,
+        workers=args.workers,
+        seed=args.seed,
+        checkpoints=checkpoints,
+        output_dir=args.output_dir,
+        raw_data_dir=args.raw_data_dir,
+        autocalibrate=args.autocalibrate,
+    )
+    configure(config)
+    pipeline.run()
+    finish(os.path.join(pipeline.run_dir, "profile.json"))
+    return 0
@@ -0,0 +1,387 @@
+"""
+Drawing helpers for Chamber and Event.
+
+Kept out of Geometry.py and Event.py so that importing mdt_reco does not pull in
+matplotlib. Chamber.draw, Event.draw and Event.drawTrack import this module the
+first time they are called. EventDisplay and renderEvents, for drawing many events,
+are used as mdt_reco.Plotting.EventDisplay and mdt_reco.Plotting.renderEvents.
+"""
+
+import os
+
+import matplotlib.pyplot as plt
+import numpy as np
+from matplotlib.collections import PatchCollection
+from matplotlib.lines import Line2D
+from matplotlib.patches import Circle
+
+
+def drawChamber(chamber, ax=None, key=None):
+    if ax is None:
+        fig, ax = plt.subplots(figsize=(10, 6))
+    xmax = chamber.chamber["x"].max()
+    xmin = chamber.chamber["x"].min()
+    ymax = chamber.chamber["y"].max()
+    ymin = chamber.chamber["y"].min()
+    Ntubes = len(chamber.chamber["x"])
+    patches = []
+    for tube in range(Ntubes):
+        ml_num = chamber.chamber["ML"][tube]
+        radius = chamber.config["multilayers"][f"multilayer{int(ml_num + 1)}"]["radius"]
+        center = (chamber.chamber["x"][tube], chamber.chamber["y"][tube])
+        if int(chamber.chamber["tdc_id"][tube] / 2) % 2 == 1:
+            circle = Circle(
+                center, radius, fill=True, facecolor="lightgrey", ec="black", lw=1
+            )
+        else:
+            circle = Circle(center, radius, fill=False, ec="black", lw=1)
+        if key == "channel":
+            ax.text(
+                center[0],
+                center[1],
+                chamber.chamber["channel"][tube] % 100,
+                color="black",
+                fontsize=10,
+                ha="center",
+                va="center",
+            )
+        elif key is not None:
+            ax.text(
+                center[0],
+                center[1],
+                chamber.chamber[key][tube],
+                color="black",
+                fontsize=10,
+                ha="center",
+                va="center",
+            )
+        # ax.add_patch(circle)
+        patches.append(circle)
+    collection = PatchCollection(patches, match_original=True)
+    ax.add_collection(collection)
+    ax.set_xlim(xmin - radius * 2, xmax + radius * 2)
+    ax.set_ylim(ymin - radius * 2, ymax + radius * 2)
+
+    ax.set_xlabel("x[mm]")
+    ax.set_ylabel("y[mm]")
+    ax.set_aspect("equal")
+    ax.set_title("Chamber Geometry")
+
+
+def drawEvent(
+    event,
+    chamber,
+    ax=None,
+    title=None,
+    save=False,
+    file_dir=None,
+    file_name=None,
+    file_ext=".pdf",
+):
+    if ax is None:
+        fig, ax = plt.subplots(figsize=(10, 10))
+    chamber.draw(ax=ax)
+    patches = []
+    for hit_id, _ in enumerate(event["x"]):
+        center = (event["x"][hit_id], event["y"][hit_id])
+        radius = chamber.getRadius(event["tdc_id"][hit_id])
+        circle = Circle(center, radius, fill=True, facecolor="lime", ec="black", lw=1)
+        patches.append(circle)
+    collection = PatchCollection(patches, match_original=True)
+    ax.add_collection(collection)
+
+    legend_circle = Line2D(
+        [0],
+        [0],
+        marker="o",
+        color="w",
+        markerfacecolor="lime",
+        markeredgecolor="black",
+        markersize=10,
+        label="Hit",
+    )
+    ax.legend(handles=[legend_circle], loc="upper right")
+
+    ax.set_xlabel("x[mm]")
+    ax.set_ylabel("y[mm]")
+    ylims = ax.get_ylim()
+    ax.set_ylim(ylims[0], ylims[1] + 40)
+    if title is not None:
+        ax.set_title(title)
+    if save:
+        if file_dir is None or file_name is None:
+            msg = "file_dir and file_name must be provided when save=True"
+            raise ValueError(msg)
+        if not file_ext.startswith("."):
+            file_ext = "." + file_ext
+        _, ext = os.path.splitext(file_name)
+        if not ext:
+            file_name = file_name + file_ext
+        file_path = os.path.join(file_dir, file_name)
+        plt.savefig(file_path)
+    else:
+        plt.show()
+
+
+def drawTrack(
+    event,
+    chamber,
+    ax=None,
+    title=None,
+    save=False,
+    file_dir=None,
+    file_name=None,
+    file_ext=".pdf",
+    **kwargs,
+):
+    if ax is None:
+        fig, ax = plt.subplots(figsize=(10, 10))
+    cos_t = np.cos(event["theta"])
+    sin_t = np.sin(event["theta"])
+    tolerance = 1e-5
+    if np.abs(sin_t) > tolerance:
+        # Not vertical
+        x_vals = np.linspace(event["x"].min() - 20, event["x"].max() + 20, 10)
+        y_vals = (event["d"] - x_vals * cos_t) / sin_t
+        ax.plot(x_vals, y_vals, label="Track", **kwargs)
+    else:
+        # Vertical line: x = d / cos(θ)
+        x_line = event["d"] / cos_t
+        y_vals = np.linspace(event["y"].min() - 50, event["y"].max() + 50, 10)
+        ax.plot(np.full_like(y_vals, x_line), y_vals, label="Track", **kwargs)
+    drawEvent(
+        event,
+        chamber=chamber,
+        ax=ax,
+        title=title,
+        save=save,
+        file_dir=file_dir,
+        file_name=file_name,
+        file_ext=file_ext,
+    )
+
+
+class EventDisplay:
+    """
+    Draws many events on one reused figure.
+
+    The chamber, axes and legend are rendered once and kept as a pixel
+    background. Each event then only restores the background and redraws the hit
+    collection, the track line and the title (blitting), instead of building a new
+    figure and a patch per tube. The figure is not managed by pyplot, so a display
+    can live in a worker process without a GUI backend.
+
+    Attributes:
+    -----------
+    chamber : Chamber
+    The chamber drawn in the background.
+
+    figure, ax : matplotlib Figure and Axes
+    The reused figure.
+    """
+
+    def __init__(self, chamber, figsize=(10, 10), dpi=100, key=None):
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.collections import EllipseCollection
+        from matplotlib.figure import Figure
+
+        self.chamber = chamber
+        self.figure = Figure(figsize=figsize, dpi=dpi)
+        self.canvas = FigureCanvasAgg(self.figure)
+        self.ax = self.figure.add_subplot()
+        drawChamber(chamber, ax=self.ax, key=key)
+        ylims = self.ax.get_ylim()
+        self.ax.set_ylim(ylims[0], ylims[1] + 40)
+        self.ax.set_title("")
+        self._title = self.ax.text(
+            0.5,
+            1.01,
+            "",
+            transform=self.ax.transAxes,
+            ha="center",
+            va="bottom",
+            fontsize="large",
+            animated=True,
+        )
+        self._hits = EllipseCollection(
+            [],
+            [],
+            [],
+            units="xy",
+            offsets=np.empty((0, 2)),
+            offset_transform=self.ax.transData,
+            facecolor="lime",
+            edgecolor="black",
+            linewidth=1,
+            animated=True,
+        )
+        self.ax.add_collection(self._hits)
+        (self._track,) = self.ax.plot([], [], label="Track", animated=True)
+        legend_circle = Line2D(
+            [0],
+            [0],
+            marker="o",
+            color="w",
+            markerfacecolor="lime",
+            markeredgecolor="black",
+            markersize=10,
+            label="Hit",
+        )
+        self.ax.legend(handles=[legend_circle], loc="upper right")
+        self.canvas.draw()
+        self._background = self.canvas.copy_from_bbox(self.figure.bbox)
+
+    def render(self, event, title=None):
+        """
+        Draw an event, and its track when theta and d are set, over the
+        background.
+        """
+        self.canvas.restore_region(self._background)
+        diameters = 2 * self.chamber.getRadius(event["tdc_id"])
+        self._hits.set_offsets(np.column_stack((event["x"], event["y"])))
+        self._hits.set_widths(diameters)
+        self._hits.set_heights(diameters)
+        self._hits.set_angles(np.zeros(len(diameters)))
+        self._track.set_visible(np.size(event["theta"]) == 1 and len(event["x"]) > 0)
+        if self._track.get_visible():
+            self._track.set_data(*self._trackLine(event))
+        self._title.set_text(title or "")
+        for artist in (self._hits, self._track, self._title):
+            self.ax.draw_artist(artist)
+        self.canvas.blit(self.figure.bbox)
+
+    @staticmethod
+    def _trackLine(event):
+        cos_t = np.cos(event["theta"])
+        sin_t = np.sin(event["theta"])
+        tolerance = 1e-5
+        if np.abs(sin_t) > tolerance:
+            x_vals = np.linspace(event["x"].min() - 20, event["x"].max() + 20, 10)
+            return x_vals, (event["d"] - x_vals * cos_t) / sin_t
+        y_vals = np.linspace(event["y"].min() - 50, event["y"].max() + 50, 10)
+        return np.full_like(y_vals, event["d"] / cos_t), y_vals
+
+    def save(self, file_path):
+        """
+        Write the last rendered event. Raster formats (png, jpg) are written
+        straight from the rendered pixels; other formats redraw the full figure.
+        """
+        from matplotlib.image import imsave
+
+        _, ext = os.path.splitext(file_path)
+        ext = ext.lower()
+        if ext in (".png", ".jpg", ".jpeg"):
+            # PNG encoding dominates the time per event, so trade size for speed
+            pil_kwargs = {"compress_level": 1} if ext == ".png" else None
+            pixels = np.asarray(self.canvas.buffer_rgba())[..., :3]
+            imsave(file_path, pixels, pil_kwargs=pil_kwargs)
+            return
+        animated = (self._hits, self._track, self._title)
+        for artist in animated:
+            artist.set_animated(False)
+        self.figure.savefig(file_path)
+        for artist in animated:
+            artist.set_animated(True)
+
+    def renderToFile(self, event, file_path, title=None):
+        self.render(event, title)
+        self.save(file_path)
+
+
+_worker_display = None
+
+
+def _initDisplayWorker(config, display_kwargs):
+    from .Geometry import Chamber
+
+    global _worker_display
+    _worker_display = EventDisplay(Chamber(config), **display_kwargs)
+
+
+def _renderChunk(events, file_paths, titles):
+    for event, file_path, title in zip(events, file_paths, titles, strict=True):
+        _worker_display.renderToFile(event, file_path, title)
+    return len(events)
+
+
+def renderEvents(
+    events,
+    config,
+    file_dir,
+    file_names=None,
+    file_ext=".png",
+    titles=None,
+    workers=None,
+    chunk_size=100,
+    **display_kwargs,
+):
+    """
+    Render a list of events to one file each with EventDisplay, split into chunks
+    over worker processes that each build their own display once.
+
+    Parameters:
+    -----------
+    events : list
+    The Event objects to draw.
+
+    config : ConfigParser
+    The config whose Geometry section gives the chamber.
+
+    file_dir : str
+    Directory the files are written to.
+
+    file_names : list
+    One name per event without extension, defaults to event_<index>.
+
+    file_ext : str
+    File extension, and with it the format.
+
+    titles : list
+    One title per event, defaults to "Event <index>".
+
+    workers : int
+    Number of worker processes, defaults to the number of CPUs. 1 renders in
+    this process.
+
+    chunk_size : int
+    Number of events sent to a worker at a time.
+
+    Returns:
+    --------
+    file_paths : list
+    The paths of the written files.
+    """
+    if not file_ext.startswith("."):
+        file_ext = "." + file_ext
+    if file_names is None:
+        file_names = [f"event_{i}" for i in range(len(events))]
+    if titles is None:
+        titles = [f"Event {i}" for i in range(len(events))]
+    os.makedirs(file_dir, exist_ok=True)
+    file_paths = [os.path.join(file_dir, name + file_ext) for name in file_names]
+    chunks = [
+        (
+            events[start : start + chunk_size],
+            file_paths[start : start + chunk_size],
+            titles[start : start + chunk_size],
+        )
+        for start in range(0, len(events), chunk_size)
+    ]
+    if not chunks:
+        return file_paths
+    if workers == 1:
+        _initDisplayWorker(config, display_kwargs)
+        for chunk in chunks:
+            _renderChunk(*chunk)
+        return file_paths
+
+    from concurrent.futures import ProcessPoolExecutor
+
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_initDisplayWorker,
+        initargs=(config, display_kwargs),
+    ) as executor:
+        for _ in executor.map(_renderChunk, *zip(*chunks, strict=True)):
+            pass
+    return file_paths
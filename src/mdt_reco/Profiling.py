@@ -0,0 +1,326 @@
+import contextlib
+import functools
+import json
+import os
+import time
+import tracemalloc
+
+# The active Profiler, None while profiling is off. Every hook checks this first,
+# so a disabled hook costs one global lookup.
+_profiler = None
+_null_stage = contextlib.nullcontext()
+
+environment_variable = "MDT_RECO_PROFILE"
+
+
+class Profiler:
+    """
+    Wall time, call counts, item counters and optionally peak memory and a
+    cProfile of named stages.
+
+    Stages are opened with stage() or the profiled decorator and may nest. With
+    memory tracking each stage records the tracemalloc peak above the memory in
+    use when it was entered, including the peaks of the stages nested in it.
+    tracemalloc sees allocations made through Python and numpy, not those made
+    inside Numba kernels.
+
+    Attributes:
+    -----------
+    memory : bool
+    Track peak memory per stage with tracemalloc.
+
+    cprofile : bool
+    Run cProfile for the lifetime of the profiler.
+
+    timers : dict
+    Per stage "calls", "seconds" and, with memory, "peak_memory_mb".
+
+    counters : dict
+    Per stage item counts added with count, e.g. {"events": 1000, "hits": 9000}.
+    """
+
+    def __init__(self, memory=False, cprofile=False):
+        self.memory = memory
+        self.cprofile = cprofile
+        self.timers = {}
+        self.counters = {}
+        self._peaks = []
+        self._profile = None
+        self._started_tracemalloc = False
+        self._start_time = time.perf_counter()
+        self._pid = os.getpid()
+
+    def __repr__(self):
+        return (
+            f"Profiler(memory={self.memory}, cprofile={self.cprofile}, "
+            f"stages={len(self.timers)})"
+        )
+
+    def start(self):
+        """Start tracemalloc and cProfile as configured."""
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+        if self.cprofile:
+            import cProfile
+
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+
+    def stop(self):
+        """Stop whatever start started."""
+        if self._profile is not None:
+            self._profile.disable()
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        timer = self.timers.setdefault(name, {"calls": 0, "seconds": 0.0})
+        memory = self.memory and tracemalloc.is_tracing()
+        if memory:
+            current, peak = tracemalloc.get_traced_memory()
+            # The enclosing stage keeps the peak reached so far before it is reset
+            if self._peaks:
+                self._peaks[-1] = max(self._peaks[-1], peak)
+            self._peaks.append(current)
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            timer["seconds"] += time.perf_counter() - start
+            timer["calls"] += 1
+            if memory:
+                peak = max(self._peaks.pop(), tracemalloc.get_traced_memory()[1])
+                if self._peaks:
+                    self._peaks[-1] = max(self._peaks[-1], peak)
+                timer["peak_memory_mb"] = max(
+                    timer.get("peak_memory_mb", 0.0), (peak - current) / 2**20
+                )
+
+    def count(self, name, **counts):
+        counters = self.counters.setdefault(name, {})
+        for key, value in counts.items():
+            counters[key] = counters.get(key, 0) + int(value)
+
+    def merge(self, report):
+        """
+        Add the stages and counters of another profiler's report, e.g. one made
+        in a worker process.
+        """
+        for name, stage in report["stages"].items():
+            timer = self.timers.setdefault(name, {"calls": 0, "seconds": 0.0})
+            timer["calls"] += stage["calls"]
+            timer["seconds"] += stage["seconds"]
+            if "peak_memory_mb" in stage:
+                timer["peak_memory_mb"] = max(
+                    timer.get("peak_memory_mb", 0.0), stage["peak_memory_mb"]
+                )
+        for name, counts in report["counters"].items():
+            self.count(name, **counts)
+
+    def topFunctions(self, n=25):
+        """The n functions with the largest cumulative time in the cProfile."""
+        if self._profile is None:
+            return []
+        import pstats
+
+        stats = pstats.Stats(self._profile).stats
+        rows = sorted(stats.items(), key=lambda item: item[1][3], reverse=True)
+        return [
+            {
+                "function": f"{file_name}:{line}({function})",
+                "calls": n_calls,
+                "total_seconds": total,
+                "cumulative_seconds": cumulative,
+            }
+            for (file_name, line, function), (
+                _,
+                n_calls,
+                total,
+                cumulative,
+                _,
+            ) in rows[:n]
+        ]
+
+    def report(self):
+        """
+        Returns:
+        --------
+        report : dict
+        JSON serialisable "wall_seconds" since the profiler was made, "stages"
+        with calls, seconds, mean_seconds, any peak_memory_mb and the stage's
+        counters with their rates per second, "counters" and "cprofile" (the top
+        functions, empty without cProfile).
+        """
+        stages = {}
+        for name, timer in self.timers.items():
+            stage = dict(timer)
+            stage["mean_seconds"] = timer["seconds"] / max(timer["calls"], 1)
+            for key, value in self.counters.get(name, {}).items():
+                stage[key] = value
+                if timer["seconds"] > 0:
+                    stage[f"{key}_per_second"] = value / timer["seconds"]
+            stages[name] = stage
+        return {
+            "wall_seconds": time.perf_counter() - self._start_time,
+            "memory": self.memory,
+            "stages": stages,
+            "counters": {name: dict(counts) for name, counts in self.counters.items()},
+            "cprofile": self.topFunctions(),
+        }
+
+    def summary(self):
+        """The stages as a text table, slowest first."""
+        lines = [f"{'stage':36s} {'calls':>8s} {'seconds':>10s} {'peak MB':>9s}"]
+        for name, timer in sorted(
+            self.timers.items(), key=lambda item: item[1]["seconds"], reverse=True
+        ):
+            peak = timer.get("peak_memory_mb")
+            lines.append(
+                f"{name:36s} {timer['calls']:8d} {timer['seconds']:10.3f} "
+                + ("        -" if peak is None else f"{peak:9.2f}")
+            )
+        return "\n".join(lines)
+
+    def save(self, file):
+        """Write the report as JSON, and the cProfile next to it as .prof."""
+        with open(file, "w") as f:
+            json.dump(self.report(), f, indent=2)
+        if self._profile is not None:
+            self._profile.dump_stats(os.path.splitext(file)[0] + ".prof")
+
+
+def enable(memory=False, cprofile=False):
+    """Start profiling with a new Profiler and return it."""
+    global _profiler
+    disable()
+    _profiler = Profiler(memory=memory, cprofile=cprofile)
+    _profiler.start()
+    return _profiler
+
+
+def disable():
+    """Stop profiling and return the Profiler that was active, if any."""
+    global _profiler
+    profiler = _profiler
+    _profiler = None
+    if profiler is not None:
+        profiler.stop()
+    return profiler
+
+
+def isEnabled():
+    return _profiler is not None
+
+
+def active():
+    """The active Profiler, or None."""
+    return _profiler
+
+
+def configure(config=None):
+    """
+    Enable profiling as asked by the MDT_RECO_PROFILE environment variable or,
+    when it is unset, by the Profiling section of the config:
+
+        Profiling:
+          enabled: true
+          memory: false  # peak memory per stage with tracemalloc
+          cprofile: false  # cProfile of the whole job
+
+    MDT_RECO_PROFILE is "0" (off), "1" (timers and counters) or a comma separated
+    list of "memory" and "cprofile" (on, with those extras). Profiling that is
+    already enabled is left as it is.
+
+    Returns:
+    --------
+    profiler : Profiler
+    The active Profiler, or None when profiling is off.
+    """
+    if _profiler is not None:
+        return _profiler
+    setting = os.environ.get(environment_variable)
+    if setting is not None:
+        options = {option.strip().lower() for option in setting.split(",")}
+        if options <= {"", "0", "false", "off"}:
+            return None
+        return enable(memory="memory" in options, cprofile="cprofile" in options)
+    section = (config.get("Profiling") if config is not None else None) or {}
+    if not section.get("enabled", False):
+        return None
+    return enable(
+        memory=section.get("memory", False), cprofile=section.get("cprofile", False)
+    )
+
+
+def finish(file):
+    """
+    Write the report of the active Profiler to file, print its summary and stop
+    profiling. Does nothing while profiling is off.
+    """
+    profiler = disable()
+    if profiler is None:
+        return None
+    os.makedirs(os.path.dirname(os.path.abspath(file)), exist_ok=True)
+    profiler.save(file)
+    print(profiler.summary())
+    print(f"Profile saved to {file}")
+    return profiler
+
+
+def stage(name):
+    """
+    Context manager timing the enclosed block as stage name, a no-op while
+    profiling is off.
+    """
+    if _profiler is None:
+        return _null_stage
+    return _profiler.stage(name)
+
+
+def profiled(name):
+    """Decorator timing every call of a function as stage name."""
+
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if _profiler is None:
+                return function(*args, **kwargs)
+            with _profiler.stage(name):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorate
+
+
+def addCounts(name, **counts):
+    """Add item counts, e.g. addCounts("decode", events=10, hits=90), to stage name."""
+    if _profiler is not None:
+        _profiler.count(name, **counts)
+
+
+@contextlib.contextmanager
+def capture(enabled, memory=False):
+    """
+    Profile the enclosed block with a fresh Profiler, yielded so its report can be
+    sent back from a worker process and merged, or None when not enabled. The
+    profiler that was active before is restored afterwards. In the process that
+    owns the active profiler (a chunk run inline) the block records into it
+    directly and None is yielded, so nothing is merged twice.
+    """
+    global _profiler
+    if not enabled or (_profiler is not None and _profiler._pid == os.getpid()):
+        yield None
+        return
+    outer = _profiler
+    _profiler = Profiler(memory=memory)
+    _profiler.start()
+    try:
+        yield _profiler
+    finally:
+        _profiler.stop()
+        _profiler = outer
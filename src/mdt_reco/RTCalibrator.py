@@ -0,0 +1,363 @@
+import numpy as np
+
+from .Event import selectEvents
+from .Profiling import addCounts, profiled
+from .RTFunction import RTFunction
+from .TrackFitter import TrackFitter
+
+
+class RTCalibrator:
+    """
+    Autocalibration of the r(t) relation on columnar hit arrays.
+
+    Each iteration fits a straight track to every event with the current drift
+    radii, histograms drift time against the distance of closest approach, keeps
+    the bins within k standard deviations of each time column's centroid, and fits
+    r(t) through them, a polynomial or a monotone spline. The next iteration uses
+    r(t), tabulated as an RTFunction, for the radii.
+
+    The hit arrays are stored once in preallocated buffers and every step is a
+    vectorized pass over them or a batch track fit, so an iteration never loops
+    over events or bins in Python.
+
+    Attributes:
+    -----------
+    config : ConfigParser
+    The config file giving iterations and degree under the header RTFitter.
+    """
+
+    def __init__(
+        self,
+        config,
+        initial_radius=15.0,
+        bins=50,
+        k=1.0,
+        n_steps=100,
+        method=None,
+        n_points=1024,
+    ):
+        """
+        Parameters:
+        -----------
+        config : ConfigParser
+        The config file giving iterations and degree under the header RTFitter.
+
+        initial_radius : float
+        Drift radius given to every hit in the first iteration, in mm.
+
+        bins : int
+        Number of time and distance bins of the r(t) histogram.
+
+        k : float
+        Width of the ridge kept around each column centroid, in standard
+        deviations.
+
+        n_steps : int
+        Number of theta candidates scanned per track fit.
+
+        method : str
+        "polynomial" fits a polynomial of RTFitter degree to the ridge, "spline"
+        a monotone spline through it. Defaults to RTFitter method in the config,
+        or "polynomial".
+
+        n_points : int
+        Number of grid points of the RTFunction table.
+        """
+        if method is None:
+            method = config["RTFitter"].get("method", "polynomial")
+        if method not in ("polynomial", "spline"):
+            msg = f"Unknown r(t) fit method '{method}'"
+            raise ValueError(msg)
+        self.config = config
+        self.iterations = config["RTFitter"]["iterations"]
+        self.degree = config["RTFitter"]["degree"]
+        self.initial_radius = initial_radius
+        self.bins = bins
+        self.k = k
+        self.n_steps = n_steps
+        self.method = method
+        self.n_points = n_points
+        self._trackFitter = TrackFitter()
+
+    def setHits(self, batch, rt_function=None):
+        """
+        Copy x, y and drift_time of a columnar batch (see eventsToBatch) into the
+        calibrator and allocate the per hit and per event work buffers. The drift
+        radii start from rt_function when given, otherwise from initial_radius.
+        """
+        self.x = np.ascontiguousarray(batch["x"], dtype=np.float32)
+        self.y = np.ascontiguousarray(batch["y"], dtype=np.float32)
+        self.drift_time = np.ascontiguousarray(batch["drift_time"], dtype=np.float32)
+        self.event_offsets = np.asarray(batch["event_offsets"], dtype=np.int64)
+        n_hits = len(self.x)
+        n_events = len(self.event_offsets) - 1
+        self.event_number = np.repeat(np.arange(n_events), np.diff(self.event_offsets))
+        self.drift_radius = np.full(n_hits, self.initial_radius, dtype=np.float32)
+        self.distance = np.empty(n_hits, dtype=np.float32)
+        self.theta = np.empty(n_events, dtype=np.float32)
+        self.d = np.empty(n_events, dtype=np.float32)
+        self._hit_buffer = np.empty(n_hits, dtype=np.float32)
+        if rt_function is not None:
+            self.drift_radius[:] = rt_function.evaluate(self.drift_time)
+
+    def fitTracks(self):
+        """
+        Fit every event with the current drift radii and fill the distance of
+        closest approach of every hit.
+        """
+        self.theta[:], self.d[:] = self._trackFitter.fitCosmicBatch(
+            self.x, self.y, self.drift_radius, self.event_offsets, self.n_steps
+        )
+        # |x cos(theta) + y sin(theta) - d| with theta and d gathered per hit
+        hit_theta = self.theta[self.event_number]
+        np.multiply(self.x, np.cos(hit_theta), out=self.distance)
+        np.multiply(self.y, np.sin(hit_theta), out=self._hit_buffer)
+        self.distance += self._hit_buffer
+        self.distance -= self.d[self.event_number]
+        np.abs(self.distance, out=self.distance)
+
+    def ridgePoints(self):
+        """
+        Histogram drift time against distance and keep the bins lying within k
+        standard deviations of each time column's centroid.
+
+        Returns:
+        --------
+        ridge_times, ridge_distances : np.ndarray
+        Bin centers of the kept bins.
+
+        histogram : tuple
+        (counts, time_edges, distance_edges) as returned by np.histogram2d.
+        """
+        # Edges computed in float64 from the float32 hit ranges
+        hist_range = [
+            [float(self.drift_time.min()), float(self.drift_time.max())],
+            [float(self.distance.min()), float(self.distance.max())],
+        ]
+        counts, time_edges, distance_edges = np.histogram2d(
+            self.drift_time, self.distance, bins=self.bins, range=hist_range
+        )
+        time_centers = 0.5 * (time_edges[:-1] + time_edges[1:])
+        distance_centers = 0.5 * (distance_edges[:-1] + distance_edges[1:])
+
+        totals = counts.sum(axis=1)
+        filled = totals > 0
+        probs = counts / np.where(filled, totals, 1)[:, np.newaxis]
+        bin_index = np.arange(counts.shape[1])
+        com_idx = probs @ bin_index
+        var_idx = np.sum(probs * (bin_index - com_idx[:, np.newaxis]) ** 2, axis=1)
+        std_idx = np.sqrt(var_idx)
+        com_distance = distance_centers[np.round(com_idx).astype(np.int64)]
+        std_distance = std_idx * (distance_centers[1] - distance_centers[0])
+
+        lower = (com_distance - self.k * std_distance)[:, np.newaxis]
+        upper = (com_distance + self.k * std_distance)[:, np.newaxis]
+        keep = (
+            (distance_centers >= lower)
+            & (distance_centers <= upper)
+            & (counts > 0)
+            & filled[:, np.newaxis]
+        )
+        rows, columns = np.nonzero(keep)
+        return (
+            time_centers[rows],
+            distance_centers[columns],
+            (counts, time_edges, distance_edges),
+        )
+
+    def fitRT(self, ridge_times, ridge_distances):
+        """
+        Fit r(t) through the ridge points.
+
+        Returns:
+        --------
+        rt_function : RTFunction
+        r(t) tabulated over the drift time range of the hits.
+
+        coefficients : np.ndarray
+        The polynomial coefficients, None for the spline.
+        """
+        t_min = float(self.drift_time.min())
+        t_max = float(self.drift_time.max())
+        if self.method == "spline":
+            rt_function = RTFunction.fromPoints(
+                ridge_times, ridge_distances, t_min, t_max, self.n_points
+            )
+            return rt_function, None
+        coefficients = np.polyfit(ridge_times, ridge_distances, self.degree)
+        rt_function = RTFunction.fromCoefficients(
+            coefficients, t_min, t_max, self.n_points
+        )
+        return rt_function, coefficients
+
+    def iterate(self):
+        """
+        Run one iteration and update the drift radii.
+
+        Returns:
+        --------
+        result : dict
+        The r(t) relation ("rt_function"), the polynomial coefficients
+        ("coefficients", None for the spline), the ridge points ("ridge_times",
+        "ridge_distances") and the histogram ("histogram").
+        """
+        self.fitTracks()
+        ridge_times, ridge_distances, histogram = self.ridgePoints()
+        rt_function, coefficients = self.fitRT(ridge_times, ridge_distances)
+        self.drift_radius[:] = rt_function.evaluate(self.drift_time)
+        return {
+            "rt_function": rt_function,
+            "coefficients": coefficients,
+            "ridge_times": ridge_times,
+            "ridge_distances": ridge_distances,
+            "histogram": histogram,
+        }
+
+    @profiled("RTCalibrator.calibrate")
+    def calibrate(self, batch, iterations=None, callback=None):
+        """
+        Run the autocalibration on a columnar batch.
+
+        Parameters:
+        -----------
+        batch : dict
+        Columnar hits with x, y, drift_time and event_offsets.
+
+        iterations : int
+        Number of iterations, defaults to RTFitter iterations in the config.
+
+        callback : callable
+        Called as callback(iteration, result) after every iteration, e.g. to draw
+        the histogram or save the coefficients.
+
+        Returns:
+        --------
+        rt_function : RTFunction
+        The r(t) relation of the last iteration.
+        """
+        if iterations is None:
+            iterations = self.iterations
+        self.setHits(batch)
+        result = None
+        for iteration in range(iterations):
+            result = self.iterate()
+            if callback is not None:
+                callback(iteration, result)
+        addCounts("RTCalibrator.calibrate", event_fits=len(self.theta) * iterations)
+        return result["rt_function"]
+
+    @profiled("RTCalibrator.autocalibrate")
+    def autocalibrate(
+        self,
+        batch,
+        tolerance=None,
+        initial_events=None,
+        growth=2.0,
+        max_iterations=None,
+        seed=None,
+        callback=None,
+    ):
+        """
+        Run the autocalibration until r(t) converges, starting on a random
+        subsample of the events and growing it as r(t) settles.
+
+        The change of an iteration is the RMS change of the drift radii of the
+        current sample. Statistical fluctuations of r(t) fall as 1/sqrt(sample
+        size), so a sample of n out of N events is settled once the change is
+        below tolerance * sqrt(N / n), or stops falling. It then grows by growth
+        and the new sample starts from the current r(t), so the early iterations,
+        where r(t) moves the most, only fit a fraction of the events. The
+        calibration stops once the full batch is below tolerance, or no longer
+        improves.
+
+        Parameters:
+        -----------
+        batch : dict
+        Columnar hits with x, y, drift_time and event_offsets.
+
+        tolerance : float
+        RMS drift radius change in mm at which the full batch has converged,
+        defaults to RTFitter tolerance in the config, or 0.01.
+
+        initial_events : int
+        Size of the first sample, defaults to RTFitter initial_events in the
+        config, or 1000.
+
+        growth : float
+        Factor the sample grows by each time it settles, above 1.
+
+        max_iterations : int
+        Iterations, at least 1, after which the calibration stops without
+        convergence, defaults to RTFitter max_iterations in the config, or 50.
+
+        seed : int
+        Seed of the random sample order.
+
+        callback : callable
+        Called as callback(iteration, result) after every iteration, with the
+        RMS change ("change") and sample size ("n_events") added to result.
+
+        Returns:
+        --------
+        rt_function : RTFunction
+        The r(t) relation of the last iteration. The work buffers hold the full
+        batch with radii and tracks from it, converged tells whether the
+        tolerance was met and n_event_fits counts the track fits done, including
+        the final fit of the full batch.
+        """
+        settings = self.config["RTFitter"]
+        if tolerance is None:
+            tolerance = settings.get("tolerance", 0.01)
+        if initial_events is None:
+            initial_events = settings.get("initial_events", 1000)
+        if max_iterations is None:
+            max_iterations = settings.get("max_iterations", 50)
+        if max_iterations < 1:
+            msg = f"max_iterations must be at least 1, got {max_iterations}"
+            raise ValueError(msg)
+        if growth <= 1:
+            msg = f"growth must be above 1 for the sample to grow, got {growth}"
+            raise ValueError(msg)
+
+        n_events = len(batch["event_offsets"]) - 1
+        order = np.random.default_rng(seed).permutation(n_events)
+        n_sample = min(initial_events, n_events)
+        self.setHits(selectEvents(batch, np.sort(order[:n_sample])))
+        self.converged = False
+        self.n_event_fits = 0
+        previous_change = np.inf
+        result = None
+        for iteration in range(max_iterations):
+            previous_radius = self.drift_radius.copy()
+            result = self.iterate()
+            self.n_event_fits += n_sample
+            np.subtract(self.drift_radius, previous_radius, out=self._hit_buffer)
+            change = float(np.sqrt(np.mean(np.square(self._hit_buffer))))
+            result["change"] = change
+            result["n_events"] = n_sample
+            if callback is not None:
+                callback(iteration, result)
+            # The ridge is binned, so r(t) can also end in a small limit cycle
+            # rather than a fixed point; a change that stops falling is settled
+            stalled = change >= previous_change
+            previous_change = change
+            if change < tolerance * np.sqrt(n_events / n_sample):
+                if n_sample == n_events:
+                    self.converged = True
+                    break
+            elif not stalled:
+                continue
+            elif n_sample == n_events:
+                break
+            n_sample = min(max(int(n_sample * growth), n_sample + 1), n_events)
+            previous_change = np.inf
+            self.setHits(
+                selectEvents(batch, np.sort(order[:n_sample])), result["rt_function"]
+            )
+
+        if n_sample < n_events:
+            self.setHits(batch, result["rt_function"])
+            self.fitTracks()
+            self.n_event_fits += n_events
+        addCounts("RTCalibrator.autocalibrate", event_fits=self.n_event_fits)
+        return result["rt_function"]
@@ -0,0 +1,275 @@
+from typing import ClassVar
+
+import numpy as np
+from numba import njit, prange
+
+
+@njit(cache=True, parallel=True)
+def _interpolate(times, table_ids, tables, t_min, step):
+    n_points = tables.shape[1]
+    radii = np.empty(len(times), dtype=np.float32)
+    single = len(table_ids) == 0
+    for i in prange(len(times)):
+        table = 0 if single else table_ids[i]
+        position = (times[i] - t_min) / step
+        if np.isnan(position):
+            radii[i] = np.nan
+        elif position <= 0:
+            radii[i] = tables[table, 0]
+        elif position >= n_points - 1:
+            radii[i] = tables[table, n_points - 1]
+        else:
+            j = int(position)
+            fraction = position - j
+            lower = tables[table, j]
+            radii[i] = lower + fraction * (tables[table, j + 1] - lower)
+    return radii
+
+
+class RTFunction:
+    """
+    An r(t) relation sampled on a uniform drift time grid, evaluated by linear
+    interpolation in a Numba kernel.
+
+    Every table shares the grid, so a hit's radius is a single multiply, floor and
+    lerp into its table and millions of hits are evaluated in one parallel pass.
+    Drift times outside [t_min, t_max] are clamped to the edge radii instead of
+    extrapolating the polynomial.
+
+    Attributes:
+    -----------
+    tables : np.ndarray
+    float32 radii in mm of shape (n_tables, n_points).
+
+    t_min, t_max : float
+    Drift times in ns of the first and last grid point.
+
+    layout : str
+    How hits are dispatched to tables: "single" (one table for the chamber),
+    "tdc" (one per (csm_id, tdc_id)) or "tube" (one per (csm_id, tdc_id, channel)),
+    with the same dense ID layout as TDCCalibration.
+    """
+
+    n_csms = 8
+    n_tdcs = 32
+    n_channels = 32
+    layouts: ClassVar[dict] = {
+        "single": 1,
+        "tdc": n_csms * n_tdcs,
+        "tube": n_csms * n_tdcs * n_channels,
+    }
+
+    def __init__(self, tables, t_min, t_max, layout="single"):
+        tables = np.asarray(tables, dtype=np.float32)
+        if tables.ndim == 1:
+            tables = tables[np.newaxis]
+        if layout not in self.layouts:
+            msg = f"Unknown RT table layout '{layout}'"
+            raise ValueError(msg)
+        if tables.shape[0] != self.layouts[layout]:
+            msg = (
+                f"Layout '{layout}' needs {self.layouts[layout]} tables, "
+                f"got {tables.shape[0]}"
+            )
+            raise ValueError(msg)
+        if tables.shape[1] < 2 or not t_max > t_min:
+            msg = "An RT table needs at least two points and t_max > t_min"
+            raise ValueError(msg)
+        self.tables = np.ascontiguousarray(tables)
+        self.t_min = float(t_min)
+        self.t_max = float(t_max)
+        self.layout = layout
+
+    def __repr__(self):
+        return (
+            f"RTFunction(layout={self.layout!r}, points={self.n_points}, "
+            f"t_min={self.t_min}, t_max={self.t_max})"
+        )
+
+    @property
+    def n_tables(self):
+        return self.tables.shape[0]
+
+    @property
+    def n_points(self):
+        return self.tables.shape[1]
+
+    @property
+    def step(self):
+        return (self.t_max - self.t_min) / (self.n_points - 1)
+
+    @property
+    def times(self):
+        return np.linspace(self.t_min, self.t_max, self.n_points)
+
+    @classmethod
+    def fromCoefficients(
+        cls, coefficients, t_min, t_max, n_points=1024, layout="single"
+    ):
+        """
+        Sample r(t) polynomials on the grid.
+
+        Parameters:
+        -----------
+        coefficients : np.ndarray
+        Polynomial coefficients, highest power first as for np.polyval, of shape
+        (degree + 1,) or (n_tables, degree + 1).
+
+        t_min, t_max : float
+        Drift time range of the grid in ns.
+
+        n_points : int
+        Number of grid points.
+        """
+        coefficients = np.atleast_2d(np.asarray(coefficients, dtype=np.float64))
+        grid = np.linspace(t_min, t_max, n_points)
+        # Horner's scheme for every table at once, in float64
+        tables = np.zeros((coefficients.shape[0], n_points))
+        for power in range(coefficients.shape[1]):
+            tables *= grid
+            tables += coefficients[:, power, np.newaxis]
+        return cls(tables, t_min, t_max, layout)
+
+    @classmethod
+    def fromPoints(cls, times, radii, t_min=None, t_max=None, n_points=1024):
+        """
+        Build a single table from (time, radius) points, e.g. the ridge of the
+        r(t) histogram, with a monotone cubic (PCHIP) spline.
+
+        Points at the same time are averaged and the radii are forced to be
+        non-decreasing in time, so the spline never oscillates the way a high
+        degree polynomial can.
+
+        Parameters:
+        -----------
+        times, radii : np.ndarray
+        The points in ns and mm.
+
+        t_min, t_max : float
+        Drift time range of the grid, defaults to the range of the points.
+
+        n_points : int
+        Number of grid points.
+        """
+        from scipy.interpolate import PchipInterpolator
+
+        unique_times, inverse = np.unique(
+            np.asarray(times, dtype=np.float64), return_inverse=True
+        )
+        if len(unique_times) < 2:
+            msg = "An RT spline needs points at two or more drift times"
+            raise ValueError(msg)
+        mean_radii = np.bincount(inverse, weights=radii) / np.bincount(inverse)
+        spline = PchipInterpolator(
+            unique_times, np.maximum.accumulate(mean_radii), extrapolate=False
+        )
+        t_min = unique_times[0] if t_min is None else t_min
+        t_max = unique_times[-1] if t_max is None else t_max
+        grid = np.clip(np.linspace(t_min, t_max, n_points), *unique_times[[0, -1]])
+        return cls(spline(grid), t_min, t_max)
+
+    @classmethod
+    def stack(cls, functions, layout, n_points=None):
+        """
+        Combine single table RTFunctions, one per TDC or tube in the dense ID
+        order, into one RTFunction. Each table is resampled onto a grid spanning
+        every input range; None entries are filled with NaN.
+        """
+        valid = [function for function in functions if function is not None]
+        if not valid:
+            msg = "Cannot stack an empty list of RT functions"
+            raise ValueError(msg)
+        t_min = min(function.t_min for function in valid)
+        t_max = max(function.t_max for function in valid)
+        if n_points is None:
+            n_points = max(function.n_points for function in valid)
+        grid = np.linspace(t_min, t_max, n_points)
+        tables = np.full((len(functions), n_points), np.nan, dtype=np.float32)
+        for i, function in enumerate(functions):
+            if function is not None:
+                tables[i] = function.evaluate(grid)
+        return cls(tables, t_min, t_max, layout)
+
+    def tableIds(self, csm_ids, tdc_ids, channels=None):
+        """The table index of every hit for this layout, None for "single"."""
+        if self.layout == "single":
+            return None
+        table_ids = np.asarray(csm_ids, dtype=np.int64) * self.n_tdcs + tdc_ids
+        if self.layout == "tube":
+            table_ids = table_ids * self.n_channels + channels
+        return table_ids
+
+    def evaluate(self, times, table_ids=None):
+        """
+        Drift radii in mm of drift times in ns.
+
+        Parameters:
+        -----------
+        times : np.ndarray
+        Drift times.
+
+        table_ids : np.ndarray
+        Per hit table index (see tableIds), required unless the layout is
+        "single".
+
+        Returns:
+        --------
+        radii : np.ndarray
+        float32 radii, NaN for NaN drift times.
+        """
+        times = np.ascontiguousarray(times)
+        if table_ids is None:
+            if self.n_tables != 1:
+                msg = f"Layout '{self.layout}' needs per hit table_ids"
+                raise ValueError(msg)
+            table_ids = np.empty(0, dtype=np.int64)
+        else:
+            table_ids = np.ascontiguousarray(table_ids, dtype=np.int64)
+        return _interpolate(times, table_ids, self.tables, self.t_min, self.step)
+
+    __call__ = evaluate
+
+    def apply(self, batch):
+        """
+        Fill drift_radius from drift_time for every hit of a batch or Event. Layouts
+        other than "single" also read csm_id, tdc_id and channel.
+        """
+        table_ids = None
+        if self.layout != "single":
+            table_ids = self.tableIds(
+                batch["csm_id"], batch["tdc_id"], batch["channel"]
+            )
+        batch["drift_radius"] = self.evaluate(batch["drift_time"], table_ids)
+        return batch
+
+    def save(self, file):
+        np.savez(
+            file,
+            tables=self.tables,
+            t_min=self.t_min,
+            t_max=self.t_max,
+            layout=self.layout,
+        )
+
+    @classmethod
+    def load(cls, file):
+        with np.load(file) as data:
+            return cls(
+                data["tables"],
+                float(data["t_min"]),
+                float(data["t_max"]),
+                str(data["layout"]),
+            )
+
+
+def warmup():
+    """
+    Compile (or load from the on-disk cache) the interpolation kernel for the
+    float32 drift times carried by Event, with and without per hit table IDs.
+    """
+    function = RTFunction.fromCoefficients([0.02, 0.0], 0.0, 750.0, n_points=16)
+    times = np.array([-5.0, 100.0, 800.0], dtype=np.float32)
+    function.evaluate(times)
+    function.evaluate(times.astype(np.float64))
+    tdc_function = RTFunction.stack([function] * RTFunction.layouts["tdc"], "tdc")
+    tdc_function.evaluate(times, np.zeros(len(times), dtype=np.int64))
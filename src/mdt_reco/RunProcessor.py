@@ -0,0 +1,277 @@
+import glob
+import multiprocessing
+import os
+import re
+import time
+
+import numpy as np
+
+from .Event import concatBatches
+from .Histogram import HitHistogram
+from .Profiling import active, addCounts, capture, profiled, stage
+from .Signal import Signal
+from .TrackFitter import TrackFitter
+
+
+def _naturalKey(path):
+    """Sort key ordering run_2.bin before run_10.bin."""
+    return [int(part) if part.isdigit() else part for part in re.split(r"(\d+)", path)]
+
+
+def expandFiles(patterns, base_dir=None):
+    """
+    The raw files matching any of the paths or glob patterns, in natural order
+    of their paths (run_2.bin before run_10.bin), each listed once.
+
+    Parameters:
+    -----------
+    patterns : list
+    Paths or glob patterns. Relative ones are taken relative to base_dir when
+    it is given.
+
+    base_dir : str
+    Directory relative patterns are resolved against.
+    """
+    files = {}
+    for pattern in patterns:
+        path = pattern
+        if base_dir is not None and not os.path.isabs(pattern):
+            path = os.path.join(base_dir, pattern)
+        matches = glob.glob(path) if glob.has_magic(path) else [path]
+        for file_path in matches:
+            if not os.path.isfile(file_path):
+                msg = f"Input file {file_path} does not exist."
+                raise FileNotFoundError(msg)
+            files.setdefault(os.path.abspath(file_path), None)
+    if not files:
+        msg = f"No raw files match {', '.join(patterns)}"
+        raise FileNotFoundError(msg)
+    return sorted(files, key=_naturalKey)
+
+
+def _fitBatch(batch, calibration, rt_function, event_offset=None):
+    """
+    Fill drift_time and drift_radius and fit a track to every event. event_offset
+    is passed on to TDCCalibration.apply.
+    """
+    calibration.apply(batch, event_offset=event_offset)
+    if rt_function is None:
+        return None, None
+    rt_function.apply(batch)
+    return TrackFitter().fitCosmicBatch(
+        batch["x"], batch["y"], batch["drift_radius"], batch["event_offsets"]
+    )
+
+
+def _processFile(config, file_path, calibration, rt_function, profile):
+    """
+    Decode one raw file and histogram its hits, then, given a TDC calibration,
+    fill drift_time and, given r(t) as well, fit its tracks. Run in a worker
+    process. Events are numbered from 0 within the file.
+    """
+    with capture(profile is not None, memory=bool(profile)) as profiler:
+        with stage("RunProcessor.file"):
+            signal = Signal(config)
+            batch = signal.decodeWords(signal.readWords(file_path))
+            tdc_hist = HitHistogram.fromConfig(config, "tdc_time")
+            adc_hist = HitHistogram.fromConfig(config, "adc_time")
+            tdc_hist.fillBatch(batch)
+            adc_hist.fillBatch(batch)
+            theta = d = None
+            if calibration is not None:
+                theta, d = _fitBatch(batch, calibration, rt_function)
+        addCounts(
+            "RunProcessor.file",
+            files=1,
+            bytes=os.path.getsize(file_path),
+            events=len(batch["event_offsets"]) - 1,
+        )
+    return {
+        "batch": batch,
+        "tdc_hist": tdc_hist,
+        "adc_hist": adc_hist,
+        "theta": theta,
+        "d": d,
+        "profile": None if profiler is None else profiler.report(),
+    }
+
+
+class RunProcessor:
+    """
+    Decodes and reconstructs a run spread over many raw files with a pool of
+    worker processes, and merges the per file outputs into one batch.
+
+    Files are handed to the pool largest first, so the biggest files do not end
+    up alone at the tail of the run while the other workers are idle (longest
+    processing time first scheduling, with processing time taken to scale with
+    file size). Whatever order the files finish in, they are merged in file
+    order and events are numbered across the run, so event_number is unique and
+    follows the order the files were taken in.
+
+    Attributes:
+    -----------
+    config : ConfigParser
+    The run config.
+
+    files : list
+    The raw files in run order.
+
+    sizes : np.ndarray
+    Size in bytes of each file.
+
+    workers : int
+    Number of worker processes, 1 processes every file in this process.
+    """
+
+    def __init__(
+        self,
+        config,
+        files,
+        workers=None,
+        calibration=None,
+        rt_function=None,
+        run=None,
+    ):
+        """
+        Parameters:
+        -----------
+        config : ConfigParser
+        The run config.
+
+        files : list
+        Paths of the raw files, in run order (see expandFiles).
+
+        workers : int
+        Number of worker processes, defaults to the number of CPUs, capped at
+        the number of files.
+
+        calibration : TDCCalibration
+        Fills drift_time of every hit.
+
+        rt_function : RTFunction
+        Fills drift_radius. Tracks are fitted when it and calibration are set.
+
+        run : int
+        Run the files were taken in. A ValueError is raised here when it is
+        outside the run_range of calibration. None skips the check.
+        """
+        if len(files) == 0:
+            msg = "A run needs at least one file"
+            raise ValueError(msg)
+        self.config = config
+        self.files = list(files)
+        self.sizes = np.array([os.path.getsize(file) for file in self.files])
+        workers = os.cpu_count() if workers is None else workers
+        self.workers = max(1, min(workers, len(self.files)))
+        if calibration is not None:
+            calibration.checkRun(run)
+        self.calibration = calibration
+        self.rt_function = rt_function
+
+    def __repr__(self):
+        return (
+            f"RunProcessor(files={len(self.files)}, "
+            f"bytes={int(self.sizes.sum())}, workers={self.workers})"
+        )
+
+    def schedule(self):
+        """Indices of the files in the order they are handed to the pool."""
+        return np.argsort(-self.sizes, kind="stable")
+
+    def _fitInWorkers(self):
+        # A t0 table sliced in event_number needs the run-wide event numbers,
+        # which are only known once every file is decoded
+        return self.calibration is None or not self.calibration.event_sliced
+
+    def _mapFiles(self, calibration, rt_function):
+        """Yield (file index, result) as files finish."""
+        profile = None if active() is None else active().memory
+        order = self.schedule()
+        if self.workers == 1:
+            for index in order:
+                yield (
+                    index,
+                    _processFile(
+                        self.config,
+                        self.files[index],
+                        calibration,
+                        rt_function,
+                        profile,
+                    ),
+                )
+            return
+
+        from concurrent.futures import ProcessPoolExecutor, as_completed
+
+        # Forking a process that has already run the parallel kernels can hang
+        # it, which forkserver workers avoid
+        with ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("forkserver"),
+        ) as executor:
+            futures = {
+                executor.submit(
+                    _processFile,
+                    self.config,
+                    self.files[index],
+                    calibration,
+                    rt_function,
+                    profile,
+                ): index
+                for index in order
+            }
+            for future in as_completed(futures):
+                yield futures[future], future.result()
+
+    @profiled("RunProcessor.run")
+    def run(self):
+        """
+        Process every file.
+
+        Returns:
+        --------
+        results : dict
+        The merged batch ("batch"), the merged "tdc_hist" and "adc_hist", the per
+        event "theta" and "d" (None without calibration and r(t)),
+        "file_offsets" (the events of files[i] are event_number
+        file_offsets[i] to file_offsets[i + 1] - 1) and the wall time in
+        "seconds".
+        """
+        start = time.perf_counter()
+        in_workers = self._fitInWorkers()
+        calibration = self.calibration if in_workers else None
+        results = [None] * len(self.files)
+        for done, (index, result) in enumerate(
+            self._mapFiles(calibration, self.rt_function), start=1
+        ):
+            if result["profile"] is not None:
+                active().merge(result["profile"])
+            results[index] = result
+            print(
+                f"[{done}/{len(self.files)}] {os.path.basename(self.files[index])}: "
+                f"{len(result['batch']['event_offsets']) - 1} events"
+            )
+
+        batch = concatBatches([result["batch"] for result in results])
+        events_per_file = [
+            len(result["batch"]["event_offsets"]) - 1 for result in results
+        ]
+        file_offsets = np.zeros(len(results) + 1, dtype=np.int64)
+        np.cumsum(events_per_file, out=file_offsets[1:])
+        theta = d = None
+        if in_workers and results[0]["theta"] is not None:
+            theta = np.concatenate([result["theta"] for result in results])
+            d = np.concatenate([result["d"] for result in results])
+        elif not in_workers:
+            theta, d = _fitBatch(
+                batch, self.calibration, self.rt_function, event_offset=0
+            )
+        return {
+            "batch": batch,
+            "tdc_hist": sum(result["tdc_hist"] for result in results),
+            "adc_hist": sum(result["adc_hist"] for result in results),
+            "theta": theta,
+            "d": d,
+            "file_offsets": file_offsets,
+            "seconds": time.perf_counter() - start,
+        }
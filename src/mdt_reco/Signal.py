@@ -1,9 +1,13 @@
+import os
 import random
+import time
 
 import numpy as np
 
 import mdt_reco
 
+from .Profiling import addCounts, profiled
+
 
 class Signal:
     """
@@ -25,6 +29,7 @@ class Signal:
         and MaxHits and MinHits under the header Reconstruction.
         """
         self._config = config
+        self._geometry = None
         if config["Signal"]["DataType"] == "Phase2":
             self._header_length = 5
             self._word_length = 40
@@ -36,6 +41,13 @@ class Signal:
             self._trailer_four_zeroes = "0000"
             self._cycles_to_time = 25 / 32
 
+    @property
+    def geometry(self):
+        """The Chamber of the config, built on first use and reused for every event."""
+        if self._geometry is None:
+            self._geometry = mdt_reco.geo(self._config)
+        return self._geometry
+
     # Encoding methods
     def convertIntToBits(self, n, width):
         """
@@ -219,6 +231,7 @@ class Signal:
             # Write the Trailer
             self.writeTrailer(event, binary_file, event_id)
 
+    @profiled("Signal.encodeEvents")
     def encodeEvents(self, events, file):
         """
         This function writes all of the events contained in events to a specified binary file.
@@ -233,6 +246,119 @@ class Signal:
         """
         for i in range(len(events)):
             self.encodeEvent(events[i], file, i)
+        addCounts("Signal.encodeEvents", events=len(events))
+
+    @profiled("Signal.encodeWords")
+    def encodeWords(self, batch, first_event_id=0, rng=None):
+        """
+        Encode a columnar batch (see eventsToBatch) into Phase2 words in one
+        vectorized pass, with the same layout encodeEvents writes to a file.
+
+        Fields wider than their bits are cut to the field: the event ID to its
+        low 12 bits, lEdge to 17 bits and the pulse width is saturated at 255.
+
+        Parameters:
+        -----------
+        batch : dict
+        A columnar batch holding csm_id, tdc_id, channel, tdc_time and adc_time.
+
+        first_event_id : int
+        ID written in the Header of the first event, incremented per event.
+
+        rng : np.random.Generator
+        Source of the trigger times and the random status fields, a fresh
+        default_rng when None.
+
+        Returns:
+        --------
+        words : np.ndarray
+        uint64 array holding one 40 bit word per entry.
+        """
+        if self._config["Signal"]["DataType"] != "Phase2":
+            data_type = self._config["Signal"]["DataType"]
+            msg = f"Data format is {data_type} is not supported."
+            raise NotImplementedError(msg)
+        rng = np.random.default_rng() if rng is None else rng
+        offsets = np.asarray(batch["event_offsets"], dtype=np.int64)
+        n_events = len(offsets) - 1
+        hits_per_event = np.diff(offsets).astype(np.uint64)
+        n_hits = int(offsets[-1])
+        addCounts("Signal.encodeWords", events=n_events, hits=n_hits)
+        event_ids = (np.arange(n_events, dtype=np.uint64) + first_event_id) & 0xFFF
+        trigger = rng.integers(0, 2**17, n_events, dtype=np.uint64)
+
+        # Each event is a Header, three words per hit and a Trailer
+        words = np.zeros(n_hits * 3 + n_events * 2, dtype=np.uint64)
+        header_index = offsets[:-1] * 3 + np.arange(n_events) * 2
+        trailer_index = header_index + 1 + 3 * np.diff(offsets)
+        words[header_index] = (
+            (np.uint64(int(self._header_id, 2)) << np.uint64(29))
+            | (event_ids << np.uint64(17))
+            | trigger
+        )
+        n_tdcs = hits_per_event & 0xF
+        words[trailer_index] = (
+            (np.uint64(int(self._trailer_id, 2)) << np.uint64(36))
+            | (n_tdcs << np.uint64(32))
+            | (n_tdcs << np.uint64(28))
+            | (event_ids << np.uint64(16))
+            | (rng.integers(0, 2, n_events, dtype=np.uint64) << np.uint64(15))
+            | (rng.integers(0, 2, n_events, dtype=np.uint64) << np.uint64(14))
+            | (hits_per_event & 0x3FF)
+        )
+
+        hit_event = np.repeat(np.arange(n_events), np.diff(offsets))
+        tdc_index = np.arange(n_hits) * 3 + hit_event * 2 + 1
+        csm_ids = np.asarray(batch["csm_id"], dtype=np.uint64) & 0x7
+        tdc_ids = np.asarray(batch["tdc_id"], dtype=np.uint64) & 0x1F
+        ids = (csm_ids << np.uint64(37)) | (tdc_ids << np.uint64(32))
+        words[tdc_index] = (
+            ids
+            | (np.uint64(int(self._tdc_header_id, 2)) << np.uint64(24))
+            | (rng.integers(0, 2**12, n_hits, dtype=np.uint64) << np.uint64(12))
+        )
+        trigger_ns = trigger[hit_event] * self._cycles_to_time
+        l_edge = np.ceil(
+            (batch["tdc_time"] + trigger_ns) * (1 / self._cycles_to_time)
+        ).astype(np.int64)
+        width = np.clip(np.asarray(batch["adc_time"]).astype(np.int64), 0, 255)
+        mode = 1
+        words[tdc_index + 1] = (
+            ids
+            | (np.asarray(batch["channel"], dtype=np.uint64) & 0x1F) << np.uint64(27)
+            | np.uint64(mode << 25)
+            | (l_edge.astype(np.uint64) & 0x1FFFF) << np.uint64(8)
+            | width.astype(np.uint64)
+        )
+        words[tdc_index + 2] = (
+            ids
+            | (np.uint64(int(self._tdc_trailer_id, 2)) << np.uint64(12))
+            | (rng.integers(0, 2, n_hits, dtype=np.uint64) << np.uint64(11))
+            | (rng.integers(0, 2, n_hits, dtype=np.uint64) << np.uint64(10))
+            | rng.integers(0, 2**10, n_hits, dtype=np.uint64)
+        )
+        return words
+
+    def wordsToBytes(self, words):
+        """The big endian bytes of 40 bit words, as written to a binary file."""
+        big_endian = np.asarray(words, dtype=">u8").view(np.uint8)
+        return big_endian.reshape(-1, 8)[:, 8 - self._header_length :].tobytes()
+
+    def bytesToWords(self, data):
+        """
+        The 40 bit words of a byte string. Trailing bytes that do not fill a
+        word are ignored.
+        """
+        raw = np.frombuffer(data, dtype=np.uint8)
+        raw = raw[: len(raw) - len(raw) % self._header_length]
+        padded = np.zeros((len(raw) // self._header_length, 8), dtype=np.uint8)
+        padded[:, 8 - self._header_length :] = raw.reshape(-1, self._header_length)
+        return padded.view(">u8").ravel().astype(np.uint64)
+
+    def readWords(self, binary_file):
+        """The 40 bit words of a binary file, see bytesToWords."""
+        with open(binary_file, "rb") as b_file:
+            return self.bytesToWords(b_file.read())
 
     # Decoding methods
     def checkHeader(self, bytes):
@@ -374,7 +500,7 @@ class Signal:
         An Event object that contains the information from the event list.
         """
         # Get overall trigger time
-        geometry = mdt_reco.geo(self._config)
+        geometry = self.geometry
         trigger_time = self.findTriggerTime(event)
         csm_id_array = []
         tdc_id_array = []
@@ -412,7 +538,8 @@ class Signal:
         event_object["y"] = y_array
         return event_object
 
-    def decodeEvents(self, binary_file):
+    @profiled("Signal.decodeEvents")
+    def decodeEvents(self, binary_file, event_filter=None):
         """
         This function produces a list of Event objects that represents all of
         the events contained in a binary file. The events in the file are decoded
@@ -424,6 +551,10 @@ class Signal:
         binary_file : binaryIO
         A binary file containing one or multiple events.
 
+        event_filter : EventFilter
+        Keep only the events it passes. It is evaluated on the words of the
+        whole file up front, so rejected events are never accumulated.
+
         Returns:
         --------
         events : list
@@ -439,6 +570,9 @@ class Signal:
             # Find the headers
             header_locations = self.findHeaders(binary_file)
             print(f"Found {len(header_locations)} headers in the file.")
+            passed = np.ones(len(header_locations), dtype=bool)
+            if event_filter is not None:
+                passed = self._passedHeaders(binary_file, event_filter)
             with open(binary_file, "rb") as b_file:
                 bytes = b_file.read(self._header_length)
                 counter = 0
@@ -481,6 +615,7 @@ class Signal:
                                     * self._header_length
                                 )
                                 + 2 * self._header_length
+                                and passed[index_of_header]
                             ):
                                 good_packet = True
                         else:
@@ -499,11 +634,448 @@ class Signal:
                         >= self._config["Reconstruction"]["MinHits"]
                         * 3
                         * self._header_length
+                        and passed[-1]
                     ):
                         event_object = self.accumulateEvents(event)
                         events.append(event_object)
                         if len(events) % 1000 == 0:
                             print(f"Decoded {len(events)} events so far.")
+            addCounts("Signal.decodeEvents", events=len(events))
             return events
         msg = f"Data format is {self.data_format} is not supported."
         raise NotImplementedError(msg)
+
+    def _passedHeaders(self, binary_file, event_filter):
+        """Whether event_filter passes the event of each Header of the file."""
+        words = self.readWords(binary_file)
+        headers, ends, _ = self._eventBounds(words)
+        data_index, hit_event = self._hitWords(words, headers, ends)
+        return self._filterEvents(
+            event_filter, words, headers, words[data_index], hit_event
+        )
+
+    def _eventBounds(self, words):
+        """
+        The index of every Header, the index where its event ends and whether the
+        event holds MinHits to MaxHits hits.
+        """
+        headers = np.flatnonzero((words >> np.uint64(29)) == int(self._header_id, 2))
+        ends = np.append(headers[1:], len(words))
+        min_words = self._config["Reconstruction"]["MinHits"] * 3 + 2
+        max_words = self._config["Reconstruction"]["MaxHits"] * 3 + 2
+        lengths = ends - headers
+        return headers, ends, (lengths >= min_words) & (lengths <= max_words)
+
+    def _hitWords(self, words, headers, ends):
+        """
+        The index of the TDC Data word of every hit inside an event and the index
+        of the Header of its event.
+        """
+        is_tdc_header = (words >> np.uint64(24)) & np.uint64(0xFF) == int(
+            self._tdc_header_id, 2
+        )
+        is_tdc_trailer = (words >> np.uint64(12)) & np.uint64(0xFFFFF) == int(
+            self._tdc_trailer_id, 2
+        )
+        candidates = np.flatnonzero(is_tdc_header[:-2] & is_tdc_trailer[2:])
+        hit_event = np.searchsorted(headers, candidates, side="right") - 1
+        inside = hit_event >= 0
+        inside[inside] = candidates[inside] + 2 < ends[hit_event[inside]]
+        return candidates[inside] + 1, hit_event[inside]
+
+    def _filterEvents(self, event_filter, words, headers, data, hit_event):
+        """event_filter.select on the raw words, see EventFilter."""
+        trigger_time = (words[headers] & np.uint64(0x1FFFF)) * self._cycles_to_time
+        csm_id = (data >> np.uint64(37)).astype(np.uint8) & 0x7
+        tdc_id = ((data >> np.uint64(32)) & np.uint64(0x1F)).astype(np.uint8)
+        return event_filter.select(trigger_time, csm_id, tdc_id, hit_event)
+
+    @profiled("Signal.decodeWords")
+    def decodeWords(self, words, event_filter=None):
+        """
+        Decode Phase2 words into a columnar batch with whole array operations, the
+        in memory counterpart of decodeEvents.
+
+        An event runs from its Header to the next one (or the end of the words)
+        and is kept when it holds MinHits to MaxHits hits, counting the Header and
+        Trailer. Unlike decodeEvents the last event is judged like every other.
+        A hit is a TDC Header followed two words later by a TDC Trailer within the
+        same event, with the TDC Data in between. TDC times are measured from the
+        trigger modulo the rollover of the 17 bit lEdge counter.
+
+        Parameters:
+        -----------
+        words : np.ndarray
+        uint64 array of 40 bit words, e.g. from readWords or encodeWords.
+
+        event_filter : EventFilter
+        Keep only the events it passes, judged on the raw words before their
+        hits are decoded.
+
+        Returns:
+        --------
+        batch : dict
+        Per hit csm_id, tdc_id, channel, tdc_time, adc_time, x and y plus
+        event_offsets and event_number (see eventsToBatch). x and y are NaN for
+        IDs that are not part of the chamber. event_number counts the events
+        passing MinHits and MaxHits, whether or not event_filter keeps them, so
+        it does not depend on the filter.
+        """
+        if self._config["Signal"]["DataType"] != "Phase2":
+            data_type = self._config["Signal"]["DataType"]
+            msg = f"Data format is {data_type} is not supported."
+            raise NotImplementedError(msg)
+        words = np.asarray(words, dtype=np.uint64)
+        headers, ends, good_events = self._eventBounds(words)
+        data_index, hit_event = self._hitWords(words, headers, ends)
+        inside = good_events[hit_event]
+        data = words[data_index[inside]]
+        hit_event = hit_event[inside]
+
+        # Number the events passing MinHits and MaxHits from 0 in file order
+        event_number = np.cumsum(good_events) - 1
+        kept_events = good_events
+        if event_filter is not None:
+            kept_events = good_events & self._filterEvents(
+                event_filter, words, headers, data, hit_event
+            )
+            kept = kept_events[hit_event]
+            data = data[kept]
+            hit_event = hit_event[kept]
+        hits_per_event = np.bincount(
+            np.cumsum(kept_events)[hit_event] - 1, minlength=int(kept_events.sum())
+        )
+        event_offsets = np.zeros(len(hits_per_event) + 1, dtype=np.int64)
+        np.cumsum(hits_per_event, out=event_offsets[1:])
+
+        trigger_time = (words[headers] & np.uint64(0x1FFFF)).astype(np.int64)
+        l_edge = ((data >> np.uint64(8)) & np.uint64(0x1FFFF)).astype(np.int64)
+        csm_id = (data >> np.uint64(37)).astype(np.uint8) & 0x7
+        tdc_id = ((data >> np.uint64(32)) & np.uint64(0x1F)).astype(np.uint8)
+        channel = ((data >> np.uint64(27)) & np.uint64(0x1F)).astype(np.uint8)
+        tube_index = self.geometry.getTubeIndex(csm_id, tdc_id, channel)
+        in_chamber = tube_index >= 0
+        x = np.full(len(data), np.nan, dtype=np.float32)
+        y = np.full(len(data), np.nan, dtype=np.float32)
+        x[in_chamber] = self.geometry["x"][tube_index[in_chamber]]
+        y[in_chamber] = self.geometry["y"][tube_index[in_chamber]]
+        addCounts(
+            "Signal.decodeWords",
+            events=len(hits_per_event),
+            hits=len(data),
+            filtered=int(good_events.sum()) - len(hits_per_event),
+        )
+        # The 17 bit counter rolls over, so the difference is taken modulo 2**17
+        # and mapped to [-2**16, 2**16) cycles around the trigger
+        cycles = (l_edge - trigger_time[hit_event] + 2**16) % 2**17 - 2**16
+        return {
+            "csm_id": csm_id,
+            "tdc_id": tdc_id,
+            "channel": channel,
+            "tdc_time": (cycles * self._cycles_to_time).astype(np.float32),
+            "adc_time": (data & np.uint64(0xFF)).astype(np.float32),
+            "x": x,
+            "y": y,
+            "event_offsets": event_offsets,
+            "event_number": event_number[hit_event],
+        }
+
+    def follow(
+        self,
+        binary_file,
+        poll_interval=0.5,
+        flush_after=None,
+        stop=None,
+        read_size=2**20,
+        event_filter=None,
+    ):
+        """
+        Follow a binary file that is still being written, like tail -f, and yield
+        the events completed by every read as a columnar batch (see decodeWords),
+        with event_number counted from the start of the file.
+
+        Partial words and events are buffered across reads by an EventFramer, so
+        an event is decoded once it is complete however the writer splits it. An
+        event is complete when its Trailer or the next Header has been read, so
+        events are yielded at most poll_interval after they land.
+
+        Parameters:
+        -----------
+        binary_file : str
+        The path of the file, waited for if it does not exist yet.
+
+        poll_interval : float
+        Seconds to sleep when the end of the file has been reached.
+
+        flush_after : float
+        Decode an incomplete event left buffered after this many seconds without
+        new data, e.g. when the writer died mid event. None waits forever.
+
+        stop : threading.Event
+        Once set, the file is read to its end, the buffer is flushed and the
+        generator returns. Without it the file is followed until the generator
+        is closed.
+
+        read_size : int
+        Maximum number of bytes per read.
+
+        event_filter : EventFilter
+        Yield only the events it passes, see decodeWords.
+        """
+        framer = EventFramer(self, event_filter)
+        while not os.path.exists(binary_file):
+            if stop is not None and stop.is_set():
+                return
+            time.sleep(poll_interval)
+        with open(binary_file, "rb") as b_file:
+            last_data = time.monotonic()
+            while True:
+                data = b_file.read(read_size)
+                if data:
+                    last_data = time.monotonic()
+                    batch = framer.feed(data)
+                    if batch is not None:
+                        yield batch
+                    continue
+                stopping = stop is not None and stop.is_set()
+                idle = time.monotonic() - last_data
+                if stopping or (flush_after is not None and idle > flush_after):
+                    batch = framer.flush()
+                    if batch is not None:
+                        yield batch
+                if stopping:
+                    return
+                time.sleep(poll_interval)
+
+
+class EventFramer:
+    """
+    Cuts a Phase2 byte or word stream that arrives in arbitrary pieces (reads of a
+    growing file, network packets) into whole events and decodes them with
+    Signal.decodeWords.
+
+    Bytes that do not fill a word and the words of the event still being received
+    are kept between calls. An event is complete once the next Header arrives, or
+    as soon as its last word is a Trailer whose hit count matches the event
+    length, so a steady stream is decoded without waiting for the next trigger.
+    Words before the first Header are dropped, as decodeWords would. frame cuts
+    without decoding, for decoding the words elsewhere.
+
+    Attributes:
+    -----------
+    signal : Signal
+    Decodes the complete events.
+
+    event_filter : EventFilter
+    Passed to decodeWords, or None.
+
+    n_events : int
+    Number of complete events framed so far, the event_number of the next one.
+    Events event_filter rejects are counted too, as decodeWords numbers them.
+
+    n_bytes : int
+    Number of bytes fed so far.
+    """
+
+    def __init__(self, signal, event_filter=None):
+        self.signal = signal
+        self.event_filter = event_filter
+        self.n_events = 0
+        self.n_bytes = 0
+        self._partial_bytes = b""
+        self._words = np.zeros(0, dtype=np.uint64)
+        self._header_id = np.uint64(int(signal._header_id, 2))
+        self._trailer_id = np.uint64(int(signal._trailer_id, 2))
+        self._word_bytes = signal._header_length
+
+    def __repr__(self):
+        return (
+            f"EventFramer(n_events={self.n_events}, n_bytes={self.n_bytes}, "
+            f"pending_words={len(self._words)})"
+        )
+
+    @property
+    def pending(self):
+        """True while words or bytes of an incomplete event are buffered."""
+        return len(self._words) > 0 or len(self._partial_bytes) > 0
+
+    def feed(self, data):
+        """
+        Add bytes and return the batch of the events they complete, or None when
+        they complete none.
+        """
+        return self._decode(*self.frame(data))
+
+    def feedWords(self, words):
+        """Like feed for 40 bit words, e.g. from bytesToWords."""
+        return self._decode(*self.frameWords(words))
+
+    def flush(self):
+        """
+        Decode whatever is buffered as if the stream ended here and return its
+        batch, or None.
+        """
+        return self._decode(*self.flushWords())
+
+    def frame(self, data):
+        """
+        Add bytes and return the words of the events they complete, undecoded, to
+        be decoded elsewhere, e.g. in a worker process.
+
+        Returns:
+        --------
+        words : np.ndarray
+        The words of the complete events, starting at a Header, possibly empty.
+
+        first_event_number : int
+        The event_number of the first event decodeWords keeps from words.
+        """
+        self.n_bytes += len(data)
+        data = self._partial_bytes + bytes(data)
+        n_whole = len(data) - len(data) % self._word_bytes
+        self._partial_bytes = data[n_whole:]
+        return self.frameWords(self.signal.bytesToWords(data[:n_whole]))
+
+    def frameWords(self, words):
+        """Like frame for 40 bit words."""
+        words = np.concatenate([self._words, np.asarray(words, dtype=np.uint64)])
+        headers = np.flatnonzero((words >> np.uint64(29)) == self._header_id)
+        if len(headers) == 0:
+            self._words = words[:0]
+            return words[:0], self.n_events
+        cut = headers[-1]
+        last = words[-1]
+        is_trailer = (last >> np.uint64(36)) & np.uint64(0xF) == self._trailer_id
+        if is_trailer and len(words) - cut == 3 * int(last & np.uint64(0x3FF)) + 2:
+            cut = len(words)
+        self._words = words[cut:].copy()
+        return self._count(words[headers[0] : cut])
+
+    def flushWords(self):
+        """Like flush, returning the buffered words as frame does."""
+        words = self._words
+        self._words = words[:0]
+        self._partial_bytes = b""
+        return self._count(words)
+
+    def _count(self, words):
+        first_event_number = self.n_events
+        self.n_events += int(self.signal._eventBounds(words)[2].sum())
+        return words, first_event_number
+
+    def _decode(self, words, first_event_number):
+        if len(words) == 0:
+            return None
+        batch = self.signal.decodeWords(words, self.event_filter)
+        if len(batch["event_offsets"]) == 1:
+            return None
+        batch["event_number"] += first_event_number
+        return batch
+
+
+class EventFilter:
+    """
+    Predicates on the Header and TDC word fields of Phase2 events. The decoders
+    evaluate them on the raw words, before any geometry lookup or Event is built,
+    so a rejected event costs a few array operations.
+
+    An event is kept when it passes every predicate that is set, on top of the
+    MinHits and MaxHits cut of the Reconstruction section.
+
+    Attributes:
+    -----------
+    csm_ids, tdc_ids : np.ndarray
+    Keep events with at least one hit on one of these CSMs and, when both are
+    set, on one of these TDCs of them. None accepts any.
+
+    min_hits, max_hits : int
+    Keep events with min_hits to max_hits decoded hits. None leaves that end
+    open.
+
+    trigger_window : tuple
+    Keep events whose trigger time, the lEdge of the Header in ns modulo the
+    rollover of the 17 bit counter, lies in [low, high). A window with low above
+    high wraps around the rollover. None accepts any.
+    """
+
+    def __init__(
+        self,
+        csm_ids=None,
+        tdc_ids=None,
+        min_hits=None,
+        max_hits=None,
+        trigger_window=None,
+    ):
+        self.csm_ids = None if csm_ids is None else np.unique(csm_ids)
+        self.tdc_ids = None if tdc_ids is None else np.unique(tdc_ids)
+        self.min_hits = min_hits
+        self.max_hits = max_hits
+        if trigger_window is not None and len(trigger_window) != 2:
+            msg = f"trigger_window needs (low, high), got {trigger_window}"
+            raise ValueError(msg)
+        self.trigger_window = None if trigger_window is None else tuple(trigger_window)
+
+    @classmethod
+    def fromConfig(cls, config):
+        """
+        The filter set in the Filter section of the config, or None when the
+        section is missing or sets nothing.
+        """
+        section = config.get("Filter") or {}
+        keys = ("csm_ids", "tdc_ids", "min_hits", "max_hits", "trigger_window")
+        unknown = set(section) - set(keys)
+        if unknown:
+            msg = f"Unknown Filter settings: {', '.join(sorted(unknown))}"
+            raise KeyError(msg)
+        if all(section.get(key) is None for key in keys):
+            return None
+        return cls(**{key: section.get(key) for key in keys})
+
+    def __repr__(self):
+        settings = ", ".join(
+            f"{key}={value.tolist() if isinstance(value, np.ndarray) else value}"
+            for key, value in vars(self).items()
+            if value is not None
+        )
+        return f"EventFilter({settings})"
+
+    def select(self, trigger_time, csm_id, tdc_id, hit_event):
+        """
+        Whether each event passes.
+
+        Parameters:
+        -----------
+        trigger_time : np.ndarray
+        Per event trigger time in ns.
+
+        csm_id, tdc_id : np.ndarray
+        Per hit IDs, from the TDC Data words.
+
+        hit_event : np.ndarray
+        Index of each hit's event in trigger_time.
+
+        Returns:
+        --------
+        passed : np.ndarray
+        Boolean mask over the events.
+        """
+        n_events = len(trigger_time)
+        passed = np.ones(n_events, dtype=bool)
+        if self.min_hits is not None or self.max_hits is not None:
+            hits = np.bincount(hit_event, minlength=n_events)
+            if self.min_hits is not None:
+                passed &= hits >= self.min_hits
+            if self.max_hits is not None:
+                passed &= hits <= self.max_hits
+        if self.csm_ids is not None or self.tdc_ids is not None:
+            touching = np.ones(len(hit_event), dtype=bool)
+            if self.csm_ids is not None:
+                touching &= np.isin(csm_id, self.csm_ids)
+            if self.tdc_ids is not None:
+                touching &= np.isin(tdc_id, self.tdc_ids)
+            passed &= np.bincount(hit_event[touching], minlength=n_events) > 0
+        if self.trigger_window is not None:
+            low, high = self.trigger_window
+            after, before = trigger_time >= low, trigger_time < high
+            passed &= (after & before) if low <= high else (after | before)
+        return passed
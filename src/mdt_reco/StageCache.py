@@ -0,0 +1,173 @@
+import functools
+import hashlib
+import os
+import pickle
+import shutil
+
+from .ConfigParser import fileIdentity, fingerprint
+
+
+@functools.cache
+def _codeVersion():
+    """
+    sha256 of the mdt_reco source files, so any change to the decoding or
+    fitting code gives new keys, where the distribution version would not.
+    """
+    digest = hashlib.sha256()
+    package_dir = os.path.dirname(os.path.abspath(__file__))
+    for name in sorted(os.listdir(package_dir)):
+        if name.endswith(".py"):
+            digest.update(name.encode())
+            with open(os.path.join(package_dir, name), "rb") as file:
+                digest.update(file.read())
+    return digest.hexdigest()
+
+
+def _savePickle(value, file_path):
+    with open(file_path, "wb") as f:
+        pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def _loadPickle(file_path):
+    with open(file_path, "rb") as f:
+        return pickle.load(f)
+
+
+class StageCache:
+    """
+    On-disk cache of pipeline stage outputs (decoded events, histograms,
+    calibrations, chambers).
+
+    A stage output is stored under a key hashing the stage name, the mdt_reco
+    source code, the config sections the stage reads, the contents (size and sha256)
+    of its input files and any extra parameters. A re-run whose key is unchanged
+    loads the stored output instead of recomputing it, and any change to one of
+    those inputs gives a new key.
+
+    Attributes:
+    -----------
+    cache_dir : str
+    Directory holding one subdirectory per stage.
+
+    enabled : bool
+    When False every stage is recomputed and nothing is written.
+    """
+
+    def __init__(self, cache_dir, enabled=True):
+        self.cache_dir = cache_dir
+        self.enabled = enabled
+
+    def __repr__(self):
+        return f"StageCache(cache_dir={self.cache_dir!r}, enabled={self.enabled})"
+
+    def key(self, stage, config, sections, input_files=(), **parameters):
+        """
+        Parameters:
+        -----------
+        stage : str
+        Name of the stage.
+
+        config : ConfigParser
+        The run config.
+
+        sections : list
+        Names of the config sections the stage depends on.
+
+        input_files : list
+        Paths of the files the stage reads.
+
+        parameters :
+        Any other JSON serialisable inputs, e.g. command line options.
+
+        Returns:
+        --------
+        key : str
+        sha256 hex digest identifying the stage output.
+        """
+        return fingerprint(
+            stage,
+            _codeVersion(),
+            config.fingerprint(*sections),
+            [fileIdentity(file_path) for file_path in input_files],
+            parameters,
+        )
+
+    def stageDir(self, stage):
+        return os.path.join(self.cache_dir, stage)
+
+    def path(self, stage, key, suffix=".pkl"):
+        return os.path.join(self.stageDir(stage), key[:32] + suffix)
+
+    def cached(self, stage, key, compute, save=None, load=None, suffix=".pkl"):
+        """
+        Return the stored output of a stage, or compute and store it.
+
+        Parameters:
+        -----------
+        stage : str
+        Name of the stage.
+
+        key : str
+        Key from StageCache.key.
+
+        compute : callable
+        Called without arguments to produce the output on a miss.
+
+        save, load : callable
+        save(value, file_path) and load(file_path), pickle by default.
+
+        suffix : str
+        Extension of the cache file, ending the temporary file name as well so
+        savers that append an extension (np.savez) write where expected.
+        """
+        save = _savePickle if save is None else save
+        load = _loadPickle if load is None else load
+        if not self.enabled:
+            return compute()
+        file_path = self.path(stage, key, suffix)
+        if os.path.exists(file_path):
+            print(f"Using cached {stage} from {file_path}")
+            return load(file_path)
+        value = compute()
+        os.makedirs(self.stageDir(stage), exist_ok=True)
+        # Written under a temporary name first so a crash never leaves a partial
+        # file behind the final name
+        temp_path = f"{file_path[: -len(suffix)]}.{os.getpid()}.tmp{suffix}"
+        save(value, temp_path)
+        os.replace(temp_path, file_path)
+        return value
+
+    def cachedFile(self, stage, key, output_path, write):
+        """
+        Like cached for a stage whose output is a file. On a hit the stored file
+        is copied to output_path byte for byte, so the identity of output_path
+        (and the keys of the stages reading it) stay the same across re-runs.
+
+        Parameters:
+        -----------
+        output_path : str
+        Where the stage output is wanted.
+
+        write : callable
+        Called as write(file_path) on a miss to produce the output.
+
+        Returns:
+        --------
+        hit : bool
+        True when the output came from the cache.
+        """
+        if not self.enabled:
+            write(output_path)
+            return False
+        suffix = os.path.splitext(output_path)[1]
+        file_path = self.path(stage, key, suffix)
+        if os.path.exists(file_path):
+            print(f"Using cached {stage} from {file_path}")
+            shutil.copyfile(file_path, output_path)
+            return True
+        os.makedirs(self.stageDir(stage), exist_ok=True)
+        temp_path = f"{file_path[: -len(suffix) or None]}.{os.getpid()}.tmp{suffix}"
+        write(temp_path)
+        shutil.copyfile(temp_path, output_path)
+        os.replace(temp_path, file_path)
+        return False
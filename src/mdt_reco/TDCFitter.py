@@ -1,5 +1,7 @@
 import numpy as np
-from numba import njit
+from numba import njit, prange
+
+from .Profiling import addCounts, profiled
 
 
 def getInitialT0(time_counts, time_centers):
@@ -20,173 +22,548 @@ def getInitialTMax(time_counts, time_centers):
     raise ValueError(msg)
 
 
-@njit
-def _t0_objective(time_counts, time_centers, min_time, max_time, t0):
-    err2: np.float32 = 0
-    amplitude: np.float32 = 0
-    total_bins = len(time_counts)
-    sorted_indices = np.argsort(time_counts)[::-1]
-    bins_to_avg = int(total_bins / 10)
-    largest_counts = time_counts[sorted_indices[:bins_to_avg]]
+@njit(cache=True)
+def _window_bins(time_centers, center_half_width, min_time, max_time):
+    """
+    Index range [k_lo, k_hi) of the bins lying entirely inside (min_time, max_time).
+    """
+    k_lo = 0
+    while (
+        k_lo < len(time_centers) and time_centers[k_lo] - center_half_width <= min_time
+    ):
+        k_lo += 1
+    k_hi = k_lo
+    while (
+        k_hi < len(time_centers) and time_centers[k_hi] + center_half_width < max_time
+    ):
+        k_hi += 1
+    return k_lo, k_hi
+
+
+@njit(cache=True)
+def _prefix_sums(time_counts, amplitude):
+    """
+    Cumulative sums of c, c^2 and (c - amplitude)^2 with a leading zero, so any
+    range of bins can be summed in O(1).
+    """
+    n_bins = len(time_counts)
+    s1 = np.zeros(n_bins + 1)
+    s2 = np.zeros(n_bins + 1)
+    r2 = np.zeros(n_bins + 1)
+    for k in range(n_bins):
+        count = np.float64(time_counts[k])
+        s1[k + 1] = s1[k] + count
+        s2[k + 1] = s2[k] + count * count
+        r2[k + 1] = r2[k] + (count - amplitude) ** 2
+    return s1, s2, r2
+
+
+@njit(cache=True)
+def _plateau_amplitude(time_counts):
+    """Average of the 10% largest bins."""
+    bins_to_avg = max(1, int(len(time_counts) / 10))
+    largest_counts = np.sort(time_counts)[::-1][:bins_to_avg]
+    amplitude = 0.0
     for count in largest_counts:
         amplitude += count
-    amplitude /= len(largest_counts)
-
-    center_half_width = 0.5 * (time_centers[1] - time_centers[0])
-    for k in range(len(time_centers)):
-        center = time_centers[k]
-        if (
-            center - center_half_width > min_time
-            and center + center_half_width < max_time
-        ):
-            if center + center_half_width <= t0:
-                err2 += (2 * time_counts[k] * center_half_width) ** 2
-            elif center - center_half_width >= t0:
-                err2 += 4 * ((time_counts[k] - amplitude) * center_half_width) ** 2
-            else:
-                delta_t = t0 - center
-                w1 = center_half_width + delta_t
-                w2 = center_half_width - delta_t
-                err2 += (w1 * time_counts[k]) ** 2
-                err2 += (w2 * (time_counts[k] - amplitude)) ** 2
-    return err2
-
-
-@njit
-def _tmax_objective(time_counts, time_centers, min_time, max_time, tmax):
-    err2: np.float32 = 0
-    amplitude: np.float32 = 0
-
-    idx = np.searchsorted(time_centers, tmax)
-    running_bins = int(len(time_counts) / 10)
-    min_index = max(0, idx - running_bins)
-    window = time_counts[min_index:idx]
-    for i in range(len(window)):
-        amplitude += window[i]
+    return amplitude / bins_to_avg
 
-    amplitude /= len(window)
 
-    center_half_width = 0.5 * (time_centers[1] - time_centers[0])
-    for k in range(len(time_centers)):
-        center = time_centers[k]
-        if (
-            center - center_half_width > min_time
-            and center + center_half_width < max_time
-        ):
-            if center - center_half_width >= tmax:
-                err2 += (2 * time_counts[k] * center_half_width) ** 2
-            elif center + center_half_width <= tmax:
-                err2 += (2 * (time_counts[k] - amplitude) * center_half_width) ** 2
-            else:
-                delta_t = tmax - center
-                w1 = center_half_width + delta_t
-                w2 = center_half_width - delta_t
-                err2 += (w1 * (time_counts[k] - amplitude)) ** 2
-                err2 += (w2 * time_counts[k]) ** 2
-    return err2
-
-
-@njit
+@njit(cache=True)
 def _find_t0(time_counts, time_centers, t0_initial, n_steps):
+    """
+    Scan n_steps candidate t0 values and return the one minimizing the squared
+    difference between the histogram and a step from 0 to the plateau amplitude,
+    using only the bins inside the scan window.
+
+    Bins below t0 contribute (2 * c * hw)^2 and bins above contribute
+    4 * ((c - amplitude) * hw)^2. Both are read from prefix sums, and the candidates
+    are scanned in increasing order so the bins split by t0 are tracked with two
+    moving indices. The whole scan is O(bins + n_steps).
+    """
     min_time = t0_initial - 20
     max_time = t0_initial + 80
     delta_time = max_time - min_time
+    center_half_width = 0.5 * (time_centers[1] - time_centers[0])
+    four_hw2 = 4 * center_half_width**2
+
+    amplitude = _plateau_amplitude(time_counts)
+    k_lo, k_hi = _window_bins(time_centers, center_half_width, min_time, max_time)
+    _, s2, r2 = _prefix_sums(time_counts, amplitude)
+
+    # [k_lo, below) lies fully below t0, [above, k_hi) fully above it
+    below = k_lo
+    above = k_lo
     best_obj = 1e12
     best_t0 = t0_initial
     for n in range(n_steps):
         t0 = min_time + (delta_time * n) / n_steps
-        obj = _t0_objective(time_counts, time_centers, min_time, max_time, t0)
+        while below < k_hi and time_centers[below] + center_half_width <= t0:
+            below += 1
+        while above < k_hi and time_centers[above] - center_half_width < t0:
+            above += 1
+        obj = four_hw2 * ((s2[below] - s2[k_lo]) + (r2[k_hi] - r2[above]))
+        for k in range(below, above):
+            delta_t = t0 - time_centers[k]
+            w1 = center_half_width + delta_t
+            w2 = center_half_width - delta_t
+            obj += (w1 * time_counts[k]) ** 2
+            obj += (w2 * (time_counts[k] - amplitude)) ** 2
         if obj < best_obj:
             best_obj = obj
             best_t0 = t0
     return best_t0
 
 
-@njit
+@njit(cache=True)
 def _find_tmax(time_counts, time_centers, tmax_initial, n_steps):
+    """
+    Scan n_steps candidate tmax values and return the one minimizing the squared
+    difference between the histogram and a step from the local amplitude down to 0.
+
+    The amplitude is the mean of the int(bins / 10) bins just below each candidate,
+    so it changes with tmax. Bins below tmax contribute
+    4 * hw^2 * (S2 - 2 * A * S1 + n * A^2) from the prefix sums of c and c^2, bins
+    above contribute (2 * c * hw)^2. The whole scan is O(bins + n_steps).
+    """
     min_time = tmax_initial - 75
     max_time = tmax_initial + 75
     delta_time = max_time - min_time
+    center_half_width = 0.5 * (time_centers[1] - time_centers[0])
+    four_hw2 = 4 * center_half_width**2
+    running_bins = int(len(time_counts) / 10)
+
+    k_lo, k_hi = _window_bins(time_centers, center_half_width, min_time, max_time)
+    s1, s2, _ = _prefix_sums(time_counts, 0.0)
+
+    # [k_lo, below) lies fully below tmax, [above, k_hi) fully above it
+    below = k_lo
+    above = k_lo
+    # first bin center >= tmax, i.e. np.searchsorted(time_centers, tmax)
+    idx = 0
     best_obj = 1e12
     best_tmax = tmax_initial
     for n in range(n_steps):
         tmax = min_time + delta_time * n / n_steps
-        obj = _tmax_objective(time_counts, time_centers, min_time, max_time, tmax)
+        while below < k_hi and time_centers[below] + center_half_width <= tmax:
+            below += 1
+        while above < k_hi and time_centers[above] - center_half_width < tmax:
+            above += 1
+        while idx < len(time_centers) and time_centers[idx] < tmax:
+            idx += 1
+        min_index = max(0, idx - running_bins)
+        if idx == min_index:
+            continue
+        amplitude = (s1[idx] - s1[min_index]) / (idx - min_index)
+
+        n_below = below - k_lo
+        sum_below = s1[below] - s1[k_lo]
+        sum2_below = s2[below] - s2[k_lo]
+        obj = four_hw2 * (
+            sum2_below
+            - 2 * amplitude * sum_below
+            + n_below * amplitude**2
+            + (s2[k_hi] - s2[above])
+        )
+        for k in range(below, above):
+            delta_t = tmax - time_centers[k]
+            w1 = center_half_width + delta_t
+            w2 = center_half_width - delta_t
+            obj += (w1 * (time_counts[k] - amplitude)) ** 2
+            obj += (w2 * time_counts[k]) ** 2
         if obj < best_obj:
             best_obj = obj
             best_tmax = tmax
     return best_tmax
 
 
-@njit
+@njit(cache=True)
+def _initial_edges(time_counts, time_centers):
+    """
+    Compiled getInitialT0 and getInitialTMax. Returns NaN for both when fewer than
+    two bins pass the threshold.
+    """
+    threshold = time_counts.max() / 10
+    first = -1
+    second = -1
+    last = -1
+    second_last = -1
+    for k in range(len(time_counts)):
+        if time_counts[k] > threshold:
+            if first < 0:
+                first = k
+            elif second < 0:
+                second = k
+            second_last = last
+            last = k
+    if second < 0:
+        return np.nan, np.nan
+    return time_centers[second], time_centers[second_last]
+
+
+@njit(cache=True, parallel=True)
+def _fit_edges_batch(time_counts, time_centers, n_steps, fit_t0, fit_tmax):
+    n_rows = time_counts.shape[0]
+    t0 = np.full(n_rows, np.nan)
+    tmax = np.full(n_rows, np.nan)
+    for i in prange(n_rows):
+        t0_initial, tmax_initial = _initial_edges(time_counts[i], time_centers)
+        if np.isnan(t0_initial):
+            continue
+        if fit_t0:
+            t0[i] = _find_t0(time_counts[i], time_centers, t0_initial, n_steps)
+        if fit_tmax:
+            tmax[i] = _find_tmax(time_counts[i], time_centers, tmax_initial, n_steps)
+    return t0, tmax
+
+
+@njit(cache=True)
 def _gaussian(adc_centers, A, mu, sigma):
     return A * np.exp(-0.5 * ((adc_centers - mu) / sigma) ** 2)
 
 
-@njit
-def _adc_objective(params, adc_counts, adc_centers):
+@njit(cache=True)
+def _adc_initial_params(adc_counts, adc_centers):
+    """
+    Amplitude from the average of the 5% largest bins, mean and spread from the
+    moments of the histogram. NaN for an empty histogram.
+    """
+    params = np.full(3, np.nan)
+    total = 0.0
+    weighted = 0.0
+    for k in range(len(adc_counts)):
+        total += adc_counts[k]
+        weighted += adc_counts[k] * adc_centers[k]
+    if total <= 0:
+        return params
+    mean = weighted / total
+    variance = 0.0
+    for k in range(len(adc_counts)):
+        variance += adc_counts[k] * (adc_centers[k] - mean) ** 2
+    bins_to_avg = max(1, int(len(adc_counts) / 20))
+    largest_counts = np.sort(adc_counts)[::-1][:bins_to_avg]
+    params[0] = np.sum(largest_counts) / bins_to_avg
+    params[1] = mean
+    params[2] = np.sqrt(variance / total)
+    return params
+
+
+@njit(cache=True)
+def _normal_equations(adc_counts, adc_centers, params):
+    """
+    Poisson weighted chi2 of the Gaussian together with J^T W J and J^T W r, using
+    the analytic Jacobian with respect to (A, mu, sigma).
+    """
     A, mu, sigma = params
-    y_fit = _gaussian(adc_centers, A, mu, sigma)
-    return np.sum((adc_counts - y_fit) ** 2)
-
-
-@njit
-def _gradient(params, adc_counts, adc_centers, eps=1e-5):
-    grad = np.zeros_like(params)
-    for i in range(len(params)):
-        params_eps = params.copy()
-        params_eps[i] += eps
-        grad[i] = (
-            _adc_objective(params_eps, adc_counts, adc_centers)
-            - _adc_objective(params, adc_counts, adc_centers)
-        ) / eps
-    return grad
-
-
-@njit
-def _adc_fit(
-    adc_counts, adc_centers, initial_params, lr=1e-4, max_iter=10000, tol=1e-6
-):
+    jtj = np.zeros((3, 3))
+    jtr = np.zeros(3)
+    jac = np.empty(3)
+    chi2 = 0.0
+    for k in range(len(adc_counts)):
+        z = (adc_centers[k] - mu) / sigma
+        e = np.exp(-0.5 * z * z)
+        residual = adc_counts[k] - A * e
+        weight = 1.0 / max(adc_counts[k], 1.0)
+        jac[0] = e
+        jac[1] = A * e * z / sigma
+        jac[2] = A * e * z * z / sigma
+        chi2 += weight * residual * residual
+        for i in range(3):
+            jtr[i] += weight * jac[i] * residual
+            for j in range(3):
+                jtj[i, j] += weight * jac[i] * jac[j]
+    return chi2, jtj, jtr
+
+
+@njit(cache=True)
+def _adc_chi2(adc_counts, adc_centers, params):
+    chi2 = 0.0
+    y_fit = _gaussian(adc_centers, params[0], params[1], params[2])
+    for k in range(len(adc_counts)):
+        chi2 += (adc_counts[k] - y_fit[k]) ** 2 / max(adc_counts[k], 1.0)
+    return chi2
+
+
+@njit(cache=True)
+def _adc_fit(adc_counts, adc_centers, initial_params, max_iter=100, tol=1e-7):
+    """
+    Levenberg-Marquardt fit of a Gaussian to a histogram with Poisson weights
+    1 / max(count, 1).
+
+    Returns the fitted (A, mu, sigma) and their uncertainties from the diagonal of
+    (J^T W J)^-1 at the minimum. Both are NaN if the fit cannot be started.
+    """
     params = initial_params.copy()
+    errors = np.full(3, np.nan)
+    if np.isnan(params).any() or params[2] <= 0:
+        return np.full(3, np.nan), errors
+
+    damping = 1e-3
+    chi2, jtj, jtr = _normal_equations(adc_counts, adc_centers, params)
     for _ in range(max_iter):
-        grad = _gradient(params, adc_centers, adc_counts)
-        params -= lr * grad
-        if np.linalg.norm(grad) < tol:
+        improved = False
+        while damping < 1e10:
+            lhs = jtj.copy()
+            for i in range(3):
+                lhs[i, i] += damping * jtj[i, i]
+            if np.linalg.det(lhs) == 0:
+                damping *= 10
+                continue
+            trial = params + np.linalg.solve(lhs, jtr)
+            trial_chi2 = _adc_chi2(adc_counts, adc_centers, trial)
+            if trial[2] != 0 and trial_chi2 < chi2:
+                improved = True
+                break
+            damping *= 10
+        if not improved:
+            break
+        converged = chi2 - trial_chi2 <= tol * chi2
+        params = trial
+        damping = max(damping / 10, 1e-12)
+        chi2, jtj, jtr = _normal_equations(adc_counts, adc_centers, params)
+        if converged:
             break
-    return params
-
 
-def _hist_params(counts, bin_centers):
-    total = np.sum(counts)
-    if total == 0:
-        return 0.0
-    mean = np.sum(bin_centers * counts) / total
-    variance = np.sum(counts * (bin_centers - mean) ** 2) / total
-    return mean, np.sqrt(variance)
+    params[2] = abs(params[2])
+    if np.linalg.det(jtj) != 0:
+        covariance = np.linalg.inv(jtj)
+        for i in range(3):
+            errors[i] = np.sqrt(covariance[i, i])
+    return params, errors
+
+
+@njit(cache=True, parallel=True)
+def _adc_fit_batch(adc_counts, adc_centers, max_iter, tol):
+    n_rows = adc_counts.shape[0]
+    params = np.full((n_rows, 3), np.nan)
+    errors = np.full((n_rows, 3), np.nan)
+    for i in prange(n_rows):
+        initial_params = _adc_initial_params(adc_counts[i], adc_centers)
+        params[i], errors[i] = _adc_fit(
+            adc_counts[i], adc_centers, initial_params, max_iter, tol
+        )
+    return params, errors
+
+
+def _bin_indices(values, bin_edges):
+    """
+    Bin index of every value for the given edges, following np.histogram: bins are
+    half open except the last, which includes the right edge. Values outside the
+    edges get -1.
+    """
+    n_bins = len(bin_edges) - 1
+    indices = np.searchsorted(bin_edges, values, side="right") - 1
+    indices[values == bin_edges[-1]] = n_bins - 1
+    indices[(indices < 0) | (indices >= n_bins)] = -1
+    return indices
 
 
 class TDCFitter:
+    @profiled("TDCFitter.fitT0")
     def fitT0(self, time_counts, time_centers, n_steps=100):
         t0_initial = getInitialT0(time_counts, time_centers)
         return _find_t0(time_counts, time_centers, t0_initial, n_steps)
 
+    @profiled("TDCFitter.fitTMax")
     def fitTMax(self, time_counts, time_centers, n_steps=100):
         tmax_initial = getInitialTMax(time_counts, time_centers)
         return _find_tmax(time_counts, time_centers, tmax_initial, n_steps)
 
-    def fitADC(self, adc_counts, adc_centers, lr=1e-4, max_iter=10000, tol=1e-7):
+    @profiled("TDCFitter.fitT0TMaxBatch")
+    def fitT0TMaxBatch(
+        self, time_counts, time_centers, n_steps=100, fit_t0=True, fit_tmax=True
+    ):
+        """
+        Fit t0 and tmax of every histogram in a stack in one parallel kernel.
+
+        Parameters:
+        -----------
+        time_counts : np.ndarray
+        Counts with the bins on the last axis, e.g. the (tdc, channel, bin) cube
+        from getHistoCube or its all-channel sum of shape (tdc, bin).
+
+        time_centers : np.ndarray
+        Bin centers shared by every histogram.
+
+        n_steps : int
+        Number of t0/tmax candidates scanned per histogram.
+
+        Returns:
+        --------
+        t0, tmax : np.ndarray
+        Arrays of shape time_counts.shape[:-1]. Histograms that are empty or too
+        sparse to seed the fit, and skipped fits, are NaN.
+        """
+        time_counts = np.asarray(time_counts)
+        shape = time_counts.shape[:-1]
+        rows = np.ascontiguousarray(time_counts.reshape(-1, time_counts.shape[-1]))
+        addCounts("TDCFitter.fitT0TMaxBatch", histograms=len(rows))
+        t0, tmax = _fit_edges_batch(
+            rows, np.asarray(time_centers), n_steps, fit_t0, fit_tmax
+        )
+        return t0.reshape(shape), tmax.reshape(shape)
+
+    @profiled("TDCFitter.fitRebinnedT0TMax")
+    def fitRebinnedT0TMax(self, fine_counts, fine_edges, binnings, n_steps=100):
+        """
+        Rebin fine histograms with every binning in turn and average the t0 and
+        tmax fits over the binnings.
+
+        Parameters:
+        -----------
+        fine_counts : np.ndarray
+        Counts with the fine bins on the last axis, e.g. a getHistoCube cube.
+
+        fine_edges : np.ndarray
+        Bin edges used to fill fine_counts.
+
+        binnings : list
+        Bin edges of every rebinning, see rebinHisto.
+
+        n_steps : int
+        Number of t0/tmax candidates scanned per fit.
+
+        Returns:
+        --------
+        t0, tmax : np.ndarray
+        Arrays of shape fine_counts.shape[:-1]. NaN where any of the fits is NaN.
+        """
+        sums = 0
+        for time_binning in binnings:
+            counts, bin_centers = self.rebinHisto(fine_counts, fine_edges, time_binning)
+            sums = sums + np.stack(
+                self.fitT0TMaxBatch(counts, bin_centers, n_steps=n_steps)
+            )
+        return tuple(sums / len(binnings))
+
+    @profiled("TDCFitter.bootstrapT0TMax")
+    def bootstrapT0TMax(
+        self,
+        time_counts,
+        time_centers,
+        n_replicas,
+        n_steps=100,
+        method="poisson",
+        seed=None,
+        max_chunk_bytes=2**27,
+    ):
+        """
+        Estimate the t0 and tmax uncertainties of histograms by resampling their
+        counts instead of the hits.
+
+        Every histogram is resampled n_replicas times, either bin by bin from a
+        Poisson distribution or as a multinomial draw with the same total, and
+        all replicas of a chunk of histograms are fitted together by one
+        fitT0TMaxBatch call on the binning of time_counts. The uncertainty is the
+        standard deviation of the replicas, so a bootstrap costs n_replicas
+        single fits, about twice a fitRebinnedT0TMax over 100 binnings at 200
+        replicas.
+
+        Parameters:
+        -----------
+        time_counts, time_centers, n_steps :
+        As for fitT0TMaxBatch.
+
+        n_replicas : int
+        Number of resampled histograms per input histogram.
+
+        method : str
+        "poisson" or "multinomial".
+
+        seed : int
+        Seed of the resampling, for reproducible uncertainties.
+
+        max_chunk_bytes : int
+        Upper bound on the memory used by the replicas of one chunk.
+
+        Returns:
+        --------
+        t0_error, tmax_error : np.ndarray
+        Arrays of shape time_counts.shape[:-1]. NaN where fewer than two replicas
+        could be fitted.
+        """
+        if method not in ("poisson", "multinomial"):
+            msg = f"Unknown resampling method '{method}'"
+            raise ValueError(msg)
+        if n_replicas < 2:
+            msg = f"A bootstrap needs at least 2 replicas, got {n_replicas}"
+            raise ValueError(msg)
+        rng = np.random.default_rng(seed)
+        time_counts = np.asarray(time_counts)
+        shape = time_counts.shape[:-1]
+        n_bins = time_counts.shape[-1]
+        rows = time_counts.reshape(-1, n_bins)
+        n_rows = len(rows)
+        errors = np.full((2, n_rows), np.nan)
+
+        rows_per_chunk = max(1, max_chunk_bytes // (8 * n_replicas * n_bins))
+        for start in range(0, n_rows, rows_per_chunk):
+            chunk = rows[start : start + rows_per_chunk]
+            if method == "poisson":
+                replicas = rng.poisson(chunk, size=(n_replicas, *chunk.shape))
+            else:
+                totals = np.rint(chunk.sum(axis=1)).astype(np.int64)
+                pvals = chunk / np.maximum(chunk.sum(axis=1), 1)[:, np.newaxis]
+                pvals[totals == 0] = 1 / n_bins
+                replicas = rng.multinomial(totals, pvals, size=(n_replicas, len(chunk)))
+            fits = self.fitT0TMaxBatch(replicas, time_centers, n_steps=n_steps)
+            for i, fit in enumerate(fits):
+                n_valid = np.count_nonzero(~np.isnan(fit), axis=0)
+                mean = np.nansum(fit, axis=0) / np.maximum(n_valid, 1)
+                variance = np.nansum((fit - mean) ** 2, axis=0)
+                variance /= np.maximum(n_valid - 1, 1)
+                errors[i, start : start + len(chunk)] = np.where(
+                    n_valid > 1, np.sqrt(variance), np.nan
+                )
+        return errors[0].reshape(shape), errors[1].reshape(shape)
+
+    def fitT0Batch(self, time_counts, time_centers, n_steps=100):
+        t0, _ = self.fitT0TMaxBatch(time_counts, time_centers, n_steps, fit_tmax=False)
+        return t0
+
+    def fitTMaxBatch(self, time_counts, time_centers, n_steps=100):
+        _, tmax = self.fitT0TMaxBatch(time_counts, time_centers, n_steps, fit_t0=False)
+        return tmax
+
+    @profiled("TDCFitter.fitADC")
+    def fitADC(self, adc_counts, adc_centers, max_iter=100, tol=1e-7):
         """
         Assume adc curve is normally distributed.
-        Set initial amplitude to the average of the 10% largest bins.
+        Set initial amplitude to the average of the 5% largest bins.
         Calculate mean and spread of histogram directly for initial params.
+        Refine them with a Levenberg-Marquardt fit using the analytic Jacobian.
+
+        Returns:
+        --------
+        params : np.ndarray
+        Fitted (amplitude, mean, sigma).
+
+        errors : np.ndarray
+        Uncertainties on (amplitude, mean, sigma).
         """
+        adc_counts = np.asarray(adc_counts, dtype=np.float64)
+        adc_centers = np.asarray(adc_centers, dtype=np.float64)
+        initial_params = _adc_initial_params(adc_counts, adc_centers)
+        return _adc_fit(adc_counts, adc_centers, initial_params, max_iter, tol)
 
-        sorted_indices = np.argsort(adc_counts)[::-1]
-        bins_to_avg = int(len(sorted_indices) / 20)
-        initial_amplitude = np.mean(adc_counts[sorted_indices[:bins_to_avg]])
-        initial_mean, initial_spread = _hist_params(adc_counts, adc_centers)
-        initial_params = np.array([initial_amplitude, initial_mean, initial_spread])
-        return _adc_fit(adc_counts, adc_centers, initial_params, lr, max_iter, tol)
+    @profiled("TDCFitter.fitADCBatch")
+    def fitADCBatch(self, adc_counts, adc_centers, max_iter=100, tol=1e-7):
+        """
+        fitADC for every histogram in a stack, e.g. the (tdc, channel, bin) cube
+        from getHistoCube, in one parallel kernel.
+
+        Returns:
+        --------
+        params, errors : np.ndarray
+        Arrays of shape adc_counts.shape[:-1] + (3,). Empty histograms are NaN.
+        """
+        adc_counts = np.asarray(adc_counts, dtype=np.float64)
+        shape = adc_counts.shape[:-1]
+        rows = np.ascontiguousarray(adc_counts.reshape(-1, adc_counts.shape[-1]))
+        params, errors = _adc_fit_batch(
+            rows, np.asarray(adc_centers, dtype=np.float64), max_iter, tol
+        )
+        return params.reshape((*shape, 3)), errors.reshape((*shape, 3))
 
     def getTDCInfo(self, events):
         tdc_ids = []
@@ -207,6 +584,7 @@ class TDCFitter:
 
         return tdc_ids, tdc_times, adc_times, tdc_channels
 
+    @profiled("TDCFitter.getHisto")
     def getHisto(
         self, tdc_id, tdc_ids, times, time_binning, tdc_channel=None, tdc_channels=None
     ):
@@ -226,3 +604,155 @@ class TDCFitter:
             return counts.astype(np.int32), bin_centers.astype(np.float32)
         msg = f"Empty Histogram for TDC ID: {tdc_id}, Channel: {tdc_channel}"
         raise ValueError(msg)
+
+    @profiled("TDCFitter.getHistoCube")
+    def getHistoCube(
+        self,
+        tdc_ids,
+        tdc_channels,
+        times,
+        time_binning,
+        n_tdcs=None,
+        n_channels=None,
+        slice_ids=None,
+        n_slices=None,
+    ):
+        """
+        Histogram every (tdc_id, channel) pair in a single pass over the hits.
+
+        Each hit is given the combined key (tdc_id * n_channels + channel) * n_bins
+        + bin and all keys are counted with one np.bincount. The per TDC histograms
+        summed over channels are counts.sum(axis=1).
+
+        Parameters:
+        -----------
+        tdc_ids, tdc_channels, times : np.ndarray
+        Per hit TDC ID, channel and value to histogram, as returned by getTDCInfo.
+
+        time_binning : np.ndarray
+        Bin edges, as passed to getHisto.
+
+        n_tdcs, n_channels : int
+        Size of the TDC and channel axes. Default to the largest ID present + 1.
+
+        slice_ids : np.ndarray
+        Optional per hit slice index (e.g. the time slice of the hit's event) in
+        [0, n_slices). Hits with a negative slice index are skipped. When given,
+        the slice becomes the leading axis of the cube.
+
+        n_slices : int
+        Size of the slice axis. Defaults to the largest slice index present + 1.
+
+        Returns:
+        --------
+        counts : np.ndarray
+        int32 array of shape (n_tdcs, n_channels, n_bins), or
+        (n_slices, n_tdcs, n_channels, n_bins) when slice_ids is given.
+
+        bin_centers : np.ndarray
+        float32 array of the n_bins bin centers.
+        """
+        bin_edges = np.asarray(time_binning)
+        n_bins = len(bin_edges) - 1
+        tdc_ids = np.asarray(tdc_ids, dtype=np.int64)
+        tdc_channels = np.asarray(tdc_channels, dtype=np.int64)
+        if n_tdcs is None:
+            n_tdcs = int(tdc_ids.max()) + 1 if len(tdc_ids) > 0 else 0
+        if n_channels is None:
+            n_channels = int(tdc_channels.max()) + 1 if len(tdc_channels) > 0 else 0
+
+        addCounts("TDCFitter.getHistoCube", hits=len(tdc_ids))
+        bins = _bin_indices(np.asarray(times), bin_edges)
+        valid = (bins >= 0) & (tdc_ids < n_tdcs) & (tdc_channels < n_channels)
+        shape = (n_tdcs, n_channels, n_bins)
+        keys = tdc_ids * n_channels + tdc_channels
+        if slice_ids is not None:
+            slice_ids = np.asarray(slice_ids, dtype=np.int64)
+            if n_slices is None:
+                n_slices = int(slice_ids.max()) + 1 if len(slice_ids) > 0 else 0
+            valid &= (slice_ids >= 0) & (slice_ids < n_slices)
+            keys += slice_ids * (n_tdcs * n_channels)
+            shape = (n_slices, *shape)
+        keys = keys[valid] * n_bins + bins[valid]
+        counts = np.bincount(keys, minlength=int(np.prod(shape)))
+        counts = counts.reshape(shape).astype(np.int32)
+        bin_centers = (bin_edges[:-1] + bin_edges[1:]) / 2
+        return counts, bin_centers.astype(np.float32)
+
+    @profiled("TDCFitter.rebinHisto")
+    def rebinHisto(self, fine_counts, fine_edges, time_binning):
+        """
+        Derive histograms with new bin edges from finely binned ones, without
+        touching the hits again.
+
+        The cumulative count is linearly interpolated inside the fine bin that
+        contains each new edge, so the result is exact when the new edges fall on
+        fine edges and otherwise assumes hits are uniform within a fine bin.
+
+        Parameters:
+        -----------
+        fine_counts : np.ndarray
+        Counts with the fine bins on the last axis, e.g. a getHistoCube cube.
+
+        fine_edges : np.ndarray
+        Bin edges used to fill fine_counts.
+
+        time_binning : np.ndarray
+        The new bin edges.
+
+        Returns:
+        --------
+        counts : np.ndarray
+        float64 counts of shape fine_counts.shape[:-1] + (len(time_binning) - 1,).
+
+        bin_centers : np.ndarray
+        float32 array of the new bin centers.
+        """
+        fine_counts = np.asarray(fine_counts)
+        fine_edges = np.asarray(fine_edges, dtype=np.float64)
+        bin_edges = np.asarray(time_binning, dtype=np.float64)
+        n_fine = fine_counts.shape[-1]
+
+        cumulative = np.zeros((*fine_counts.shape[:-1], n_fine + 1))
+        np.cumsum(fine_counts, axis=-1, out=cumulative[..., 1:])
+        # position of every new edge in units of fine bins
+        position = np.interp(bin_edges, fine_edges, np.arange(n_fine + 1))
+        lower = np.minimum(np.floor(position).astype(np.int64), n_fine - 1)
+        fraction = position - lower
+        edge_cumulative = cumulative[..., lower] + fraction * fine_counts[..., lower]
+        counts = np.diff(edge_cumulative, axis=-1)
+        bin_centers = (bin_edges[:-1] + bin_edges[1:]) / 2
+        return counts, bin_centers.astype(np.float32)
+
+
+def warmup():
+    """
+    Compile (or load from the on-disk cache) the fitting kernels for the dtypes
+    produced by getHisto, so the first real fit in a worker does not pay the
+    Numba compilation cost.
+    """
+    time_edges = np.linspace(0, 1000, 201)
+    time_centers = ((time_edges[:-1] + time_edges[1:]) / 2).astype(np.float32)
+    time_counts = np.where((time_centers > 100) & (time_centers < 500), 100, 1).astype(
+        np.int32
+    )
+    adc_centers = np.linspace(3, 297, 50).astype(np.float32)
+    adc_counts = (100 * np.exp(-0.5 * ((adc_centers - 150) / 25) ** 2)).astype(np.int32)
+
+    fitter = TDCFitter()
+    fitter.fitT0(time_counts, time_centers, n_steps=10)
+    fitter.fitTMax(time_counts, time_centers, n_steps=10)
+    fitter.fitADC(adc_counts, adc_centers, max_iter=1)
+    fitter.fitADCBatch(adc_counts[np.newaxis], adc_centers, max_iter=1)
+    fitter.fitT0TMaxBatch(time_counts[np.newaxis], time_centers, n_steps=10)
+    # rebinned histograms are float64, their replicas int64
+    fitter.fitRebinnedT0TMax(
+        time_counts[np.newaxis], time_edges, [time_edges], n_steps=10
+    )
+    fitter.bootstrapT0TMax(
+        time_counts[np.newaxis].astype(np.float64),
+        time_centers,
+        n_replicas=2,
+        n_steps=10,
+        seed=0,
+    )
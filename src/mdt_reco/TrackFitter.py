@@ -1,15 +1,17 @@
 import numpy as np
-from numba import njit
+from numba import njit, prange
 
+from .Profiling import addCounts, profiled
 
-@njit
+
+@njit(cache=True)
 def _compute_d_opt(x, y, theta):
     cos_t = np.cos(theta)
     sin_t = np.sin(theta)
     return np.mean(x * cos_t + y * sin_t)
 
 
-@njit
+@njit(cache=True)
 def _objective(theta, x, y, r):
     cos_t = np.cos(theta)
     sin_t = np.sin(theta)
@@ -30,7 +32,7 @@ def _objective(theta, x, y, r):
     return err_sum
 
 
-@njit
+@njit(cache=True)
 def _find_best_theta(x, y, r, n_steps=100):
     best_obj = 1e12
     best_theta = 0.0
@@ -43,7 +45,7 @@ def _find_best_theta(x, y, r, n_steps=100):
     return best_theta
 
 
-@njit
+@njit(cache=True)
 def _line_from_normal(theta, d):
     tolerance = 1e-5
     if np.abs(np.sin(theta)) < tolerance:
@@ -53,10 +55,72 @@ def _line_from_normal(theta, d):
     return m, b
 
 
+@njit(cache=True, parallel=True)
+def _fit_cosmic_batch(x, y, r, event_offsets, n_steps):
+    n_events = len(event_offsets) - 1
+    theta = np.full(n_events, np.nan, dtype=np.float32)
+    d = np.full(n_events, np.nan, dtype=np.float32)
+    for i in prange(n_events):
+        start = event_offsets[i]
+        stop = event_offsets[i + 1]
+        if stop == start:
+            continue
+        best_theta = _find_best_theta(
+            x[start:stop], y[start:stop], r[start:stop], n_steps
+        )
+        theta[i] = best_theta
+        d[i] = _compute_d_opt(x[start:stop], y[start:stop], best_theta)
+    return theta, d
+
+
 class TrackFitter:
+    @profiled("TrackFitter.fitCosmic")
     def fitCosmic(self, x, y, r, n_steps=100, normal_form=True):
         theta = _find_best_theta(x, y, r, n_steps)
         d = _compute_d_opt(x, y, theta)
         if normal_form:
             return np.float32(theta), np.float32(d)
         return _line_from_normal(theta, d)
+
+    @profiled("TrackFitter.fitCosmicBatch")
+    def fitCosmicBatch(self, x, y, r, event_offsets, n_steps=100):
+        """
+        fitCosmic for every event of a columnar batch in one parallel kernel.
+
+        Parameters:
+        -----------
+        x, y, r : np.ndarray
+        Per hit coordinates and drift radii of all events, concatenated.
+
+        event_offsets : np.ndarray
+        The hits of event i are [event_offsets[i], event_offsets[i + 1]).
+
+        n_steps : int
+        Number of theta candidates scanned per event.
+
+        Returns:
+        --------
+        theta, d : np.ndarray
+        float32 normal form track parameters per event, NaN for events without
+        hits.
+        """
+        addCounts(
+            "TrackFitter.fitCosmicBatch", events=len(event_offsets) - 1, hits=len(x)
+        )
+        return _fit_cosmic_batch(
+            np.asarray(x), np.asarray(y), np.asarray(r), event_offsets, n_steps
+        )
+
+
+def warmup():
+    """
+    Compile (or load from the on-disk cache) the track fitting kernels for the
+    float32 hit arrays carried by Event.
+    """
+    x = np.array([15.0, 45.0, 30.0], dtype=np.float32)
+    y = np.array([15.0, 15.0, 41.0], dtype=np.float32)
+    r = np.full_like(x, 15.0)
+    fitter = TrackFitter()
+    fitter.fitCosmic(x, y, r, n_steps=10)
+    fitter.fitCosmic(x, y, r, n_steps=10, normal_form=False)
+    fitter.fitCosmicBatch(x, y, r, np.array([0, len(x)]), n_steps=10)
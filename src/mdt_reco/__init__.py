@@ -1,10 +1,31 @@
+from .Calibration import TDCCalibration, fitTDCCalibration
 from .ConfigParser import ConfigParser
-from .Event import Event
+from .Event import (
+    Event,
+    batchToEvents,
+    concatBatches,
+    eventsToBatch,
+    selectEvents,
+    selectHits,
+)
 from .Gen import Generator
 from .Geometry import Chamber
-from .Signal import Signal
+from .Geometry import warmup as _warmup_geometry
+from .Histogram import HitHistogram
+from .Ingest import IngestServer, replay
+from .Online import OnlineMonitor
+from .Pipeline import Pipeline, main
+from .Profiling import Profiler
+from .RTCalibrator import RTCalibrator
+from .RTFunction import RTFunction
+from .RTFunction import warmup as _warmup_rt_function
+from .RunProcessor import RunProcessor, expandFiles
+from .Signal import EventFilter, EventFramer, Signal
+from .StageCache import StageCache
 from .TDCFitter import TDCFitter
+from .TDCFitter import warmup as _warmup_tdc_fitter
 from .TrackFitter import TrackFitter
+from .TrackFitter import warmup as _warmup_track_fitter
 
 configParser = ConfigParser
 geo = Chamber
@@ -13,3 +34,80 @@ gen = Generator
 trackFitter = TrackFitter
 signal = Signal
 tdcFitter = TDCFitter
+hitHistogram = HitHistogram
+tdcCalibration = TDCCalibration
+rtCalibrator = RTCalibrator
+rtFunction = RTFunction
+stageCache = StageCache
+pipeline = Pipeline
+profiler = Profiler
+eventFramer = EventFramer
+eventFilter = EventFilter
+onlineMonitor = OnlineMonitor
+ingestServer = IngestServer
+runProcessor = RunProcessor
+
+__all__ = [
+    "Chamber",
+    "ConfigParser",
+    "Event",
+    "EventFilter",
+    "EventFramer",
+    "Generator",
+    "HitHistogram",
+    "IngestServer",
+    "OnlineMonitor",
+    "Pipeline",
+    "Profiler",
+    "RTCalibrator",
+    "RTFunction",
+    "RunProcessor",
+    "Signal",
+    "StageCache",
+    "TDCCalibration",
+    "TDCFitter",
+    "TrackFitter",
+    "batchToEvents",
+    "concatBatches",
+    "configParser",
+    "event",
+    "eventFilter",
+    "eventFramer",
+    "eventsToBatch",
+    "expandFiles",
+    "fitTDCCalibration",
+    "gen",
+    "geo",
+    "hitHistogram",
+    "ingestServer",
+    "main",
+    "onlineMonitor",
+    "pipeline",
+    "profiler",
+    "replay",
+    "rtCalibrator",
+    "rtFunction",
+    "runProcessor",
+    "selectEvents",
+    "selectHits",
+    "signal",
+    "stageCache",
+    "tdcCalibration",
+    "tdcFitter",
+    "trackFitter",
+    "warmup",
+]
+
+
+def warmup():
+    """
+    Compile every Numba kernel in the package ahead of the first fit.
+
+    The kernels are built with cache=True, so after the first process on a machine
+    has compiled them this only loads the cached machine code from disk. Call it
+    from a worker pool initializer to move the cost out of the first job.
+    """
+    _warmup_tdc_fitter()
+    _warmup_track_fitter()
+    _warmup_rt_function()
+    _warmup_geometry()
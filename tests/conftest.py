@@ -0,0 +1,68 @@
+import os
+
+import numpy as np
+import pytest
+from scipy.special import erf
+
+import mdt_reco
+
+CONFIG_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../configs")
+
+
+def generateEvents(config, n_muons, seed):
+    """Events of n_muons simulated muons, the ones that cross the chamber."""
+    generator = mdt_reco.gen(config, seed=seed)
+    sim_events = generator.simEvents(n_muons)
+    track_params = generator.findTrajectories(B=0, sim_events=sim_events)
+    events = []
+    for A, C in zip(track_params["A"], track_params["C"], strict=True):
+        event = generator.createEvent(A, C)
+        if event is not None:
+            events.append(event)
+    return events
+
+
+def driftSpectrum(bin_centers, t0=70.0, tmax=800.0, rise=2.0, fall=15.0):
+    """
+    Shape of a drift time spectrum: a sharp rise at t0, a plateau falling to 40%
+    and a softer falling edge at tmax.
+    """
+    rising = 0.5 * (1 + erf((bin_centers - t0) / (rise * np.sqrt(2))))
+    falling = 0.5 * (1 - erf((bin_centers - tmax) / (fall * np.sqrt(2))))
+    plateau = 1 - 0.6 * np.clip((bin_centers - t0) / (tmax - t0), 0, 1)
+    return rising * falling * plateau
+
+
+@pytest.fixture(scope="session")
+def config_dir():
+    return CONFIG_DIR
+
+
+@pytest.fixture(scope="session")
+def config():
+    return mdt_reco.configParser(os.path.join(CONFIG_DIR, "ci_config.yaml"))
+
+
+@pytest.fixture(scope="session")
+def events(config):
+    return generateEvents(config, 2000, seed=1)
+
+
+@pytest.fixture(scope="session")
+def raw_file(config, events, tmp_path_factory):
+    file_path = str(tmp_path_factory.mktemp("raw") / "events.bin")
+    mdt_reco.signal(config).encodeEvents(events, file_path)
+    return file_path
+
+
+@pytest.fixture(scope="session")
+def fine_cube():
+    """
+    Poisson (6 tdc, 24 channel, 3200 bin) drift time histograms of 20000 hits
+    each, with their bin edges.
+    """
+    bin_edges = np.linspace(0, 1000, 3201)
+    spectrum = driftSpectrum((bin_edges[:-1] + bin_edges[1:]) / 2)
+    expected = 20000 * spectrum / spectrum.sum()
+    rng = np.random.default_rng(0)
+    return rng.poisson(np.broadcast_to(expected, (6, 24, len(expected)))), bin_edges
@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+
+import mdt_reco
+from mdt_reco.Geometry import Chamber
+
+
+@pytest.fixture
+def sliced_calibration(config):
+    """A calibration whose t0 drifts by 20 ns over 2000 events."""
+    chamber = Chamber(config)
+    calibration = mdt_reco.tdcCalibration()
+    n_tubes = len(chamber["x"])
+    calibration.setChannels(
+        chamber["csm_id"],
+        chamber["tdc_id"],
+        chamber["channel"],
+        np.full(n_tubes, 70.0),
+        np.full(n_tubes, 900.0),
+    )
+    t0_table = np.full((2, *calibration.t0.shape), np.nan)
+    t0_table[0, chamber["csm_id"], chamber["tdc_id"], chamber["channel"]] = 60.0
+    t0_table[1, chamber["csm_id"], chamber["tdc_id"], chamber["channel"]] = 80.0
+    calibration.setT0Table([0, 2000], t0_table)
+    return calibration
+
+
+def test_sliced_apply_needs_event_offset(sliced_calibration, events):
+    batch = mdt_reco.eventsToBatch(events[:10])
+    with pytest.raises(ValueError, match="event_offset"):
+        sliced_calibration.apply(batch)
+    with pytest.raises(ValueError, match="event_offset"):
+        sliced_calibration.applyEvents(events[:10])
+
+
+def test_chunks_with_event_offset_match_whole_run(sliced_calibration, events):
+    whole = sliced_calibration.apply(mdt_reco.eventsToBatch(events), event_offset=0)
+    drift_time = []
+    for start in range(0, len(events), 700):
+        chunk = mdt_reco.eventsToBatch(events[start : start + 700])
+        sliced_calibration.apply(chunk, event_offset=start)
+        drift_time.append(chunk["drift_time"])
+    np.testing.assert_array_equal(np.concatenate(drift_time), whole["drift_time"])
+    chunk_events = sliced_calibration.applyEvents(events[700:800], event_offset=700)
+    start = whole["event_offsets"][700]
+    np.testing.assert_array_equal(
+        chunk_events[0]["drift_time"],
+        whole["drift_time"][start : whole["event_offsets"][701]],
+    )
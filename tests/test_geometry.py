@@ -0,0 +1,157 @@
+import os
+
+import numpy as np
+import pytest
+
+import mdt_reco
+from mdt_reco.Geometry import Chamber
+
+# channel of the 24 tubes of a TDC and whether its bottom layer starts a half tube
+# further out, as in the original buildTDCType446 and buildTDCType436
+TDC_LAYOUTS = {
+    "446": ([5, 3, 4, 2, 0, 1, 11, 9, 10, 8, 6, 7], True),
+    "436": ([3, 1, 5, 0, 2, 4, 9, 7, 11, 6, 8, 10], False),
+}
+UPPER_CHANNELS = {
+    "446": [17, 15, 16, 14, 12, 13, 23, 21, 22, 20, 18, 19],
+    "436": [15, 13, 17, 12, 14, 16, 19, 21, 23, 18, 20, 22],
+}
+# fraction of the hits moved to random tubes in the clustering test
+NOISE_FRACTION = 0.2
+
+
+def baselineChamber(geometry):
+    """
+    The original build: every TDC is built tube by tube and concatenated onto its
+    multilayer, and every multilayer onto the chamber.
+    """
+    columns = ("x", "y", "csm_id", "tdc_id", "channel", "layer", "ML")
+    chamber = {key: np.array([]) for key in columns}
+    for multilayer_id, name in enumerate(geometry["multilayers"]):
+        config = geometry["multilayers"][name]
+        multilayer = {key: np.array([]) for key in columns}
+        lower_channels, shifted = TDC_LAYOUTS[config["tdcType"]]
+        x_shift = config["radius"] + config["tube_spacing"] / 2
+        y_spacing = 0.5 * 2 * x_shift * np.sqrt(3)
+        for k, active in enumerate(config["activeTDCs"]):
+            if not active:
+                continue
+            x = np.zeros(24)
+            for tube in range(6):
+                x[tube] = (2 * tube + (2 if shifted else 1)) * x_shift
+                x[tube + 6] = (2 * tube + (1 if shifted else 2)) * x_shift
+                x[tube + 12] = x[tube]
+                x[tube + 18] = x[tube + 6]
+            tdc = {
+                "x": x + k * x.max(),
+                "y": np.repeat(y_spacing * np.arange(4) + x_shift, 6),
+                "csm_id": np.full(24, config["CSM_ids"][k]),
+                "tdc_id": np.full(24, config["TDC_ids"][k]),
+                "channel": np.array(lower_channels + UPPER_CHANNELS[config["tdcType"]]),
+                "layer": np.repeat(np.arange(4), 6),
+                "ML": np.full(24, multilayer_id),
+            }
+            for key in columns:
+                multilayer[key] = np.concatenate((multilayer[key], tdc[key]))
+        if len(chamber["y"]) > 0:
+            multilayer["y"] += (
+                chamber["y"].max() + config["radius"] + geometry["multilayer_spacing"]
+            )
+        for key in columns:
+            chamber[key] = np.concatenate((chamber[key], multilayer[key]))
+    return chamber
+
+
+def bruteForceNeighbours(chamber, tolerance=0.05):
+    """Neighbours of every tube from the full distance matrix."""
+    xy = np.column_stack((chamber["x"], chamber["y"])).astype(np.float64)
+    distance = np.hypot(*(xy[:, np.newaxis] - xy[np.newaxis, :]).T)
+    np.fill_diagonal(distance, np.inf)
+    same_multilayer = chamber["ML"][:, np.newaxis] == chamber["ML"][np.newaxis, :]
+    neighbours = same_multilayer & (distance <= distance.min() * (1 + tolerance))
+    for ml in range(int(chamber["ML"].max())):
+        across = (chamber["ML"][:, np.newaxis] == ml) & (
+            chamber["ML"][np.newaxis, :] == ml + 1
+        )
+        if across.any():
+            gap = distance[across].min()
+            close = distance <= gap * (1 + tolerance)
+            neighbours |= close & (across | across.T)
+    return [set(np.flatnonzero(row)) for row in neighbours]
+
+
+def floodFillClusters(chamber, batch):
+    """Cluster labels of every hit by a flood fill over the neighbour sets."""
+    neighbours = bruteForceNeighbours(chamber)
+    tubes = chamber.getTubeIndex(batch["csm_id"], batch["tdc_id"], batch["channel"])
+    offsets = batch["event_offsets"]
+    labels = np.full(len(tubes), -1)
+    for event in range(len(offsets) - 1):
+        hits = range(offsets[event], offsets[event + 1])
+        n_clusters = 0
+        for first in hits:
+            if labels[first] >= 0 or tubes[first] < 0:
+                continue
+            labels[first] = n_clusters
+            stack = [first]
+            while stack:
+                hit = stack.pop()
+                for other in hits:
+                    if labels[other] < 0 and (
+                        tubes[other] == tubes[hit]
+                        or tubes[other] in neighbours[tubes[hit]]
+                    ):
+                        labels[other] = n_clusters
+                        stack.append(other)
+            n_clusters += 1
+    return labels
+
+
+@pytest.mark.parametrize("config_name", ["ci_config.yaml", "config.yaml"])
+def test_chamber_matches_baseline(config_dir, config_name):
+    config = mdt_reco.configParser(os.path.join(config_dir, config_name))
+    Chamber.clearCache()
+    chamber = Chamber(config)
+    expected = baselineChamber(config["Geometry"])
+    for key in ("x", "y"):
+        assert chamber[key].dtype == np.float32
+        np.testing.assert_allclose(chamber[key], expected[key].astype(np.float32))
+    for key in ("csm_id", "tdc_id", "channel", "layer", "ML"):
+        assert chamber[key].dtype == np.uint8
+        np.testing.assert_array_equal(chamber[key], expected[key])
+
+
+def test_chamber_cache_on_disk(config, tmp_path):
+    Chamber.clearCache()
+    built = Chamber(config, cache_dir=str(tmp_path))
+    Chamber.clearCache()
+    loaded = Chamber(config, cache_dir=str(tmp_path))
+    for key in ("x", "y", "csm_id", "tdc_id", "channel", "layer", "ML"):
+        np.testing.assert_array_equal(loaded[key], built[key])
+
+
+def test_adjacency_matches_distances(config):
+    chamber = Chamber(config)
+    expected = bruteForceNeighbours(chamber)
+    for tube, neighbours in enumerate(expected):
+        assert set(chamber.getNeighbours(tube)) == neighbours
+
+
+def test_clusters_match_flood_fill(config, events):
+    chamber = Chamber(config)
+    batch = mdt_reco.eventsToBatch(events[:300])
+    # move a fifth of the hits to random tubes, so events hold several clusters
+    rng = np.random.default_rng(2)
+    noisy = dict(batch, channel=batch["channel"].copy())
+    moved = rng.random(len(noisy["channel"])) < NOISE_FRACTION
+    noisy["channel"][moved] = rng.integers(0, 24, np.count_nonzero(moved))
+    labels, sizes = chamber.clusterHits(
+        noisy["csm_id"], noisy["tdc_id"], noisy["channel"], noisy["event_offsets"]
+    )
+    np.testing.assert_array_equal(labels, floodFillClusters(chamber, noisy))
+    for event in range(len(noisy["event_offsets"]) - 1):
+        start, stop = noisy["event_offsets"][event : event + 2]
+        event_labels = labels[start:stop]
+        np.testing.assert_array_equal(
+            sizes[start:stop], np.bincount(event_labels)[event_labels]
+        )
@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+
+import mdt_reco
+
+
+def test_fill_batch_matches_fill_events(config, events):
+    from_batch = mdt_reco.hitHistogram.fromConfig(config, "tdc_time")
+    from_batch.fillBatch(mdt_reco.eventsToBatch(events))
+    from_events = mdt_reco.hitHistogram.fromConfig(config, "tdc_time")
+    from_events.fillEvents(events, chunk_size=700)
+    np.testing.assert_array_equal(from_batch.counts, from_events.counts)
+    assert from_batch.n_events == from_events.n_events == len(events)
+    assert from_batch.csm_id == from_events.csm_id == 0
+
+
+def test_mixed_csms_are_rejected(config, events):
+    batch = mdt_reco.eventsToBatch(events[:100])
+    histogram = mdt_reco.hitHistogram.fromConfig(config, "tdc_time")
+    mixed = dict(batch, csm_id=batch["csm_id"].copy())
+    mixed["csm_id"][::2] = 1
+    with pytest.raises(ValueError, match="CSM"):
+        histogram.fillBatch(mixed)
+    assert histogram.entries == 0
+
+    histogram.fillBatch(batch)
+    other = dict(batch, csm_id=np.ones_like(batch["csm_id"]))
+    with pytest.raises(ValueError, match="CSM"):
+        histogram.fillBatch(other)
+    other_histogram = mdt_reco.hitHistogram.fromConfig(config, "tdc_time")
+    other_histogram.fillBatch(other)
+    with pytest.raises(ValueError, match="CSM"):
+        histogram + other_histogram
+
+
+def test_save_load_keeps_csm(config, events, tmp_path):
+    histogram = mdt_reco.hitHistogram.fromConfig(config, "adc_time")
+    histogram.fillEvents(events)
+    file_path = str(tmp_path / "adc.npz")
+    histogram.save(file_path)
+    loaded = mdt_reco.hitHistogram.load(file_path)
+    assert loaded.csm_id == 0
+    np.testing.assert_array_equal(loaded.counts, histogram.counts)
+    assert sum([loaded, histogram]).csm_id == 0
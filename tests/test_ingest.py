@@ -0,0 +1,39 @@
+import asyncio
+
+import numpy as np
+
+import mdt_reco
+
+
+async def ingest(config, raw_file, protocol, rate):
+    server = mdt_reco.ingestServer(
+        config, protocol=protocol, workers=1, keep_batches=True
+    )
+    async with server:
+        sent = await mdt_reco.replay(
+            config, raw_file, port=server.port, protocol=protocol, rate=rate
+        )
+        await asyncio.sleep(2 * server.max_delay)
+    return server, sent
+
+
+def test_udp_ingest_matches_decode(config, raw_file):
+    # 1024 words a datagram, as replay sends them
+    server, sent = asyncio.run(ingest(config, raw_file, "udp", rate=2e5))
+    signal = mdt_reco.signal(config)
+    expected = signal.decodeWords(signal.readWords(raw_file))
+    summary = server.summary()
+    assert summary["n_datagrams"] == -(-sent["words"] // 1024)
+    assert summary["dropped_datagrams"] == 0
+    assert summary["overflowed_datagrams"] in (0, None)
+    batch = server.batch()
+    for key in ("tdc_id", "channel", "tdc_time", "event_number"):
+        np.testing.assert_array_equal(batch[key], expected[key], err_msg=key)
+
+
+def test_tcp_ingest_matches_decode(config, raw_file):
+    server, sent = asyncio.run(ingest(config, raw_file, "tcp", rate=None))
+    signal = mdt_reco.signal(config)
+    expected = signal.decodeWords(signal.readWords(raw_file))
+    assert server.summary()["n_bytes"] == sent["bytes"]
+    np.testing.assert_array_equal(server.batch()["tdc_time"], expected["tdc_time"])
@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+import mdt_reco
+from mdt_reco.Geometry import Chamber
+
+
+@pytest.fixture(scope="module")
+def split_files(config, raw_file, tmp_path_factory):
+    """The words of raw_file cut at event Headers into three uneven files."""
+    directory = tmp_path_factory.mktemp("split")
+    signal = mdt_reco.signal(config)
+    words = signal.readWords(raw_file)
+    headers = np.flatnonzero((words >> np.uint64(29)) == int(signal._header_id, 2))
+    cuts = [0, headers[len(headers) // 7], headers[len(headers) // 2], len(words)]
+    files = []
+    for i in range(3):
+        file_path = str(directory / f"run_{i}.bin")
+        with open(file_path, "wb") as binary_file:
+            binary_file.write(signal.wordsToBytes(words[cuts[i] : cuts[i + 1]]))
+        files.append(file_path)
+    return files
+
+
+@pytest.fixture(scope="module")
+def calibration(config):
+    chamber = Chamber(config)
+    calibration = mdt_reco.tdcCalibration()
+    n_tubes = len(chamber["x"])
+    calibration.setChannels(
+        chamber["csm_id"],
+        chamber["tdc_id"],
+        chamber["channel"],
+        np.linspace(60, 80, n_tubes),
+        np.full(n_tubes, 900.0),
+    )
+    return calibration
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_split_files_match_single_file(
+    config, raw_file, split_files, calibration, workers
+):
+    single = mdt_reco.runProcessor(config, [raw_file], calibration=calibration).run()
+    split = mdt_reco.runProcessor(
+        config, split_files, workers=workers, calibration=calibration
+    ).run()
+    assert split["batch"].keys() == single["batch"].keys()
+    for key in single["batch"]:
+        np.testing.assert_array_equal(
+            split["batch"][key], single["batch"][key], err_msg=key
+        )
+    for key in ("tdc_hist", "adc_hist"):
+        np.testing.assert_array_equal(split[key].counts, single[key].counts)
+        assert split[key].n_events == single[key].n_events
+    events_per_file = np.diff(split["file_offsets"])
+    assert events_per_file.sum() == len(single["batch"]["event_offsets"]) - 1
+    assert (events_per_file > 0).all()
@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+
+import mdt_reco
+
+HIT_KEYS = ("csm_id", "tdc_id", "channel", "tdc_time", "adc_time", "x", "y")
+
+
+def assertSameHits(batch, expected):
+    np.testing.assert_array_equal(batch["event_offsets"], expected["event_offsets"])
+    for key in HIT_KEYS:
+        np.testing.assert_array_equal(batch[key], expected[key], err_msg=key)
+
+
+def test_decode_words_matches_decode_events(config, raw_file):
+    signal = mdt_reco.signal(config)
+    expected = mdt_reco.eventsToBatch(signal.decodeEvents(raw_file))
+    batch = signal.decodeWords(signal.readWords(raw_file))
+    assert len(batch["event_offsets"]) > 1
+    assertSameHits(batch, expected)
+    np.testing.assert_array_equal(batch["event_number"], expected["event_number"])
+
+
+def test_decoded_hits_match_generated(config, events, raw_file):
+    signal = mdt_reco.signal(config)
+    batch = signal.decodeWords(signal.readWords(raw_file))
+    generated = mdt_reco.eventsToBatch(
+        [
+            event
+            for event in events
+            if config["Reconstruction"]["MinHits"]
+            <= len(event["tdc_id"])
+            <= config["Reconstruction"]["MaxHits"]
+        ]
+    )
+    for key in ("csm_id", "tdc_id", "channel"):
+        np.testing.assert_array_equal(batch[key], generated[key])
+
+
+@pytest.mark.parametrize(
+    "event_filter",
+    [
+        mdt_reco.eventFilter(tdc_ids=[3, 4]),
+        mdt_reco.eventFilter(min_hits=8),
+        mdt_reco.eventFilter(trigger_window=(0, 5e4)),
+    ],
+)
+def test_filtered_decode_words_matches_decode_events(config, raw_file, event_filter):
+    signal = mdt_reco.signal(config)
+    expected = mdt_reco.eventsToBatch(signal.decodeEvents(raw_file, event_filter))
+    batch = signal.decodeWords(signal.readWords(raw_file), event_filter)
+    assertSameHits(batch, expected)
@@ -0,0 +1,147 @@
+import numpy as np
+import pytest
+
+import mdt_reco
+from mdt_reco.TDCFitter import TDCFitter, getInitialT0, getInitialTMax
+
+
+def baselineT0(time_counts, time_centers, n_steps):
+    """
+    The original t0 fit: every candidate is scored by summing the step residuals
+    over all bins of the scan window.
+    """
+    t0_initial = getInitialT0(time_counts, time_centers)
+    min_time = t0_initial - 20
+    max_time = t0_initial + 80
+    half_width = 0.5 * (time_centers[1] - time_centers[0])
+    amplitude = np.sort(time_counts)[::-1][: int(len(time_counts) / 10)].mean()
+    inside = (time_centers - half_width > min_time) & (
+        time_centers + half_width < max_time
+    )
+    counts = time_counts[inside]
+    centers = time_centers[inside]
+    candidates = min_time + ((max_time - min_time) * np.arange(n_steps)) / n_steps
+    delta_t = candidates[:, np.newaxis] - centers
+    below = centers + half_width <= candidates[:, np.newaxis]
+    above = centers - half_width >= candidates[:, np.newaxis]
+    objective = np.where(
+        below,
+        (2 * counts * half_width) ** 2,
+        np.where(
+            above,
+            4 * ((counts - amplitude) * half_width) ** 2,
+            ((half_width + delta_t) * counts) ** 2
+            + ((half_width - delta_t) * (counts - amplitude)) ** 2,
+        ),
+    ).sum(axis=1)
+    return candidates[np.argmin(objective)]
+
+
+def baselineTMax(time_counts, time_centers, n_steps):
+    """The original tmax fit, with the local amplitude of every candidate."""
+    tmax_initial = getInitialTMax(time_counts, time_centers)
+    min_time = tmax_initial - 75
+    max_time = tmax_initial + 75
+    half_width = 0.5 * (time_centers[1] - time_centers[0])
+    running_bins = int(len(time_counts) / 10)
+    inside = (time_centers - half_width > min_time) & (
+        time_centers + half_width < max_time
+    )
+    counts = time_counts[inside]
+    centers = time_centers[inside]
+    best_objective = np.inf
+    best_tmax = tmax_initial
+    for n in range(n_steps):
+        tmax = min_time + (max_time - min_time) * n / n_steps
+        idx = np.searchsorted(time_centers, tmax)
+        window = time_counts[max(0, idx - running_bins) : idx]
+        if len(window) == 0:
+            continue
+        amplitude = window.mean()
+        delta_t = tmax - centers
+        objective = np.where(
+            centers - half_width >= tmax,
+            (2 * counts * half_width) ** 2,
+            np.where(
+                centers + half_width <= tmax,
+                (2 * (counts - amplitude) * half_width) ** 2,
+                ((half_width + delta_t) * (counts - amplitude)) ** 2
+                + ((half_width - delta_t) * counts) ** 2,
+            ),
+        ).sum()
+        if objective < best_objective:
+            best_objective = objective
+            best_tmax = tmax
+    return best_tmax
+
+
+def test_histo_cube_matches_np_histogram(events):
+    batch = mdt_reco.eventsToBatch(events)
+    bin_edges = np.linspace(0, 1000, 201)
+    counts, _ = TDCFitter().getHistoCube(
+        batch["tdc_id"], batch["channel"], batch["tdc_time"], bin_edges, 32, 32
+    )
+    for tdc_id in np.unique(batch["tdc_id"]):
+        for channel in np.unique(batch["channel"]):
+            hits = (batch["tdc_id"] == tdc_id) & (batch["channel"] == channel)
+            expected, _ = np.histogram(batch["tdc_time"][hits], bin_edges)
+            np.testing.assert_array_equal(counts[tdc_id, channel], expected)
+
+
+@pytest.mark.parametrize("n_edges", [51, 76, 101])
+def test_edge_fits_match_baseline(fine_cube, n_edges):
+    counts, bin_edges = fine_cube
+    fitter = TDCFitter()
+    rebinned, bin_centers = fitter.rebinHisto(
+        counts[:2], bin_edges, np.linspace(0, 1000, n_edges)
+    )
+    t0, tmax = fitter.fitT0TMaxBatch(rebinned, bin_centers, n_steps=1000)
+    # the same candidate wins, up to the float32 rounding of the candidate times
+    for index in np.ndindex(t0.shape):
+        expected_t0 = baselineT0(rebinned[index], bin_centers, 1000)
+        expected_tmax = baselineTMax(rebinned[index], bin_centers, 1000)
+        assert t0[index] == pytest.approx(expected_t0, abs=1e-3)
+        assert tmax[index] == pytest.approx(expected_tmax, abs=1e-3)
+
+
+def test_single_fits_match_batch(fine_cube):
+    counts, bin_edges = fine_cube
+    fitter = TDCFitter()
+    rebinned, bin_centers = fitter.rebinHisto(
+        counts[0, :4], bin_edges, np.linspace(0, 1000, 51)
+    )
+    t0, tmax = fitter.fitT0TMaxBatch(rebinned, bin_centers, n_steps=1000)
+    for i, time_counts in enumerate(rebinned):
+        assert fitter.fitT0(time_counts, bin_centers, n_steps=1000) == t0[i]
+        assert fitter.fitTMax(time_counts, bin_centers, n_steps=1000) == tmax[i]
+
+
+def test_bootstrap_matches_fit_spread(fine_cube):
+    # every channel of the cube is an independent sample of the same spectrum, so
+    # the spread of the fits over channels is the uncertainty of one fit
+    counts, bin_edges = fine_cube
+    fitter = TDCFitter()
+    rebinned, bin_centers = fitter.rebinHisto(
+        counts, bin_edges, np.linspace(0, 1000, 201)
+    )
+    t0, tmax = fitter.fitT0TMaxBatch(rebinned, bin_centers, n_steps=1000)
+    t0_error, tmax_error = fitter.bootstrapT0TMax(
+        rebinned, bin_centers, n_replicas=100, n_steps=1000, seed=0
+    )
+    assert np.median(t0_error) == pytest.approx(t0.std(), rel=0.25)
+    assert np.median(tmax_error) == pytest.approx(tmax.std(), rel=0.25)
+
+
+def test_fixed_binning_matches_averaged_fit(fine_cube):
+    # the calibration bootstraps its tdc_bins fit, while t0 and tmax are averaged
+    # over 50-99 bin fits, so both estimators have to agree
+    counts, bin_edges = fine_cube
+    fitter = TDCFitter()
+    binnings = [np.linspace(0, 1000, 51 + int(50 * i / 20)) for i in range(20)]
+    t0, tmax = fitter.fitRebinnedT0TMax(counts, bin_edges, binnings, n_steps=1000)
+    rebinned, bin_centers = fitter.rebinHisto(
+        counts, bin_edges, np.linspace(0, 1000, 201)
+    )
+    fixed_t0, fixed_tmax = fitter.fitT0TMaxBatch(rebinned, bin_centers, n_steps=1000)
+    assert abs(np.mean(fixed_t0 - t0)) < t0.std()
+    assert abs(np.mean(fixed_tmax - tmax)) < tmax.std()